@@ -1,15 +1,66 @@
 # backend/analysis.py
 
-import re
 from loguru import logger
+from backend.records import ProductRecord
 
-def compare_product_data(old_data: dict, new_data: dict) -> dict:
+# Поля карточки в листинге, изменение которых требует загрузки страницы товара
+LISTING_FIELDS = ("price", "price_old", "discount")
+# Поля, которых нет (или не всегда есть) в листинге — без них нужна детальная загрузка.
+# Только поля, которые страница товара маркетплейса действительно отдаёт: у WB
+# остатков нет ни в листинге, ни (как правило) на странице товара, и проверка
+# по ним загружала бы каждый товар WB при каждом обновлении
+DETAIL_ONLY_FIELDS = {
+    "ozon": ("quantity",),
+    "wildberries": (),
+}
+# Для неизвестного маркетплейса
+DEFAULT_DETAIL_ONLY_FIELDS = ("quantity",)
+
+
+def _detail_only_fields(*records) -> tuple:
+    """Поля для проверки по маркетплейсу первой записи, где он указан."""
+    for record in records:
+        if record.marketplace:
+            name = record.marketplace.strip().lower()
+            if name in ("wb", "вб"):
+                name = "wildberries"
+            return DETAIL_ONLY_FIELDS.get(name, DEFAULT_DETAIL_ONLY_FIELDS)
+    return DEFAULT_DETAIL_ONLY_FIELDS
+
+
+def listing_needs_detail(listing, stored) -> bool:
+    """
+    Решает, нужна ли загрузка страницы товара для карточки из листинга.
+
+    Аргументы:
+      - listing: карточка из категории (ProductRecord или словарь скрапера)
+      - stored:  последнее сохранённое наблюдение по артикулу (запись, словарь или None)
+
+    Возвращает True, если товара ещё нет в БД, в БД не хватает полей, которые
+    отдаёт страница товара этого маркетплейса (остатков Ozon), или листинг
+    показывает изменение цены, скидки или бейджей.
+    """
+    if not stored:
+        return True
+    new, old = ProductRecord.coerce(listing), ProductRecord.coerce(stored)
+
+    for field in _detail_only_fields(new, old):
+        if getattr(new, field) is None and getattr(old, field) is None:
+            return True
+
+    for field in LISTING_FIELDS:
+        if getattr(new, field) != getattr(old, field):
+            return True
+    return set(new.promo_labels) != set(old.promo_labels)
+
+
+def compare_product_data(old_data, new_data) -> dict:
     """
     Сравнивает старые и новые данные о продукте.
 
     Аргументы:
-      - old_data: {'price': str, 'quantity': str, 'image_url': str}
-      - new_data: {'price': str, 'quantity': str, 'image_url': str}
+      - old_data: ProductRecord или {'price': str, 'quantity': str, 'image_url': str}
+      - new_data: ProductRecord или {'price': str, 'quantity': str, 'image_url': str}
 
     Возвращает:
       {
@@ -19,31 +70,20 @@ def compare_product_data(old_data: dict, new_data: dict) -> dict:
       }
     """
     result = {}
+    # Разбор цены и остатков — один раз, в ProductRecord
+    old, new = ProductRecord.coerce(old_data), ProductRecord.coerce(new_data)
 
-    # 1) Разбор цены, учитывая десятичный разделитель и пробелы
-    try:
-        def parse_price(s: str) -> float:
-            # Оставляем цифры, точки и запятые
-            num = re.sub(r"[^\d.,]", "", s or "")
-            # Заменяем запятую на точку и приводим к float
-            return float(num.replace(",", "."))
-        old_price = parse_price(old_data.get("price", "0"))
-        new_price = parse_price(new_data.get("price", "0"))
-        result["price_change"] = new_price - old_price
-    except Exception as e:
-        logger.warning(f"Не удалось вычислить изменение цены: {e}")
+    # 1) Изменение цены
+    if old.price is not None and new.price is not None:
+        result["price_change"] = new.price - old.price
+    else:
+        logger.warning("Не удалось вычислить изменение цены: нет цены в одной из записей")
         result["price_change"] = None
 
-    # 2) Разбор остатков — целые числа
-    try:
-        old_qty = int(re.sub(r"[^\d]", "", old_data.get("quantity", "") or "0"))
-        new_qty = int(re.sub(r"[^\d]", "", new_data.get("quantity", "") or "0"))
-        result["quantity_change"] = new_qty - old_qty
-    except Exception as e:
-        logger.warning(f"Не удалось вычислить изменение остатка: {e}")
-        result["quantity_change"] = None
+    # 2) Изменение остатков — пустой остаток считается нулём
+    result["quantity_change"] = (new.quantity or 0) - (old.quantity or 0)
 
     # 3) Проверка смены URL-а картинки
-    result["image_changed"] = old_data.get("image_url") != new_data.get("image_url")
+    result["image_changed"] = old.image_url != new.image_url
 
     return result
@@ -4,24 +4,32 @@ import tempfile
 import logging
 import configparser
 import urllib.parse
+import uuid
 from flask import Flask, request, jsonify, send_file, abort
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 from threading import Thread
 import threading
 from flask import jsonify
-from sqlalchemy import distinct
 import glob
-from datetime import datetime
-from io import StringIO
+from datetime import date, datetime, timezone
 from flask import Response
 
-from backend.config_parser import read_config
-from backend.database import init_db, add_product, get_products, get_product_history, SessionLocal, Product
-from backend.scraper import scrape_marketplace
+from backend.config_parser import read_config, API
+from backend.database import init_db, add_products, save_scraped_products, get_products, get_products_page, get_product_changes, get_retention_horizon, iter_products, get_product_history, get_products_history, get_dashboard_stats, get_categories, get_marketplaces, get_ingest_state, get_latest_observations, on_ingest
+from backend.records import ProductRecord
+from backend.rollups import get_rollups, SCOPES, PERIODS
+from backend.streaming import json_array, ndjson, csv_lines
+from backend.cache import LRUCache
+from backend.downsample import METHODS as DOWNSAMPLE_METHODS
+from backend.columnar import FORMATS, encode
+from backend.http_cache import conditional, cached, compress_response
+from backend.json_provider import FastJSONProvider
+from backend.scraper import scrape_marketplace, refresh_marketplace
 from backend.promo_detector import PromoDetector
 from backend.exporter import export_to_csv, export_to_pdf, export_product_pdf, CSV_RESULTS, PDF_RESULTS
 from backend.schedule_manager import update_schedule_interval, start_scheduler
+from backend.crawler import crawl_category
 from backend.utils.marketplace_urls import build_search_url, build_product_url
 
 # Логирование
@@ -31,48 +39,36 @@ logger = logging.getLogger(__name__)
 # Инициализация базы данных и планировщика
 init_db()
 
-def _background_scrape_and_save(marketplace, urls, categories, articles, limit):
-    logger.info(f"🟢 [Background] _run_start kicked off: marketplace={marketplace}, urls={urls}")
+def _background_scrape_and_save(marketplace, urls, categories, articles, limit, mode="full"):
+    logger.info(f"🟢 [Background] _run_start kicked off: marketplace={marketplace}, urls={urls}, mode={mode}")
     all_products = []
     for url in urls:
         logger.info(f"  → [Background] Scraping {url}")
         try:
-            prods = scrape_marketplace(
-                url,
-                category_filter=categories or None,
-                article_filter=articles   or None,
-                limit=limit,
-                marketplace=marketplace
-            )
+            if mode == "listing_first" and categories:
+                # Листинг + страницы товаров только для изменившихся артикулов
+                prods = refresh_marketplace(
+                    url,
+                    lookup=lambda arts: get_latest_observations(arts, marketplace),
+                    category_filter=categories or None,
+                    article_filter=articles   or None,
+                    limit=limit,
+                    marketplace=marketplace
+                )
+            else:
+                prods = scrape_marketplace(
+                    url,
+                    category_filter=categories or None,
+                    article_filter=articles   or None,
+                    limit=limit,
+                    marketplace=marketplace
+                )
             logger.info(f"    ← [Background] Got {len(prods)} products from {url}")
             all_products.extend(prods)
         except Exception as e:
             logger.error(f"    ✖ [Background] Ошибка при скрапинге {url}: {e}")
     # Сохраняем в БД
-    for p in all_products:
-        try:
-            promo_labels = p.get("promo_labels", []) or []
-            promotion_detected = bool(p.get("discount") or promo_labels)
-            detected_keywords = ";".join(promo_labels)
-
-            add_product({
-                "name":               p.get("name", ""),
-                "article":            p.get("article", ""),
-                "price":              str(p.get("price", "")),
-                "quantity":           str(p.get("quantity", "")),
-                "image_url":          p.get("image_url", ""),
-                "marketplace":        marketplace,
-                "category":           categories[0] if categories else "",
-                "promotion_detected": promotion_detected,
-                "detected_keywords":  detected_keywords,
-                "price_old":          p.get("price_old", ""),
-                "price_new":          p.get("price_new", ""),
-                "discount":           p.get("discount", ""),
-                "promo_labels":       ";".join(p.get("promo_labels", [])),
-                "parsed_at":          p.get("parsed_at"),
-            })
-        except Exception as e:
-            logger.error(f"Ошибка сохранения продукта {p.get('article')}: {e}")
+    save_scraped_products(all_products, marketplace, categories[0] if categories else None)
     logger.info("🟢 [Background] Scraping and saving done.")
 
 
@@ -127,9 +123,31 @@ def build_search_urls(marketplace: str, query_type: str, query_value: str) -> li
 
 
 app = Flask(__name__)
+# orjson, если установлен; даты — ISO 8601, Decimal — числа
+app.json = FastJSONProvider(app)
 # Разрешаем любые origin и все методы/заголовки
 CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
 
+# Кэш готовых ответов тяжёлых маршрутов (LRU с TTL, [API] response_cache*):
+# ключ включает версию данных, а запись в БД этим процессом сбрасывает его сразу
+_response_cache = LRUCache(
+    API["response_cache_entries"], API["response_cache_ttl"],
+    max_bytes=API["response_cache_max_bytes"], size=lambda entry: len(entry[0]),
+    enabled=API["response_cache"],
+)
+on_ingest(_response_cache.clear)
+
+
+@app.after_request
+def _compress(response):
+    # JSON от [API] compress_min_size байт сжимается br/gzip по Accept-Encoding
+    return compress_response(response, API["compress_min_size"])
+
+
+@app.route("/cache", methods=["GET"])
+def response_cache_stats():
+    """Состояние кэша ответов: enabled, entries, bytes, hits, misses, evictions, invalidations."""
+    return jsonify(_response_cache.stats())
 
 @app.route("/health", methods=["GET"])
 def health():
@@ -163,6 +181,8 @@ def start():
         qtype       = data.get("type")
         qval        = data.get("query")
         limit       = int(data.get("limit", limit))
+        # "full" — страница каждого товара, "listing_first" — только изменившиеся по листингу
+        mode        = data.get("mode", "full")
         if not all([marketplace, qtype, qval]):
             return jsonify({"error": "Некорректные параметры"}), 400
 
@@ -176,7 +196,7 @@ def start():
         # фоновый запуск
         threading.Thread(
             target=_background_scrape_and_save,
-            args=(marketplace, urls, categories, articles, limit),
+            args=(marketplace, urls, categories, articles, limit, mode),
             daemon=True
         ).start()
 
@@ -218,39 +238,52 @@ def start():
         except Exception as e:
             logger.error(f"Ошибка при скрапинге {url}: {e}")
 
+    # числовые поля разбираются один раз — дальше БД и экспорт работают с записями
+    records = [
+        ProductRecord.from_scraped(p, marketplace, categories[0] if categories else None)
+        for p in all_products
+    ]
     if save_to_db:
-        for p in all_products:
-            # Извлекаем флаги и ключевые слова прямо из level fields
-            promo_labels = p.get("promo_labels", []) or []
-            promotion_detected = bool(p.get("discount") or promo_labels)
-            detected_keywords = ";".join(promo_labels)
-
-            add_product({
-                "name":               p.get("name", ""),
-                "article":            p.get("article", ""),
-                "price":              str(p.get("price", "")),
-                "quantity":           str(p.get("quantity", "")),
-                "image_url":          p.get("image_url", ""),
-                "marketplace":        marketplace,
-                "category":           categories[0] if categories else "",
-                "promotion_detected": promotion_detected,
-                "detected_keywords":  detected_keywords,
-                "price_old":          p.get("price_old", ""),
-                "price_new":          p.get("price_new", ""),
-                "discount":           p.get("discount", ""),
-                "promo_labels":       detected_keywords,
-                "parsed_at":          p.get("parsed_at"),
-            })
+        save_scraped_products(records)
 
     # возвращаем отчёты
-    csv_file = export_to_csv(all_products)
-    pdf_file = export_to_pdf(all_products)
+    csv_file = export_to_csv(records)
+    pdf_file = export_to_pdf(records)
     return jsonify({
-        "products": all_products,
+        "products": [r.to_dict() for r in records],
         "csv_file": csv_file,
         "pdf_file": pdf_file
     })
 
+@app.route("/crawl", methods=["POST"])
+def crawl_route():
+    """
+    Запускает в фоне обход дерева категорий от указанного URL.
+    JSON: {url, marketplace, category, max_depth?, max_skus?, workers?, crawl_id?}
+    crawl_id позволяет продолжить прерванный обход.
+    """
+    data = request.get_json(silent=True) or {}
+    url         = data.get("url")
+    marketplace = data.get("marketplace")
+    category    = data.get("category")
+    if not all([url, marketplace, category]):
+        return jsonify({"error": "Некорректные параметры"}), 400
+
+    crawl_id = data.get("crawl_id") or uuid.uuid4().hex
+    kwargs = {
+        "max_depth": int(data.get("max_depth", 2)),
+        "max_skus":  int(data.get("max_skus", 1000)),
+        "workers":   int(data.get("workers", 2)),
+        "crawl_id":  crawl_id,
+    }
+    threading.Thread(
+        target=crawl_category,
+        args=(url, marketplace, category),
+        kwargs=kwargs,
+        daemon=True
+    ).start()
+    return jsonify({"crawl_id": crawl_id}), 202
+
 def _run_start(urls, categories, articles, limit, save_to_db, marketplace):
     """
     Собирает те же шаги, что раньше в start(): парсинг, анализ промо, BД и экспорт.
@@ -273,35 +306,18 @@ def _run_start(urls, categories, articles, limit, save_to_db, marketplace):
             logger.exception(f"❌ Ошибка при скрапинге {url}:")
 
     # 4) Сохранение в БД
+    records = [
+        ProductRecord.from_scraped(p, marketplace, categories[0] if categories else None)
+        for p in all_products
+    ]
     if save_to_db:
-        for p in all_products:
-            # Извлекаем флаги и ключевые слова прямо из level fields
-            promo_labels = p.get("promo_labels", []) or []
-            promotion_detected = bool(p.get("discount") or promo_labels)
-            detected_keywords = ";".join(promo_labels)
-
-            add_product({
-                "name":               p.get("name", ""),
-                "article":            p.get("article", ""),
-                "price":              str(p.get("price", "")),
-                "quantity":           str(p.get("quantity", "")),
-                "image_url":          p.get("image_url", ""),
-                "marketplace":        marketplace,
-                "category":           categories[0] if categories else "",
-                "promotion_detected": promotion_detected,
-                "detected_keywords":  detected_keywords,
-                "price_old":          p.get("price_old", ""),
-                "price_new":          p.get("price_new", ""),
-                "discount":           p.get("discount", ""),
-                "promo_labels":       detected_keywords,
-                "parsed_at":          p.get("parsed_at"),
-            })
+        save_scraped_products(records)
 
     # 5) Возвращаем ответ фронту
     logger.info(f"  → Exporting CSV/PDF")
     try:
-        export_to_csv(all_products)
-        export_to_pdf(all_products)
+        export_to_csv(records)
+        export_to_pdf(records)
     except Exception as e:
         logger.exception("❌ Ошибка экспорта отчётов:")
     logger.info("✅ [Background] _run_start finished")
@@ -320,8 +336,6 @@ def import_csv_route():
     save_path = os.path.join("csv_results", filename)
     csv_file.save(save_path)
 
-    inserted = 0
-    errors = []
     with open(save_path, newline="", encoding="utf-8") as f:
         reader = csv.DictReader(f)
         required = [
@@ -333,116 +347,237 @@ def import_csv_route():
         if missing:
             return jsonify({"error": f"Отсутствуют колонки: {missing}"}), 400
 
-        for idx, row in enumerate(reader, start=1):
-            try:
-                data = {
-                    "name": row["name"],
-                    "article": row["article"],
-                    "price": row["price"],
-                    "quantity": row["quantity"],
-                    "image_url": row.get("image_url", ""),
-                    "promotion_detected": row["promotion_detected"].lower() in ("true","1","yes"),
-                    "detected_keywords": row["detected_keywords"],
-                    "price_old": row["price_old"],
-                    "price_new": row["price_new"],
-                    "discount": row["discount"],
-                    "promo_labels": row["promo_labels"],
-                    "parsed_at": row["parsed_at"],
-                }
-                add_product(data)
-                inserted += 1
-            except Exception as e:
-                errors.append({"line": idx, "error": str(e)})
-
-    return jsonify({"inserted": inserted, "errors": errors})
+        result = add_products(ProductRecord.from_scraped(row) for row in reader)
+
+    errors = [{"line": e["index"] + 1, "error": e["error"]} for e in result["errors"]]
+    return jsonify({"inserted": result["inserted"], "rejected": result["rejected"], "errors": errors})
+
+# Параметры фильтров /products и их разбор из строки запроса
+_PRODUCT_FILTERS = {
+    "marketplace": str,
+    "category": str,
+    "article": str,
+    "promo": lambda v: {"true": True, "1": True, "false": False, "0": False}[v.lower()],
+    "price_min": float,
+    "price_max": float,
+    "date_from": date.fromisoformat,
+    "date_to": date.fromisoformat,
+}
+
+def _product_filters() -> dict:
+    """Фильтры /products из строки запроса; ValueError/KeyError — некорректное значение."""
+    return {
+        name: parse(request.args[name])
+        for name, parse in _PRODUCT_FILTERS.items() if name in request.args
+    }
 
 @app.route("/products", methods=["GET"])
+@conditional(get_ingest_state)
+@cached(_response_cache, API["compress_min_size"])
 def products_route():
-    prods = get_products()
-    output = []
-    for p in prods:
-        output.append({
-            "id": p.id,
-            "name": p.name,
-            "article": p.article,
-            "price": p.price,
-            "quantity": p.quantity,
-            "image_url": p.image_url,
-            "marketplace": p.marketplace,
-            "category":    p.category,
-            "promotion_detected": p.promotion_detected,
-            "detected_keywords": p.detected_keywords.split(";") if p.detected_keywords else [],
-            "price_old": p.price_old,
-            "price_new": p.price_new,
-            "discount": p.discount,
-            "promo_labels": p.promo_labels.split(";") if p.promo_labels else [],
-            "parsed_at": p.parsed_at.isoformat() if p.parsed_at else None,
-            "timestamp": p.timestamp.isoformat(),
-        })
-    return jsonify(output)
-
-# Список уникальных категорий из БД
-@app.route("/categories", methods=["GET"])
-def categories_route():
-    session = SessionLocal()
+    # view=history (по умолчанию) — все наблюдения, view=latest — только
+    # последнее состояние каждого товара (таблица product_latest)
+    view = request.args.get("view", "history")
+    if view not in ("history", "latest"):
+        return jsonify({"error": "view должен быть history или latest"}), 400
+    # format=columns — параллельные массивы по полям вместо списка словарей
+    fmt = request.args.get("format", "rows")
+    if fmt not in FORMATS:
+        return jsonify({"error": f"format: {', '.join(FORMATS)}"}), 400
+
+    # stream=json — JSON-массив, stream=ndjson (или Accept: application/x-ndjson) —
+    # по записи на строку; ответ формируется по мере чтения из БД, limit и cursor
+    # не применяются
+    stream = request.args.get("stream")
+    if stream is None and request.accept_mimetypes.best == "application/x-ndjson":
+        stream = "ndjson"
+    if stream is not None:
+        if stream not in ("json", "ndjson"):
+            return jsonify({"error": "stream должен быть json или ndjson"}), 400
+        try:
+            records = iter_products(view, as_dicts=True, **_product_filters())
+        except (ValueError, KeyError):
+            return jsonify({"error": "Некорректное значение параметра"}), 400
+        if stream == "ndjson":
+            return Response(ndjson(records, app.json.dumps), mimetype="application/x-ndjson")
+        return Response(json_array(records, app.json.dumps), mimetype="application/json")
+
+    # постраничная выдача включается параметром limit, cursor или любым фильтром;
+    # без них — весь список, как раньше (в порядке timestamp, id), но потоком,
+    # как stream=json: строки читаются кортежами колонок с курсора на сервере,
+    # даты сериализует JSON-провайдер приложения. format=columns собирается
+    # целиком — колонки строятся по всем записям сразу
+    if not ({"limit", "cursor"} | set(_PRODUCT_FILTERS)) & set(request.args):
+        records = iter_products(view, as_dicts=True)
+        if fmt == "rows":
+            return Response(json_array(records, app.json.dumps), mimetype="application/json")
+        return jsonify(encode(list(records), fmt))
+
     try:
-        # всё, что не пустая строка и не None
-        cats = (
-            session.query(distinct(Product.category))
-            .filter(Product.category != None, Product.category != "")
-            .order_by(Product.category)
-            .all()
+        limit = int(request.args.get("limit", API["default_page_size"]))
+        filters = _product_filters()
+    except (ValueError, KeyError):
+        return jsonify({"error": "Некорректное значение параметра"}), 400
+    if limit <= 0:
+        return jsonify({"error": "limit должен быть положительным"}), 400
+    try:
+        records, next_cursor = get_products_page(
+            min(limit, API["max_page_size"]), request.args.get("cursor"), view, as_dicts=True, **filters
         )
-        return jsonify([c[0] for c in cats])
-    finally:
-        session.close()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"items": encode(records, fmt), "next_cursor": next_cursor})
 
-@app.route("/marketplaces", methods=["GET"])
-def marketplaces_route():
-    session = SessionLocal()
+@app.route("/products/changes", methods=["GET"])
+@conditional(get_ingest_state)
+def product_changes_route():
+    """
+    Лента изменений для синхронизации локальной копии /products: наблюдения,
+    вставленные или продлённые после курсора since (без since — все), страницами
+    по limit. Ответ — {items, next_cursor, has_more, deleted_before}; next_cursor
+    передаётся в since следующего запроса, has_more=true — страница не последняя.
+    Удаления в ленту не попадают: deleted_before — граница очистки старых
+    данных, записи с timestamp и last_seen_at раньше неё клиент отбрасывает.
+    """
+    fmt = request.args.get("format", "rows")
+    if fmt not in FORMATS:
+        return jsonify({"error": f"format: {', '.join(FORMATS)}"}), 400
+    try:
+        limit = int(request.args.get("limit", API["max_page_size"]))
+    except ValueError:
+        return jsonify({"error": "limit должен быть целым числом"}), 400
+    if limit <= 0:
+        return jsonify({"error": "limit должен быть положительным"}), 400
     try:
-        mps = (
-            session.query(distinct(Product.marketplace))
-            .filter(Product.marketplace != None, Product.marketplace != "")
-            .order_by(Product.marketplace)
-            .all()
+        records, next_cursor, has_more = get_product_changes(
+            request.args.get("since"), min(limit, API["max_page_size"])
         )
-        return jsonify([m[0] for m in mps])
-    finally:
-        session.close()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    horizon = get_retention_horizon()
+    return jsonify({
+        "items": encode([p.to_dict() for p in records], fmt),
+        "next_cursor": next_cursor,
+        "has_more": has_more,
+        "deleted_before": horizon.isoformat() if horizon else None,
+    })
+
+@app.route("/categories", methods=["GET"])
+@conditional(get_ingest_state)
+@cached(_response_cache, API["compress_min_size"])
+def categories_route():
+    return jsonify(get_categories())
+
+@app.route("/marketplaces", methods=["GET"])
+@conditional(get_ingest_state)
+@cached(_response_cache, API["compress_min_size"])
+def marketplaces_route():
+    return jsonify(get_marketplaces())
+
+def _history_options(args) -> dict:
+    """
+    Параметры истории из строки запроса или JSON-тела: from/to — даты
+    YYYY-MM-DD, max_points — сколько точек оставить (по умолчанию
+    [API] history_max_points, 0 — все), method — lttb или minmax,
+    marketplace — только один маркетплейс; format (rows или columns) только
+    проверяется. ValueError — некорректное значение.
+    """
+    max_points = int(args.get("max_points", API["history_max_points"]))
+    method = args.get("method", "lttb")
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(method)
+    if args.get("format", "rows") not in FORMATS:
+        raise ValueError(args["format"])
+    return {
+        "date_from": date.fromisoformat(args["from"]) if args.get("from") else None,
+        "date_to": date.fromisoformat(args["to"]) if args.get("to") else None,
+        "max_points": max_points if max_points > 0 else None,
+        "method": method,
+        "marketplace": args.get("marketplace") or None,
+    }
+
+_HISTORY_OPTIONS_ERROR = (
+    "from и to — даты в формате YYYY-MM-DD, max_points — целое число, "
+    f"method: {', '.join(DOWNSAMPLE_METHODS)}, format: {', '.join(FORMATS)}"
+)
 
 @app.route("/products/history/<string:article>", methods=["GET"])
+@conditional(get_ingest_state)
 def product_history(article):
     try:
-        history = get_product_history(article)
+        options = _history_options(request.args)
+    except (ValueError, TypeError):
+        return jsonify({"error": _HISTORY_OPTIONS_ERROR}), 400
+    try:
+        history = get_product_history(article, **options)
         if not history:
             return jsonify({"error": "История не найдена"}), 404
-        return jsonify(history)
+        return jsonify(encode(history, request.args.get("format", "rows")))
     except Exception as e:
         logger.error(f"Error getting history for {article}: {e}")
         return jsonify({"error": "Внутренняя ошибка"}), 500
 
+@app.route("/products/history", methods=["POST"])
+def products_history_batch():
+    """
+    История нескольких артикулов за один запрос: тело
+    {"articles": [...], "from", "to", "max_points", "method", "marketplace", "format"};
+    ответ — {article: [точки]}, артикулы без истории отсутствуют.
+    """
+    body = request.get_json(silent=True)
+    articles = body.get("articles") if isinstance(body, dict) else None
+    if not isinstance(articles, list) or not all(isinstance(a, str) for a in articles):
+        return jsonify({"error": "articles — список артикулов"}), 400
+    if len(articles) > API["history_max_articles"]:
+        return jsonify({"error": f"Не более {API['history_max_articles']} артикулов за запрос"}), 400
+    try:
+        options = _history_options(body)
+    except (ValueError, TypeError):
+        return jsonify({"error": _HISTORY_OPTIONS_ERROR}), 400
+    try:
+        history = get_products_history(articles, **options)
+        return jsonify({article: encode(points, body.get("format", "rows")) for article, points in history.items()})
+    except Exception as e:
+        logger.error(f"Error getting history for {len(articles)} articles: {e}")
+        return jsonify({"error": "Внутренняя ошибка"}), 500
+
+
+@app.route("/rollups/<string:scope>/<string:key>", methods=["GET"])
+def rollups_route(scope, key):
+    """
+    Дневные (period=day) или недельные (period=week) агрегаты артикула
+    (scope=article) или категории (scope=category); from/to — даты YYYY-MM-DD,
+    marketplace — только один маркетплейс.
+    """
+    period = request.args.get("period", "day")
+    if scope not in SCOPES or period not in PERIODS:
+        return jsonify({"error": f"scope: {', '.join(SCOPES)}; period: {', '.join(PERIODS)}"}), 400
+    try:
+        date_from = date.fromisoformat(request.args["from"]) if request.args.get("from") else None
+        date_to = date.fromisoformat(request.args["to"]) if request.args.get("to") else None
+    except ValueError:
+        return jsonify({"error": "from и to — даты в формате YYYY-MM-DD"}), 400
+    return jsonify(get_rollups(scope, key, period, request.args.get("marketplace"), date_from, date_to))
+
 
 @app.route("/dashboard", methods=["GET"])
+@conditional(get_ingest_state)
+@cached(_response_cache, API["compress_min_size"])
 def dashboard_route():
-    products = get_products()
-    count = len(products)
-    last_compare = {}
-    if count >= 2:
-        sorted_prods = sorted(products, key=lambda p: p.timestamp)
-        old, new = sorted_prods[-2], sorted_prods[-1]
-        try:
-            price_diff = float(new.price) - float(old.price)
-        except Exception:
-            price_diff = None
-        try:
-            qty_diff = int(new.quantity) - int(old.quantity)
-        except Exception:
-            qty_diff = None
-        last_compare = {"price_diff": price_diff, "quantity_diff": qty_diff}
-    return jsonify({"products_count": count, "last_compare": last_compare})
+    # сводка считается в БД; готовый ответ хранится в кэше ответов по версии данных
+    return jsonify(get_dashboard_stats())
+
+# Состояние каталогов отчётов для ETag /reports: время изменения каталога
+# меняется при появлении и удалении файлов
+def _reports_state():
+    mtimes = [os.stat(d).st_mtime for d in ("csv_results", "pdf_results") if os.path.isdir(d)]
+    if not mtimes:
+        return 0, None
+    modified = max(mtimes)
+    return int(modified * 1000), datetime.fromtimestamp(modified, timezone.utc)
 
 @app.route("/reports", methods=["GET"])
+@conditional(_reports_state)
 def reports_route():
     reports = []
     csv_dir = "csv_results"
@@ -507,38 +642,13 @@ def download_report(kind):
 
 @app.route("/export/csv", methods=["GET"])
 def export_csv_from_db():
-    prods = get_products()  # ORM-модели Product
-    # Подготовим in-memory CSV
-    si = StringIO()
-    fieldnames = [
-        "id", "name", "article", "price", "quantity", "image_url",
-        "price_old", "price_new", "discount", "promo_labels",
-        "promotion_detected", "detected_keywords", "parsed_at", "timestamp"
-    ]
-    writer = csv.DictWriter(si, fieldnames=fieldnames)
-    writer.writeheader()
-    for p in prods:
-        writer.writerow({
-            "id": p.id,
-            "name": p.name,
-            "article": p.article,
-            "price": p.price,
-            "quantity": p.quantity,
-            "image_url": p.image_url,
-            "price_old": p.price_old,
-            "price_new": p.price_new,
-            "discount": p.discount,
-            "promo_labels": p.promo_labels or "",
-            "promotion_detected": p.promotion_detected,
-            "detected_keywords": p.detected_keywords or "",
-            "parsed_at": p.parsed_at.isoformat() if p.parsed_at else "",
-            "timestamp": p.timestamp.isoformat()
-        })
-    output = si.getvalue().encode("utf-8-sig")
-    si.close()
-
+    # CSV формируется по мере чтения из БД; фильтры — как у /products
+    try:
+        filters = _product_filters()
+    except (ValueError, KeyError):
+        return jsonify({"error": "Некорректное значение параметра"}), 400
     return Response(
-        output,
+        csv_lines(iter_products(**filters)),
         mimetype="text/csv; charset=utf-8",
         headers={
             "Content-Disposition": f"attachment;filename=products_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
@@ -0,0 +1,89 @@
+# backend/cache.py
+"""
+Потокобезопасный LRU-кэш в памяти процесса с временем жизни записей.
+
+Используется для готовых ответов тяжёлых маршрутов (/products, /dashboard,
+справочники; см. http_cache.cached): в пределах ttl секунд повторный запрос
+не доходит до БД. У каждого воркера gunicorn — свой кэш.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Не более max_entries значений общим размером не более max_bytes
+    (size(value) — размер значения; большие значения не кэшируются),
+    каждое живёт ttl секунд. При переполнении вытесняются давно не читанные.
+    enabled=False отключает кэш (для отладки): get всегда промах, set ничего не делает.
+    Счётчики hits, misses, evictions, invalidations — для мониторинга (stats).
+    """
+
+    def __init__(self, max_entries: int, ttl: float, max_bytes: int | None = None,
+                 size=len, clock=time.monotonic, enabled: bool = True):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._size = size
+        self._clock = clock
+        self._data: OrderedDict = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def _drop(self, key):
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    def get(self, key, default=None):
+        if not self.enabled:
+            return default
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and self._clock() >= entry[0]:
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        if not self.enabled or self.ttl <= 0:
+            return
+        size = self._size(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (self._clock() + self.ttl, value, size)
+            self._bytes += size
+            while len(self._data) > self.max_entries or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                self._drop(next(iter(self._data)))
+                self.evictions += 1
+
+    def clear(self):
+        """Сброс всех значений (после записи в БД)."""
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
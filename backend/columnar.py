@@ -0,0 +1,81 @@
+# backend/columnar.py
+"""
+Компактное колоночное представление списков записей (?format=columns).
+
+Вместо списка словарей, где имя каждого поля повторяется в каждой записи,
+отдаются параллельные массивы по полям:
+
+    {"format": "columns", "length": 3,
+     "columns": {"parsed_at": [1714557600, ...], "price": [10.0, ...],
+                 "image_url": [0, 0, 1]},
+     "dictionaries": {"image_url": ["https://...a.jpg", "https://...b.jpg"]}}
+
+- поля времени (TIME_FIELDS) — целые секунды Unix-эпохи (UTC);
+- строковое поле, в котором различных значений не больше половины записей,
+  кодируется словарём: в колонке — индексы в dictionaries[поле], None остаётся None.
+
+Однотипные значения подряд к тому же хорошо сжимаются gzip.
+"""
+from datetime import datetime, timezone
+
+FORMAT = "columns"
+# Значения параметра format: rows — обычный список словарей
+FORMATS = ("rows", FORMAT)
+
+TIME_FIELDS = ("parsed_at", "timestamp", "last_seen_at")
+
+
+def _epoch(value) -> int | None:
+    """Секунды эпохи из datetime или ISO-строки; наивное время считается UTC."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+def _dictionary(values: list) -> tuple[list, list] | None:
+    """(словарь, индексы) для повторяющихся строк или None, если выгоды нет."""
+    if not all(v is None or isinstance(v, str) for v in values):
+        return None
+    index: dict = {}
+    for v in values:
+        if v is not None and v not in index:
+            index[v] = len(index)
+            if len(index) * 2 > len(values):
+                return None
+    if not index:
+        return None
+    return list(index), [None if v is None else index[v] for v in values]
+
+
+def to_columns(rows: list[dict]) -> dict:
+    """Колоночное представление списка словарей с одинаковыми ключами."""
+    fields = list(rows[0]) if rows else []
+    columns, dictionaries = {}, {}
+    for field in fields:
+        values = [row.get(field) for row in rows]
+        if field in TIME_FIELDS:
+            columns[field] = [_epoch(v) for v in values]
+            continue
+        encoded = _dictionary(values)
+        if encoded is None:
+            columns[field] = values
+        else:
+            dictionaries[field], columns[field] = encoded
+    return {"format": FORMAT, "length": len(rows), "columns": columns, "dictionaries": dictionaries}
+
+
+def encode(rows: list[dict], fmt: str):
+    """rows как есть (format=rows) или в колоночном виде (format=columns)."""
+    return to_columns(rows) if fmt == FORMAT else rows
+
+
+def from_columns(payload: dict) -> list[dict]:
+    """Обратное преобразование (времена остаются секундами эпохи)."""
+    columns = dict(payload["columns"])
+    for field, values in payload.get("dictionaries", {}).items():
+        columns[field] = [None if i is None else values[i] for i in columns[field]]
+    return [dict(zip(columns, row)) for row in zip(*columns.values())] if columns else []
@@ -9,7 +9,16 @@ def read_config(path: str) -> dict:
         "SCRAPER":      {"user_agent": str, "proxy": str|None},
         "MARKETPLACES": {"marketplaces": [str, ...]},
         "SEARCH":       {"urls": [...], "categories": [...], "articles": [...]},
-        "EXPORT":       {"format": str, "save_to_db": bool}
+        "EXPORT":       {"format": str, "save_to_db": bool},
+        "SNAPSHOTS":    {"enabled": bool, "path": str, "retention_days": int},
+        "STORAGE":      {"dedupe_observations": bool, "partition_months_ahead": int,
+                         "detach_partitions": bool, "retention_batch_size": int,
+                         "retention_pause": float, "retention_time_budget": float},
+        "API":          {"default_page_size": int, "max_page_size": int,
+                         "history_max_points": int,
+                         "history_max_articles": int, "compress_min_size": int,
+                         "response_cache": bool, "response_cache_ttl": float,
+                         "response_cache_entries": int, "response_cache_max_bytes": int}
       }
     """
     if not os.path.isfile(path):
@@ -51,11 +60,47 @@ def read_config(path: str) -> dict:
     fmt = cp.get(export_section, "format", fallback="CSV")
     save_to_db = cp.getboolean(export_section, "save_to_db", fallback=False)
 
+    # --- SNAPSHOTS ---
+    snapshots_section = "SNAPSHOTS"
+    snapshots = {
+        "enabled": cp.getboolean(snapshots_section, "enabled", fallback=False),
+        "path": cp.get(snapshots_section, "path", fallback="snapshots") or "snapshots",
+        "retention_days": cp.getint(snapshots_section, "retention_days", fallback=30),
+    }
+
+    # --- STORAGE ---
+    storage_section = "STORAGE"
+    storage = {
+        "dedupe_observations": cp.getboolean(storage_section, "dedupe_observations", fallback=False),
+        "partition_months_ahead": cp.getint(storage_section, "partition_months_ahead", fallback=3),
+        "detach_partitions": cp.getboolean(storage_section, "detach_partitions", fallback=False),
+        "retention_batch_size": cp.getint(storage_section, "retention_batch_size", fallback=5000),
+        "retention_pause": cp.getfloat(storage_section, "retention_pause", fallback=0.5),
+        "retention_time_budget": cp.getfloat(storage_section, "retention_time_budget", fallback=600),
+    }
+
+    # --- API ---
+    api_section = "API"
+    api = {
+        "default_page_size": cp.getint(api_section, "default_page_size", fallback=100),
+        "max_page_size": cp.getint(api_section, "max_page_size", fallback=1000),
+        "history_max_points": cp.getint(api_section, "history_max_points", fallback=500),
+        "history_max_articles": cp.getint(api_section, "history_max_articles", fallback=100),
+        "compress_min_size": cp.getint(api_section, "compress_min_size", fallback=1024),
+        "response_cache": cp.getboolean(api_section, "response_cache", fallback=True),
+        "response_cache_ttl": cp.getfloat(api_section, "response_cache_ttl", fallback=30),
+        "response_cache_entries": cp.getint(api_section, "response_cache_entries", fallback=256),
+        "response_cache_max_bytes": cp.getint(api_section, "response_cache_max_bytes", fallback=64 * 1024 * 1024),
+    }
+
     return {
         "SCRAPER":      {"user_agent": user_agent, "proxy": proxy},
         "MARKETPLACES": {"marketplaces": marketplaces},
         "SEARCH":       {"urls": urls, "categories": categories, "articles": articles},
         "EXPORT":       {"format": fmt, "save_to_db": save_to_db},
+        "SNAPSHOTS":    snapshots,
+        "STORAGE":      storage,
+        "API":          api,
     }
 
 
@@ -71,3 +116,6 @@ SCRAPER = _config["SCRAPER"]
 MARKETPLACES = _config["MARKETPLACES"]["marketplaces"]
 SEARCH = _config["SEARCH"]
 EXPORT = _config["EXPORT"]
+SNAPSHOTS = _config["SNAPSHOTS"]
+STORAGE = _config["STORAGE"]
+API = _config["API"]
@@ -0,0 +1,294 @@
+# backend/crawler.py
+"""
+Обход дерева категорий маркетплейса.
+
+Краулер стартует с URL категории, на каждой странице-листинге собирает товары
+(через _scrape_ozon_category_by_url / _scrape_wb_category_by_url) и ссылки на
+подкатегории. Фронтир и visited-set хранятся в таблице crawl_frontier (ключ —
+канонический URL), поэтому память процесса не растёт с размером дерева,
+а прерванный обход продолжается с того же места по crawl_id.
+"""
+import time
+import uuid
+import logging
+import threading
+import urllib.parse
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from backend.database import SessionLocal, save_scraped_products
+from backend.models import CrawlFrontier
+from backend.scraper import MarketplaceScraper
+from backend.utils.marketplace_urls import canonicalize_url
+
+logger = logging.getLogger(__name__)
+
+
+class HostThrottle:
+    """
+    Ограничение частоты загрузок страниц: не чаще одной загрузки
+    в min_delay секунд на хост, общее для всех потоков краулера.
+    """
+
+    def __init__(self, min_delay: float = 10.0):
+        self.min_delay = min_delay
+        self._next_slot: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url: str):
+        host = urllib.parse.urlsplit(url).netloc.lower()
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.min_delay
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class CategoryCrawler:
+    """
+    Обход дерева категорий с ограничением глубины и числа товаров.
+
+    Пример:
+        crawler = CategoryCrawler("https://www.ozon.ru/category/hlebtsy-9359/",
+                                  marketplace="Ozon", category="хлебцы",
+                                  max_depth=2, max_skus=5000, workers=2)
+        stats = crawler.run()
+    """
+
+    def __init__(
+        self,
+        root_url: str,
+        marketplace: str,
+        category: str,
+        max_depth: int = 2,
+        max_skus: int = 1000,
+        workers: int = 2,
+        per_page_limit: int = 100,
+        min_delay: float = 10.0,
+        crawl_id: str | None = None,
+        on_products=None,
+    ):
+        self.root_url = root_url
+        self.marketplace = marketplace
+        self.category = category
+        self.max_depth = max_depth
+        self.max_skus = max_skus
+        self.workers = max(1, workers)
+        self.per_page_limit = per_page_limit
+        self.crawl_id = crawl_id or uuid.uuid4().hex
+        self.on_products = on_products or (
+            lambda prods: save_scraped_products(prods, marketplace, category)
+        )
+        self._throttle = HostThrottle(min_delay)
+        self._lock = threading.Lock()
+        self._skus = 0
+        self._pages = 0
+
+    # --- фронтир ---
+
+    def _enqueue(self, urls: list[str], depth: int) -> int:
+        """
+        Добавляет новые URL во фронтир; уже виденные (по каноническому URL) пропускаются.
+        Виденные ищутся одним запросом на всю пачку ссылок страницы.
+        """
+        keys: dict[str, str] = {}
+        for url in urls:
+            keys.setdefault(canonicalize_url(url), url)
+        if not keys:
+            return 0
+        added = 0
+        session = SessionLocal()
+        try:
+            seen = {
+                key for (key,) in
+                session.query(CrawlFrontier.url_key)
+                .filter(CrawlFrontier.crawl_id == self.crawl_id, CrawlFrontier.url_key.in_(keys))
+            }
+            for key, url in keys.items():
+                if key in seen:
+                    continue
+                try:
+                    with session.begin_nested():
+                        session.add(CrawlFrontier(
+                            crawl_id=self.crawl_id, url_key=key, url=url, depth=depth, status="pending"
+                        ))
+                    added += 1
+                except IntegrityError:
+                    # параллельный поток успел добавить тот же URL
+                    pass
+            session.commit()
+            return added
+        finally:
+            session.close()
+
+    def _claim(self):
+        """
+        Забирает из фронтира следующий URL (сначала ближайшие к корню).
+        Возвращает строку (id, url, depth) или None, если очередь пуста.
+        """
+        session = SessionLocal()
+        try:
+            while True:
+                row = (
+                    session.query(CrawlFrontier.id, CrawlFrontier.url, CrawlFrontier.depth)
+                    .filter(CrawlFrontier.crawl_id == self.crawl_id, CrawlFrontier.status == "pending")
+                    .order_by(CrawlFrontier.depth, CrawlFrontier.id)
+                    .first()
+                )
+                if row is None:
+                    return None
+                claimed = (
+                    session.query(CrawlFrontier)
+                    .filter(CrawlFrontier.id == row.id, CrawlFrontier.status == "pending")
+                    .update({"status": "in_progress"}, synchronize_session=False)
+                )
+                session.commit()
+                if claimed:
+                    return row
+        finally:
+            session.close()
+
+    def _finish(self, row_id: int, status: str, products_found: int = 0):
+        session = SessionLocal()
+        try:
+            session.query(CrawlFrontier).filter(CrawlFrontier.id == row_id).update(
+                {"status": status, "products_found": products_found, "finished_at": datetime.utcnow()},
+                synchronize_session=False,
+            )
+            session.commit()
+        finally:
+            session.close()
+
+    def _skus_found(self) -> int:
+        """Сколько товаров уже выдано этим обходом (сумма products_found по crawl_id)."""
+        session = SessionLocal()
+        try:
+            return (
+                session.query(func.coalesce(func.sum(CrawlFrontier.products_found), 0))
+                .filter(CrawlFrontier.crawl_id == self.crawl_id)
+                .scalar()
+            )
+        finally:
+            session.close()
+
+    def _reset_interrupted(self):
+        """После падения прошлого запуска возвращает незавершённые URL в очередь."""
+        session = SessionLocal()
+        try:
+            session.query(CrawlFrontier).filter(
+                CrawlFrontier.crawl_id == self.crawl_id, CrawlFrontier.status == "in_progress"
+            ).update({"status": "pending"}, synchronize_session=False)
+            session.commit()
+        finally:
+            session.close()
+
+    # --- обход ---
+
+    def _limit_reached(self) -> bool:
+        with self._lock:
+            return self._skus >= self.max_skus
+
+    def _take_quota(self, n: int) -> int:
+        """Резервирует до n товаров из лимита max_skus, возвращает сколько можно выдать."""
+        with self._lock:
+            allowed = max(0, min(n, self.max_skus - self._skus))
+            self._skus += allowed
+            self._pages += 1
+            return allowed
+
+    def _scrape_page(self, mp: MarketplaceScraper, url: str, discovered: list[str]) -> list[dict]:
+        self._throttle.wait(url)
+        if "ozon.ru" in url:
+            return mp._scrape_ozon_category_by_url(
+                url, self.per_page_limit, self.marketplace, [self.category], discovered=discovered
+            )
+        return mp._scrape_wb_category_by_url(
+            url, self.per_page_limit, self.marketplace, [self.category], discovered=discovered
+        )
+
+    def _worker(self):
+        mp = MarketplaceScraper()
+        try:
+            while not self._limit_reached():
+                row = self._claim()
+                if row is None:
+                    # очередь могла пополниться соседним потоком — ждём, пока кто-то работает
+                    if not self._busy():
+                        return
+                    time.sleep(1)
+                    continue
+                discovered: list[str] = []
+                try:
+                    prods = self._scrape_page(mp, row.url, discovered)
+                except Exception:
+                    logger.exception(f"[CRAWL] Ошибка обхода {row.url}")
+                    self._finish(row.id, "failed")
+                    continue
+
+                allowed = self._take_quota(len(prods))
+                if allowed:
+                    self.on_products(prods[:allowed])
+                if row.depth < self.max_depth:
+                    added = self._enqueue(discovered, row.depth + 1)
+                    logger.info(f"[CRAWL] {row.url}: товаров {len(prods)}, новых подкатегорий {added}")
+                self._finish(row.id, "done", allowed)
+        finally:
+            mp.close()
+
+    def _busy(self) -> bool:
+        session = SessionLocal()
+        try:
+            return session.query(
+                session.query(CrawlFrontier.id)
+                .filter(CrawlFrontier.crawl_id == self.crawl_id, CrawlFrontier.status == "in_progress")
+                .exists()
+            ).scalar()
+        finally:
+            session.close()
+
+    def stats(self) -> dict:
+        session = SessionLocal()
+        try:
+            rows = (
+                session.query(CrawlFrontier.status, func.count(CrawlFrontier.id))
+                .filter(CrawlFrontier.crawl_id == self.crawl_id)
+                .group_by(CrawlFrontier.status)
+                .all()
+            )
+            return {
+                "crawl_id": self.crawl_id,
+                "pages": self._pages,
+                "skus": self._skus,
+                "frontier": {status: count for status, count in rows},
+            }
+        finally:
+            session.close()
+
+    def run(self) -> dict:
+        logger.info(f"[CRAWL] {self.crawl_id}: старт с {self.root_url}, глубина {self.max_depth}, "
+                    f"лимит товаров {self.max_skus}, потоков {self.workers}")
+        self._reset_interrupted()
+        # продолжение обхода по crawl_id: лимит max_skus учитывает уже выданные товары
+        self._skus = self._skus_found()
+        self._enqueue([self.root_url], 0)
+
+        if self.workers == 1:
+            self._worker()
+        else:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                futures = [pool.submit(self._worker) for _ in range(self.workers)]
+                for f in futures:
+                    f.result()
+
+        stats = self.stats()
+        logger.info(f"[CRAWL] {self.crawl_id}: завершено, {stats}")
+        return stats
+
+
+def crawl_category(root_url: str, marketplace: str, category: str, **kwargs) -> dict:
+    """Обходит дерево категорий от root_url и сохраняет товары в БД. Возвращает статистику."""
+    return CategoryCrawler(root_url, marketplace, category, **kwargs).run()
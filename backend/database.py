@@ -1,9 +1,24 @@
+import io
 import os
-from datetime import datetime, timedelta
-from sqlalchemy import create_engine, asc
+import json
+import time
+import heapq
+import base64
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from itertools import groupby, islice
+from sqlalchemy import create_engine, asc, bindparam, cast, desc, func, insert, literal, update, and_, or_, tuple_, Integer, String
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import SQLAlchemyError
-from backend.models import Base, Product
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from backend.models import Base, Product, Observation, ProductLatest, RetentionRun, ServiceState
+from backend.migrations import run_migrations
+from backend.partitions import ensure_future_partitions, drop_old_partitions, is_partitioned
+from backend.records import ProductRecord, TRACKED_FIELDS, row_to_dict
+from backend.downsample import downsample
+
+logger = logging.getLogger(__name__)
 
 # Получение URL базы данных из переменных окружения
 DATABASE_URL = os.getenv("DATABASE_URL")
@@ -20,107 +35,989 @@ SessionLocal = sessionmaker(
     bind=engine
 )
 
-# Инициализация базы данных: создание таблиц
+# Инициализация базы данных: применение миграций схемы, создание таблиц
+# и секций observations на ближайшие месяцы (PostgreSQL)
+# Миграции запускаются повторно после create_all: часть из них (секционирование)
+# применяется к таблицам, которые на пустой базе создаёт только create_all
 def init_db():
+    run_migrations(engine)
     Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    ensure_future_partitions(engine, _storage_setting("partition_months_ahead", 3))
+
+
+# Поиск (или создание) товаров для пачки записей
+# Возвращает ({(marketplace, article): products.id},
+# {(marketplace, article): {"name", "image_url", "category"}} — значения товара
+# после записи); у существующих товаров обновляются название, изображение и
+# категория, если в записи они новые
+def _resolve_product_ids(session, records) -> tuple[dict, dict]:
+    latest = {r.key: r for r in records}
+    ids, current = {}, {}
+    for row in (
+        session.query(Product.id, Product.marketplace, Product.article,
+                      Product.name, Product.image_url, Product.category)
+        .filter(Product.article.in_({article for _, article in latest}))
+    ):
+        key = (row.marketplace, row.article)
+        if key in latest:
+            ids[key] = row.id
+            current[key] = row
 
+    products = {}
+    missing = [latest[key].to_product_row() for key in latest if key not in ids]
+    if missing:
+        try:
+            with session.begin_nested():
+                session.execute(insert(Product), missing)
+        except IntegrityError:
+            # часть товаров успела создать параллельная запись — добавляем по одному
+            for row in missing:
+                try:
+                    with session.begin_nested():
+                        session.execute(insert(Product), [row])
+                except IntegrityError:
+                    pass
+        for row in (
+            session.query(Product.id, Product.marketplace, Product.article)
+            .filter(Product.article.in_({row["article"] for row in missing}))
+        ):
+            key = (row.marketplace, row.article)
+            if key in latest:
+                ids[key] = row.id
+
+    for row in missing:
+        products[(row["marketplace"], row["article"])] = {
+            field: row[field] for field in ("name", "image_url", "category")
+        }
+    for key, row in current.items():
+        new = latest[key]
+        values = {
+            field: getattr(new, field)
+            for field in ("name", "image_url", "category")
+            if getattr(new, field) and getattr(new, field) != getattr(row, field)
+        }
+        products[key] = {
+            field: values.get(field, getattr(row, field)) for field in ("name", "image_url", "category")
+        }
+        if values:
+            session.execute(
+                update(Product).where(Product.id == row.id).values(updated_at=func.now(), **values)
+            )
+            session.execute(
+                update(ProductLatest.__table__).where(ProductLatest.product_id == row.id).values(**values)
+            )
+    return ids, products
 
-# Добавление нового продукта в базу данных
-# product_data должен содержать ключи:
-# name, article, price, quantity, image_url,
-# promotion_detected, detected_keywords,
-# price_old, price_new, discount, promo_labels,
-# parsed_at (строка ISO или datetime)
-def add_product(product_data: dict) -> Product:
+# Добавление нового наблюдения товара в базу данных
+# product_data — ProductRecord или словарь в формате скрапера/CSV
+# (name, article, price, quantity, image_url, marketplace, category,
+# promotion_detected, detected_keywords, price_old, price_new, discount,
+# promo_labels, parsed_at); словарь разбирается в ProductRecord
+# Возвращает сохранённую запись с id и timestamp наблюдения
+def add_product(product_data) -> ProductRecord:
+    record = ProductRecord.coerce(product_data)
     session = SessionLocal()
     try:
-        # Обработка parsed_at
-        parsed_at = None
-        if product_data.get("parsed_at"):
-            val = product_data["parsed_at"]
-            parsed_at = (
-                val if isinstance(val, datetime)
-                else datetime.fromisoformat(val)
-            )
+        seq = _bump_ingest_version(session)
+        ids, _ = _resolve_product_ids(session, [record])
+        obs = Observation(**record.to_observation_row(ids[record.key]), seq=seq)
+        session.add(obs)
+        session.flush()
+        _refresh_latest(session, [obs.product_id])
+        session.commit()
+        _notify_ingest()
+        session.refresh(obs)
+        return ProductRecord.from_db(obs.product, obs)
+    except SQLAlchemyError:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+# Значение для COPY ... FROM STDIN (текстовый формат PostgreSQL)
+def _copy_value(value) -> str:
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+# Вставка пачки строк в таблицу одним COPY (только PostgreSQL с драйвером psycopg2)
+# Возвращает False, если COPY недоступен и нужно использовать INSERT
+def _copy_rows(session, table: str, rows: list[dict]) -> bool:
+    if engine.dialect.name != "postgresql" or engine.dialect.driver != "psycopg2":
+        return False
+    columns = list(rows[0])
+    buf = io.StringIO()
+    for row in rows:
+        buf.write("\t".join(_copy_value(row[c]) for c in columns))
+        buf.write("\n")
+    buf.seek(0)
+    cursor = session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {table} ({', '.join(columns)}) FROM STDIN", buf
+        )
+    finally:
+        cursor.close()
+    return True
+
+# Значение из секции [STORAGE] конфига
+def _storage_setting(name: str, default=None):
+    from backend.config_parser import STORAGE
+    return STORAGE.get(name, default)
+
+# Время без часового пояса в UTC (SQLite отдаёт naive, PostgreSQL — aware)
+def _utc(value: datetime) -> datetime:
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+# Значения отслеживаемых полей наблюдения в сравнимом виде
+# (цены в БД хранятся с точностью до копейки)
+def _tracked_state(row) -> tuple:
+    state = []
+    for field in TRACKED_FIELDS:
+        value = row[field]
+        if isinstance(value, float):
+            value = round(value, 2)
+        elif field == "promotion_detected":
+            value = bool(value)
+        elif field == "promo_labels":
+            value = value or ""
+        state.append(value)
+    return tuple(state)
+
+# Отбрасывает строки, момент parsed_at которых уже покрыт наблюдением того же
+# товара (совпадает с parsed_at или лежит в отрезке [parsed_at, last_seen_at]):
+# повторная запись тех же данных, например при перепарсинге снимков
+# Возвращает строки для вставки
+def _skip_existing_rows(session, rows: list[dict]) -> list[dict]:
+    moments = [_utc(row["parsed_at"]) for row in rows if row["parsed_at"]]
+    if not moments:
+        return rows
+    seen_until = func.coalesce(Observation.last_seen_at, Observation.parsed_at)
+    covered = defaultdict(list)
+    for product_id, first, last in (
+        session.query(Observation.product_id, Observation.parsed_at, seen_until)
+        .filter(
+            Observation.product_id.in_({row["product_id"] for row in rows}),
+            Observation.parsed_at <= max(moments),
+            seen_until >= min(moments),
+        )
+    ):
+        covered[product_id].append((_utc(first), _utc(last)))
+    return [
+        row for row in rows
+        if not row["parsed_at"] or not any(
+            first <= _utc(row["parsed_at"]) <= last for first, last in covered[row["product_id"]]
+        )
+    ]
+
+# Запись только изменений: сравнивает новые наблюдения с последним
+# сохранённым по каждому товару (и с предыдущими в той же пачке)
+# Возвращает (строки для вставки, {id наблюдения: (id товара, новое last_seen_at)})
+def _dedupe_rows(session, rows: list[dict]) -> tuple[list[dict], dict]:
+    latest_ids = (
+        session.query(func.max(Observation.id))
+        .filter(Observation.product_id.in_({row["product_id"] for row in rows}))
+        .group_by(Observation.product_id)
+    )
+    current = {}
+    for obs in (
+        session.query(Observation.id, Observation.product_id, Observation.parsed_at,
+                      Observation.timestamp, Observation.last_seen_at,
+                      *(getattr(Observation, field) for field in TRACKED_FIELDS))
+        .filter(Observation.id.in_(latest_ids))
+    ):
+        current[obs.product_id] = {
+            "id": obs.id,
+            "state": _tracked_state(obs._mapping),
+            "seen": _utc(obs.last_seen_at or obs.parsed_at or obs.timestamp),
+        }
+
+    now = datetime.utcnow()
+    new_rows, extend = [], {}
+    for row in rows:
+        seen = row["parsed_at"] or now
+        state = _tracked_state(row)
+        cur = current.get(row["product_id"])
+        if cur and cur["state"] == state and _utc(seen) >= cur["seen"]:
+            if cur["id"] is None:
+                cur["row"]["last_seen_at"] = seen
+            else:
+                extend[cur["id"]] = (row["product_id"], seen)
+            cur["seen"] = _utc(seen)
+            continue
+        new_rows.append(row)
+        # более старое наблюдение (например, перепарсинг снимков) не становится текущим
+        if cur is None or _utc(seen) >= cur["seen"]:
+            current[row["product_id"]] = {"id": None, "row": row, "state": state, "seen": _utc(seen)}
+    return new_rows, extend
+
+# Колонки product_latest и их источники в products/observations
+_LATEST_COLUMNS = {
+    "marketplace": Product.marketplace,
+    "article": Product.article,
+    "product_id": Product.id,
+    "observation_id": Observation.id,
+    "name": Product.name,
+    "image_url": Product.image_url,
+    "category": Product.category,
+    **{
+        name: getattr(Observation, name)
+        for name in (
+            "price", "quantity", "price_old", "price_new", "discount", "promotion_detected",
+            "detected_keywords", "promo_labels", "parsed_at", "timestamp", "last_seen_at",
+        )
+    },
+}
+
+# INSERT ... ON CONFLICT в диалекте текущей БД (PostgreSQL или SQLite)
+def _upsert(model):
+    return (postgresql.insert if engine.dialect.name == "postgresql" else sqlite.insert)(model)
+
+# Ключ service_state со счётчиком версии данных. Счётчик увеличивается в той же
+# транзакции, что и запись наблюдений (и при очистке); по нему процессы API
+# узнают, что кэшированные справочники и ответы устарели
+INGEST_VERSION_KEY = "ingest_version"
+
+# Увеличение версии данных в открытой сессии; возвращает новую версию
+# Строка счётчика остаётся заблокированной до конца транзакции, поэтому
+# пишущие транзакции получают версии в порядке фиксации
+def _bump_ingest_version(session) -> int:
+    stmt = _upsert(ServiceState).values(key=INGEST_VERSION_KEY, value="1")
+    session.execute(stmt.on_conflict_do_update(
+        index_elements=[ServiceState.key],
+        set_={"value": cast(cast(ServiceState.value, Integer) + 1, String), "updated_at": func.now()},
+    ))
+    return int(session.query(ServiceState.value).filter(ServiceState.key == INGEST_VERSION_KEY).scalar())
+
+# Обработчики, вызываемые после фиксации записи в БД (сброс кэшей ответов
+# процесса и т. п.); регистрируются через on_ingest
+_ingest_listeners: list = []
+
+def on_ingest(callback):
+    _ingest_listeners.append(callback)
+    return callback
+
+def _notify_ingest():
+    for callback in _ingest_listeners:
+        try:
+            callback()
+        except Exception as e:
+            logger.warning(f"Ошибка обработчика записи в БД {callback!r}: {e}")
+
+# Версия данных и время её последнего изменения одним чтением по первичному
+# ключу: (0, None) — записей ещё не было
+def get_ingest_state() -> tuple[int, datetime | None]:
+    session = SessionLocal()
+    try:
+        row = (
+            session.query(ServiceState.value, ServiceState.updated_at)
+            .filter(ServiceState.key == INGEST_VERSION_KEY)
+            .first()
+        )
+        return (int(row.value), row.updated_at) if row and row.value else (0, None)
+    finally:
+        session.close()
 
-        prod = Product(
-            name=product_data.get("name", ""),
-            article=product_data.get("article", ""),
-            price=product_data.get("price", 0),
-            quantity=product_data.get("quantity", 0),
-            image_url=product_data.get("image_url"),
+# Обновление product_latest для товаров product_ids в открытой сессии (в той же
+# транзакции, что и запись наблюдений): последнее наблюдение (наибольший id)
+# каждого товара upsert'ом по (marketplace, article); строку заменяет только
+# более новое наблюдение, так что параллельные записи не откатывают её назад
+def _refresh_latest(session, product_ids):
+    if not product_ids:
+        return
+    latest_ids = (
+        session.query(func.max(Observation.id))
+        .filter(Observation.product_id.in_(product_ids))
+        .group_by(Observation.product_id)
+    )
+    _upsert_latest(session, [
+        dict(row._mapping)
+        for row in (
+            session.query(*(col.label(name) for name, col in _LATEST_COLUMNS.items()))
+            .join(Observation.product)
+            .filter(Observation.id.in_(latest_ids))
+        )
+    ])
 
-            marketplace=product_data.get("marketplace"),
-            category=product_data.get("category"),
-            promotion_detected=product_data.get("promotion_detected", False),
-            detected_keywords=product_data.get("detected_keywords", ""),
-            
+# Upsert строк product_latest (значения колонок _LATEST_COLUMNS) по
+# (marketplace, article); строку заменяет только более новое наблюдение
+def _upsert_latest(session, rows: list[dict]):
+    if not rows:
+        return
+    # Core-таблица: executemany драйвера без ORM-обработки каждой строки
+    table = ProductLatest.__table__
+    stmt = _upsert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.marketplace, table.c.article],
+        set_={name: stmt.excluded[name] for name in _LATEST_COLUMNS if name not in ("marketplace", "article")},
+        where=table.c.observation_id <= stmt.excluded.observation_id,
+    )
+    session.execute(stmt, rows)
 
-            price_old=product_data.get("price_old"),
-            price_new=product_data.get("price_new"),
-            discount=product_data.get("discount"),
-            promo_labels=product_data.get("promo_labels"),
+# Обновление product_latest по только что записанным наблюдениям, без повторного
+# чтения observations: inserted — (id, product_id, timestamp) вставленных строк
+# rows (RETURNING), extend — продлённые наблюдения из _dedupe_rows
+def _update_latest(session, keys: dict, products: dict, rows: list[dict], inserted: list, extend: dict):
+    # id одной вставки растут в порядке строк: наибольший id товара — у его
+    # последней строки в пачке (как и прежде, новейшее наблюдение — наибольший id)
+    last_ids = {}
+    for obs_id, product_id, timestamp in inserted:
+        if obs_id > last_ids.get(product_id, (0, None))[0]:
+            last_ids[product_id] = (obs_id, timestamp)
+    latest = {row["product_id"]: row for row in rows}
+    for product_id, (obs_id, timestamp) in last_ids.items():
+        latest[product_id] = {**latest[product_id], "observation_id": obs_id, "timestamp": timestamp}
+    upserts = []
+    for product_id, row in latest.items():
+        marketplace, article = keys[product_id]
+        values = {"marketplace": marketplace, "article": article, **products[keys[product_id]], **row}
+        upserts.append({name: values[name] for name in _LATEST_COLUMNS})
+    _upsert_latest(session, upserts)
+
+    extended = [
+        {"b_product_id": product_id, "b_observation_id": obs_id, "b_last_seen_at": seen}
+        for obs_id, (product_id, seen) in extend.items()
+        if product_id not in latest
+    ]
+    if extended:
+        latest_table = ProductLatest.__table__
+        session.execute(
+            update(latest_table)
+            .where(latest_table.c.product_id == bindparam("b_product_id"),
+                   latest_table.c.observation_id == bindparam("b_observation_id"))
+            .values(last_seen_at=bindparam("b_last_seen_at")),
+            extended,
+        )
 
-            parsed_at=parsed_at
+# Запись наблюдений для списка записей в открытой сессии
+# copy=False — обычный INSERT даже на PostgreSQL (построчный повтор пачки)
+# skip_existing=True — записи, уже покрытые сохранёнными наблюдениями, пропускаются
+# Возвращает (вставлено строк, записей без изменений)
+def _write_observations(session, records: list[ProductRecord], dedupe: bool,
+                        copy: bool = True, skip_existing: bool = False) -> tuple[int, int]:
+    # версия берётся первой: вставленные и продлённые строки помечаются ею (seq)
+    # для ленты изменений, а блокировка счётчика упорядочивает параллельные записи
+    seq = _bump_ingest_version(session)
+    ids, products = _resolve_product_ids(session, records)
+    rows = [{**r.to_observation_row(ids[r.key]), "seq": seq} for r in records]
+    extend = {}
+    if skip_existing:
+        rows = _skip_existing_rows(session, rows)
+    if dedupe and rows:
+        rows, extend = _dedupe_rows(session, rows)
+        if extend:
+            table = Observation.__table__
+            session.execute(
+                update(table).where(table.c.id == bindparam("b_id"))
+                .values(last_seen_at=bindparam("b_last_seen_at"), seq=seq),
+                [{"b_id": obs_id, "b_last_seen_at": seen} for obs_id, (_, seen) in extend.items()],
+            )
+    unchanged = len(records) - len(rows)
+    if rows and copy and _copy_rows(session, Observation.__tablename__, rows):
+        # COPY не возвращает id: последние наблюдения перечитываются
+        _refresh_latest(session, set(ids.values()))
+        return len(rows), unchanged
+    inserted = []
+    if rows:
+        # Core-вставка multi-row VALUES без ORM-объектов; id и timestamp — через RETURNING
+        stmt = insert(Observation.__table__).returning(
+            Observation.id, Observation.product_id, Observation.timestamp
         )
-        session.add(prod)
+        inserted = session.execute(stmt, rows).all()
+    _update_latest(session, {pid: key for key, pid in ids.items()}, products, rows, inserted, extend)
+    return len(rows), unchanged
+
+# Вставка одной пачки: товары ищутся/создаются одним запросом, наблюдения
+# пишутся COPY или multi-row INSERT (executemany), всё в одной транзакции
+# При ошибке пачка повторяется построчно обычным INSERT, каждая строка в своей
+# точке сохранения, так что отбрасываются только ошибочные строки
+def _insert_batch(batch: list[tuple[int, ProductRecord]], stats: dict, dedupe: bool = False,
+                  skip_existing: bool = False):
+    records = [record for _, record in batch]
+    session = SessionLocal()
+    try:
+        try:
+            inserted, unchanged = _write_observations(session, records, dedupe, skip_existing=skip_existing)
+            session.commit()
+            stats["inserted"] += inserted
+            stats["unchanged"] += unchanged
+            return
+        except Exception as e:
+            # ловим не только SQLAlchemyError: ошибки psycopg2 в COPY не оборачиваются
+            session.rollback()
+            logger.warning(f"Ошибка вставки пачки из {len(records)} строк, повтор построчно: {e}")
+
+        for index, record in batch:
+            try:
+                with session.begin_nested():
+                    inserted, unchanged = _write_observations(session, [record], dedupe, copy=False,
+                                                             skip_existing=skip_existing)
+                stats["inserted"] += inserted
+                stats["unchanged"] += unchanged
+            except Exception as e:
+                # не только SQLAlchemyError: ошибка одной строки не должна прерывать импорт
+                stats["rejected"] += 1
+                stats["errors"].append({"index": index, "article": record.article, "error": str(getattr(e, "orig", None) or e)})
         session.commit()
-        session.refresh(prod)
-        return prod
-    except SQLAlchemyError:
-        session.rollback()
-        raise
     finally:
         session.close()
 
-# Получение всех продуктов из базы данных
-def get_products():
+# Пакетное добавление продуктов: ProductRecord или словари в формате скрапера/CSV
+# Строки пишутся пачками по batch_size; на PostgreSQL — через COPY
+# dedupe=True — запись только изменений: если отслеживаемые поля (TRACKED_FIELDS)
+# совпадают с последним наблюдением товара, новая строка не пишется, а у последнего
+# наблюдения продлевается last_seen_at
+# skip_existing=True — товары, момент parsed_at которых уже есть в истории, не
+# пишутся повторно (считаются в unchanged), например при перепарсинге снимков
+# Возвращает {"inserted": n, "unchanged": n, "rejected": n, "errors": [{"index", "article", "error"}]},
+# где index — порядковый номер товара во входной последовательности (с 0)
+def add_products(products, batch_size: int = 1000, marketplace: str | None = None,
+                 category: str | None = None, dedupe: bool = False,
+                 skip_existing: bool = False) -> dict:
+    stats = {"inserted": 0, "unchanged": 0, "rejected": 0, "errors": []}
+    records = (
+        (i, p if isinstance(p, ProductRecord) else ProductRecord.from_scraped(p, marketplace, category))
+        for i, p in enumerate(products)
+    )
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            break
+        _insert_batch(batch, stats, dedupe, skip_existing)
+    if stats["inserted"] or stats["unchanged"]:
+        _notify_ingest()
+    if stats["rejected"]:
+        total = stats["inserted"] + stats["unchanged"] + stats["rejected"]
+        logger.error(f"Не сохранено товаров: {stats['rejected']} из {total}")
+    return stats
+
+# Сохранение товаров из скрапера: ProductRecord или словари в формате скрапера
+# marketplace и category для словарей по умолчанию берутся из самих товаров
+# dedupe по умолчанию берётся из секции [STORAGE] конфига
+# skip_existing — см. add_products
+# Возвращает количество сохранённых товаров (включая продлённые без изменений)
+def save_scraped_products(products, marketplace: str | None = None, category: str | None = None,
+                          dedupe: bool | None = None, skip_existing: bool = False) -> int:
+    if dedupe is None:
+        dedupe = _storage_setting("dedupe_observations", False)
+    stats = add_products(products, marketplace=marketplace, category=category, dedupe=dedupe,
+                         skip_existing=skip_existing)
+    return stats["inserted"] + stats["unchanged"]
+
+# Получение всех наблюдений из базы данных
+# Возвращает список ProductRecord (id и timestamp — наблюдения) по возрастанию id
+def get_products() -> list[ProductRecord]:
     session = SessionLocal()
     try:
-        return session.query(Product).all()
+        rows = (
+            session.query(Product, Observation)
+            .join(Observation.product)
+            .order_by(Observation.id)
+            .all()
+        )
+        return [ProductRecord.from_db(p, o) for p, o in rows]
     finally:
         session.close()
 
-# Получение истории продукта по артикулу
-# Возвращает список словарей, отсортированных по parsed_at по возрастанию
-def get_product_history(article: str):
+# Курсор постраничной выдачи: позиция (timestamp, id) последней отданной записи
+def encode_cursor(record: ProductRecord) -> str:
+    raw = json.dumps([record.timestamp.isoformat(), record.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+# Разбор курсора; ValueError, если курсор повреждён
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, obs_id = json.loads(raw)
+        return datetime.fromisoformat(timestamp), int(obs_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Некорректный курсор: {cursor!r}") from e
+
+# Запрос наблюдений с фильтрами на стороне БД в порядке (timestamp, id), после курсора
+# view="latest" — строки таблицы product_latest (последнее состояние товаров)
+# marketplace, category, article — точное совпадение ("" — товары без маркетплейса);
+# promo — флаг promotion_detected; price_min/price_max — диапазон цены;
+# date_from/date_to — диапазон дат parsed_at включительно
+# Возвращает (query, функция строка запроса → ProductRecord)
+def _products_query(session, view: str = "history", cursor: str | None = None,
+                    marketplace: str | None = None, category: str | None = None,
+                    article: str | None = None, promo: bool | None = None,
+                    price_min: float | None = None, price_max: float | None = None,
+                    date_from: date | None = None, date_to: date | None = None):
+    if view == "latest":
+        product, obs, obs_id = ProductLatest, ProductLatest, ProductLatest.observation_id
+        query = session.query(*_record_columns(product, obs, obs_id))
+    else:
+        product, obs, obs_id = Product, Observation, Observation.id
+        query = session.query(*_record_columns(product, obs, obs_id)).select_from(Observation).join(Observation.product)
+
+    if marketplace is not None:
+        query = query.filter(product.marketplace == marketplace)
+    if category is not None:
+        query = query.filter(product.category == category)
+    if article is not None:
+        query = query.filter(product.article == article)
+    if promo is not None:
+        query = query.filter(obs.promotion_detected.is_(promo))
+    if price_min is not None:
+        query = query.filter(obs.price >= price_min)
+    if price_max is not None:
+        query = query.filter(obs.price <= price_max)
+    if date_from is not None:
+        query = query.filter(obs.parsed_at >= date_from)
+    if date_to is not None:
+        query = query.filter(obs.parsed_at < date_to + timedelta(days=1))
+    # SQLite хранит время строкой: server_default — без долей секунды,
+    # параметры — с микросекундами; колонка и курсор сравниваются в одном формате
+    sqlite_time = "%Y-%m-%d %H:%M:%f" if engine.dialect.name == "sqlite" else None
+    sort_time = func.strftime(sqlite_time, obs.timestamp) if sqlite_time else obs.timestamp
+    if cursor:
+        timestamp, last_id = decode_cursor(cursor)
+        if sqlite_time:
+            timestamp = func.strftime(sqlite_time, _utc(timestamp).isoformat(sep=" "))
+        else:
+            timestamp = literal(timestamp, obs.timestamp.type)
+        query = query.filter(tuple_(sort_time, obs_id) > tuple_(timestamp, last_id))
+
+    query = query.order_by(sort_time, obs_id)
+    return query, lambda row: ProductRecord.from_db(row, row)
+
+# Колонки записи ProductRecord (без url) с именами полей: строка такого запроса —
+# кортеж без загрузки ORM-объектов, годится и для ProductRecord.from_db(row, row),
+# и для records.row_to_dict
+def _record_columns(product, obs, obs_id) -> list:
+    columns = [getattr(product, name) for name in ("name", "article", "image_url", "marketplace", "category")]
+    columns += [
+        getattr(obs, name) for name in (
+            "price", "quantity", "price_old", "price_new", "discount", "promo_labels",
+            "promotion_detected", "detected_keywords", "parsed_at", "timestamp", "last_seen_at",
+        )
+    ]
+    return [col.label(col.key) for col in columns] + [obs_id.label("id")]
+
+# Страница наблюдений; view и фильтры — как у _products_query
+# as_dicts=True — словари для JSON (records.row_to_dict) вместо ProductRecord
+# Возвращает (список записей, курсор следующей страницы или None)
+def get_products_page(limit: int, cursor: str | None = None, view: str = "history",
+                      as_dicts: bool = False, **filters):
+    session = SessionLocal()
+    try:
+        query, to_record = _products_query(session, view, cursor, **filters)
+        rows = query.limit(limit + 1).all()
+        # у строки запроса есть timestamp и id — курсор строится прямо по ней
+        next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+        convert = row_to_dict if as_dicts else to_record
+        return [convert(row) for row in rows[:limit]], next_cursor
+    finally:
+        session.close()
+
+# Потоковое чтение наблюдений; view и фильтры — как у _products_query
+# Строки читаются серверным курсором (на PostgreSQL) пачками по batch_size,
+# поэтому память не растёт с числом строк
+# Генератор ProductRecord (as_dicts=True — словарей records.row_to_dict);
+# сессия закрывается, когда генератор исчерпан или закрыт
+def iter_products(view: str = "history", batch_size: int = 1000, as_dicts: bool = False, **filters):
+    session = SessionLocal()
+    try:
+        query, to_record = _products_query(session, view, **filters)
+        convert = row_to_dict if as_dicts else to_record
+        for row in query.yield_per(batch_size):
+            yield convert(row)
+    finally:
+        session.close()
+
+# Курсор ленты изменений: позиция (seq, id) последней отданной строки
+def encode_changes_cursor(seq: int, obs_id: int) -> str:
+    raw = json.dumps([seq, obs_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+# Разбор курсора ленты изменений; ValueError, если курсор повреждён
+def decode_changes_cursor(cursor: str) -> tuple[int, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        seq, obs_id = json.loads(raw)
+        return int(seq), int(obs_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Некорректный курсор: {cursor!r}") from e
+
+# Лента изменений: наблюдения, вставленные или изменённые (продлённые через
+# last_seen_at) после курсора since, в порядке (seq, id) по индексу
+# ix_observations_seq_id; since=None — все наблюдения с начала
+# Удаления (очистка старых данных) в ленту не попадают: их границу отдаёт
+# get_retention_horizon
+# Возвращает (список ProductRecord, курсор для следующего запроса, есть ли ещё строки)
+def get_product_changes(since: str | None = None, limit: int = 1000) -> tuple[list[ProductRecord], str, bool]:
+    seq, last_id = decode_changes_cursor(since) if since else (0, 0)
+    session = SessionLocal()
+    try:
+        rows = (
+            session.query(Product, Observation)
+            .join(Observation.product)
+            .filter(tuple_(Observation.seq, Observation.id) > tuple_(seq, last_id))
+            .order_by(Observation.seq, Observation.id)
+            .limit(limit + 1)
+            .all()
+        )
+        page = rows[:limit]
+        if page:
+            seq, last_id = page[-1][1].seq, page[-1][1].id
+        return [ProductRecord.from_db(*row) for row in page], encode_changes_cursor(seq, last_id), len(rows) > limit
+    finally:
+        session.close()
+
+# Граница очистки старых данных для клиентов ленты изменений: наибольший cutoff
+# запусков clean_old_data (None — очистка не запускалась). Наблюдение, у которого
+# и timestamp, и last_seen_at раньше границы, удалено (или будет удалено
+# продолжением прерванной очистки), и локальная копия может его отбросить
+def get_retention_horizon() -> datetime | None:
+    session = SessionLocal()
+    try:
+        cutoff = session.query(func.max(RetentionRun.cutoff)).scalar()
+        return _utc(cutoff) if cutoff else None
+    finally:
+        session.close()
+
+# Текущее состояние каждого товара из таблицы product_latest: одна запись
+# на (marketplace, article), без обхода истории наблюдений
+# Возвращает список ProductRecord (id и timestamp — последнего наблюдения) по возрастанию id
+def get_latest_products() -> list[ProductRecord]:
+    session = SessionLocal()
+    try:
+        rows = session.query(ProductLatest).order_by(ProductLatest.observation_id).all()
+        return [ProductRecord.from_db(row, row) for row in rows]
+    finally:
+        session.close()
+
+# Сводка для дашборда агрегатными запросами, без чтения строк в Python:
+# число наблюдений и товаров, разница цены и остатка между двумя последними
+# наблюдениями (по индексу (timestamp, id)) и итоги по маркетплейсам и категориям
+def get_dashboard_stats() -> dict:
+    session = SessionLocal()
+    try:
+        last_two = (
+            session.query(Observation.price, Observation.quantity)
+            .order_by(desc(Observation.timestamp), desc(Observation.id))
+            .limit(2)
+            .all()
+        )
+        last_compare = {}
+        if len(last_two) == 2:
+            new, old = last_two
+            last_compare = {
+                "price_diff": new.price - old.price if None not in (new.price, old.price) else None,
+                "quantity_diff": new.quantity - old.quantity if None not in (new.quantity, old.quantity) else None,
+            }
+
+        per_product = (
+            session.query(Observation.product_id, func.count().label("observations"))
+            .group_by(Observation.product_id)
+            .subquery()
+        )
+
+        def totals(column, name):
+            rows = (
+                session.query(column, func.count(Product.id),
+                              func.coalesce(func.sum(per_product.c.observations), 0))
+                .outerjoin(per_product, per_product.c.product_id == Product.id)
+                .group_by(column)
+                .order_by(column)
+            )
+            return [
+                {name: value or None, "products": products, "observations": int(observations)}
+                for value, products, observations in rows
+            ]
+
+        by_marketplace = totals(Product.marketplace, "marketplace")
+        by_category = totals(Product.category, "category")
+        return {
+            "products_count": sum(t["observations"] for t in by_marketplace),
+            "unique_products": sum(t["products"] for t in by_marketplace),
+            "categories_count": sum(1 for t in by_category if t["category"]),
+            "marketplaces_count": sum(1 for t in by_marketplace if t["marketplace"]),
+            "last_compare": last_compare,
+            "by_marketplace": by_marketplace,
+            "by_category": by_category,
+        }
+    finally:
+        session.close()
+
+# Непустые значения колонки таблицы товаров по алфавиту (DISTINCT по индексу)
+def _distinct_values(column) -> list[str]:
     session = SessionLocal()
     try:
         rows = (
+            session.query(column)
+            .filter(column.isnot(None), column != "")
+            .distinct()
+            .order_by(column)
+        )
+        return [value for (value,) in rows]
+    finally:
+        session.close()
+
+# Список категорий товаров
+def get_categories() -> list[str]:
+    return _distinct_values(Product.category)
+
+# Список маркетплейсов товаров
+def get_marketplaces() -> list[str]:
+    return _distinct_values(Product.marketplace)
+
+# Товар по артикулу (если артикул есть на нескольких маркетплейсах —
+# последний обновлённый) или None
+def get_product(article: str) -> Product | None:
+    session = SessionLocal()
+    try:
+        return (
             session.query(Product)
             .filter(Product.article == article)
-            .order_by(asc(Product.parsed_at))
+            .order_by(desc(Product.updated_at), desc(Product.id))
+            .first()
+        )
+    finally:
+        session.close()
+
+# Получение истории продукта по артикулу
+# Возвращает список словарей, отсортированных по parsed_at по возрастанию;
+# для наблюдения с last_seen_at добавляется точка с теми же значениями в last_seen_at.
+# date_from/date_to — диапазон дат включительно: отрезки, начатые раньше или
+# продлённые позже, обрезаются по его границам. max_points — сколько точек
+# оставить (прореживание по цене методом method из downsample); None — все.
+# marketplace — только этот маркетплейс; без него ряды разных маркетплейсов
+# прореживаются по отдельности (по max_points на каждый) и сливаются по времени,
+# у каждой точки есть поле marketplace
+def get_product_history(article: str, date_from: date | None = None, date_to: date | None = None,
+                        max_points: int | None = None, method: str = "lttb",
+                        marketplace: str | None = None):
+    return get_products_history([article], date_from, date_to, max_points, method, marketplace).get(article, [])
+
+# История нескольких артикулов одним запросом (Product.article IN (...))
+# Возвращает словарь {article: [точки как в get_product_history]};
+# артикулов без наблюдений в диапазоне в словаре нет
+def get_products_history(articles, date_from: date | None = None, date_to: date | None = None,
+                         max_points: int | None = None, method: str = "lttb",
+                         marketplace: str | None = None) -> dict:
+    articles = [a for a in dict.fromkeys(articles) if a]
+    if not articles:
+        return {}
+    start = datetime.combine(date_from, datetime.min.time()) if date_from else None
+    end = datetime.combine(date_to + timedelta(days=1), datetime.min.time()) if date_to else None
+    at = func.coalesce(Observation.parsed_at, Observation.timestamp)
+    session = SessionLocal()
+    try:
+        query = (
+            session.query(
+                Product.article, Product.marketplace, at, Observation.last_seen_at,
+                Observation.price, Observation.price_old, Observation.price_new,
+                Observation.discount, Observation.quantity, Product.image_url,
+            )
+            .join(Observation.product)
+            .filter(Product.article.in_(articles))
+        )
+        if marketplace:
+            query = query.filter(Product.marketplace == marketplace)
+        if start is not None:
+            query = query.filter(func.coalesce(Observation.last_seen_at, at) >= start)
+        if end is not None:
+            query = query.filter(at < end)
+        rows = query.order_by(
+            asc(Product.article), asc(Product.marketplace), asc(at), asc(Observation.timestamp)
+        ).all()
+    finally:
+        session.close()
+    history: dict = {}
+    # ряд — один товар (marketplace, article): цены разных маркетплейсов
+    # не смешиваются при прореживании
+    for (article, _), series in groupby(rows, key=lambda row: row[:2]):
+        history.setdefault(article, []).append(_history_points(series, start, end, max_points, method))
+    return {
+        article: series[0] if len(series) == 1 else list(heapq.merge(*series, key=_point_time))
+        for article, series in history.items()
+    }
+
+def _point_time(point: dict) -> datetime:
+    return _utc(datetime.fromisoformat(point["parsed_at"]))
+
+# Точки истории одного товара из строк
+# (article, marketplace, at, last_seen_at, значения..., image_url)
+def _history_points(rows, start, end, max_points, method) -> list[dict]:
+    times, history = [], []
+    for _, marketplace, parsed_at, last_seen_at, *values, image_url in rows:
+        point = dict(zip(("price", "price_old", "price_new", "discount", "quantity"), values))
+        point["image_url"] = image_url
+        point["marketplace"] = marketplace or None
+        # значения не менялись до last_seen_at — замыкаем отрезок второй точкой
+        seen = last_seen_at if last_seen_at and _utc(last_seen_at) > _utc(parsed_at) else None
+        for moment in (parsed_at, seen):
+            if moment is not None:
+                moment = _clamp(moment, start, end)
+                times.append(moment)
+                history.append({"parsed_at": moment.isoformat(), **point})
+
+    if max_points is not None and len(history) > max_points:
+        epoch = datetime(1970, 1, 1)
+        x = [(_utc(t) - epoch).total_seconds() for t in times]
+        y = [p["price"] if p["price"] is not None else float("nan") for p in history]
+        history = [history[i] for i in downsample(x, y, max_points, method)]
+    return history
+
+# Момент, приведённый к диапазону [start, end]
+def _clamp(moment: datetime, start: datetime | None, end: datetime | None) -> datetime:
+    if start is not None and _utc(moment) < start:
+        bound = start
+    elif end is not None and _utc(moment) > end:
+        bound = end
+    else:
+        return moment
+    return bound.replace(tzinfo=timezone.utc) if moment.tzinfo else bound
+
+# Последнее сохранённое наблюдение по каждому из артикулов
+# Возвращает словарь {article: {price, price_old, price_new, discount, quantity, promo_labels, image_url}}
+def get_latest_observations(articles, marketplace: str | None = None) -> dict:
+    articles = [a for a in dict.fromkeys(articles) if a]
+    if not articles:
+        return {}
+    session = SessionLocal()
+    try:
+        latest_ids = (
+            session.query(func.max(Observation.id))
+            .join(Observation.product)
+            .filter(Product.article.in_(articles))
+        )
+        if marketplace:
+            latest_ids = latest_ids.filter(Product.marketplace == marketplace)
+        latest_ids = latest_ids.group_by(Observation.product_id)
+
+        rows = (
+            session.query(Observation, Product.article, Product.image_url)
+            .join(Observation.product)
+            .filter(Observation.id.in_(latest_ids))
             .all()
         )
-        history = []
-        for p in rows:
-            ts_field = p.parsed_at or p.timestamp
-            history.append({
-                "parsed_at": p.parsed_at.isoformat(),
-                "price": p.price,
-                "price_old": p.price_old,
-                "price_new": p.price_new,
-                "discount": p.discount,
-                "quantity": p.quantity,
-                "image_url": p.image_url,
-            })
-        return history
+        return {
+            article: {
+                "price": o.price,
+                "price_old": o.price_old,
+                "price_new": o.price_new,
+                "discount": o.discount,
+                "quantity": o.quantity,
+                "promo_labels": o.promo_labels,
+                "image_url": image_url,
+            }
+            for o, article, image_url in rows
+        }
     finally:
         session.close()
 
 # Удаление старых данных из базы
-# Удаляет записи старше, чем сейчас минус days дней
+# Удаляет наблюдения старше, чем сейчас минус days дней (товары остаются)
+# На секционированной таблице (PostgreSQL) старые месячные секции сначала убираются
+# целиком. Остальные строки удаляются пачками по batch_size в порядке первичного
+# ключа, каждая пачка — отдельная транзакция, между пачками пауза pause секунд.
+# Запуск, не уложившийся в time_budget секунд, прерывается, а следующий продолжает
+# с того же id. Ход и итог каждого запуска пишутся в таблицу retention_runs
+# Параметры по умолчанию берутся из секции [STORAGE] конфига
 # Возвращает количество удаленных записей
-def clean_old_data(days: int = 60) -> int:
+def clean_old_data(days: int = 60, batch_size: int | None = None, pause: float | None = None,
+                   time_budget: float | None = None) -> int:
+    batch_size = batch_size or _storage_setting("retention_batch_size", 5000)
+    pause = _storage_setting("retention_pause", 0.5) if pause is None else pause
+    time_budget = _storage_setting("retention_time_budget", 600) if time_budget is None else time_budget
     cutoff = datetime.utcnow() - timedelta(days=days)
+    expired = and_(
+        Observation.timestamp < cutoff,
+        # наблюдение, продлённое записью только изменений, ещё актуально
+        or_(Observation.last_seen_at.is_(None), Observation.last_seen_at < cutoff),
+    )
+    started = time.monotonic()
+
     session = SessionLocal()
     try:
-        deleted = (
-            session.query(Product)
-            .filter(Product.timestamp < cutoff)
-            .delete(synchronize_session=False)
+        previous = session.query(RetentionRun).order_by(desc(RetentionRun.id)).first()
+        run = RetentionRun(
+            cutoff=cutoff, rows_deleted=0, batches=0, completed=False,
+            last_id=previous.last_id if previous and not previous.completed else 0,
         )
+        session.add(run)
+        session.commit()
+        if run.last_id:
+            logger.info(f"[RETENTION] продолжение прерванной очистки с id {run.last_id}")
+
+        if is_partitioned(engine):
+            run.rows_deleted += drop_old_partitions(
+                engine, cutoff, detach_only=_storage_setting("detach_partitions", False)
+            )
+            session.commit()
+
+        while True:
+            ids = [
+                obs_id for (obs_id,) in
+                session.query(Observation.id)
+                .filter(Observation.id > run.last_id, expired)
+                .order_by(Observation.id)
+                .limit(batch_size)
+            ]
+            if ids:
+                session.query(Observation).filter(Observation.id.in_(ids)).delete(synchronize_session=False)
+                run.rows_deleted += len(ids)
+                run.batches += 1
+                run.last_id = ids[-1]
+            run.completed = len(ids) < batch_size
+            session.commit()
+            if run.completed:
+                break
+            if time.monotonic() - started >= time_budget:
+                logger.warning(f"[RETENTION] исчерпан бюджет {time_budget} с, продолжение со следующего запуска")
+                break
+            logger.info(f"[RETENTION] удалено {run.rows_deleted} строк, позиция id {run.last_id}")
+            if pause:
+                time.sleep(pause)
+
+        if run.rows_deleted:
+            _bump_ingest_version(session)
+        oldest = session.query(func.min(Observation.timestamp)).filter(expired).scalar()
+        run.lag_seconds = (cutoff - _utc(oldest)).total_seconds() if oldest else 0.0
+        run.duration_seconds = time.monotonic() - started
+        run.finished_at = datetime.utcnow()
         session.commit()
-        return deleted
+        if run.rows_deleted:
+            _notify_ingest()
+        logger.info(
+            f"[RETENTION] удалено {run.rows_deleted} строк за {run.duration_seconds:.1f} с "
+            f"({run.batches} пачек), отставание {run.lag_seconds:.0f} с"
+        )
+        return run.rows_deleted
+    finally:
+        session.close()
+
+# Последние запуски очистки старых данных (новые первыми)
+def get_retention_runs(limit: int = 20) -> list[dict]:
+    session = SessionLocal()
+    try:
+        runs = session.query(RetentionRun).order_by(desc(RetentionRun.id)).limit(limit).all()
+        return [
+            {
+                "started_at": r.started_at.isoformat() if r.started_at else None,
+                "finished_at": r.finished_at.isoformat() if r.finished_at else None,
+                "cutoff": r.cutoff.isoformat(),
+                "rows_deleted": r.rows_deleted,
+                "batches": r.batches,
+                "completed": r.completed,
+                "duration_seconds": r.duration_seconds,
+                "lag_seconds": r.lag_seconds,
+            }
+            for r in runs
+        ]
     finally:
         session.close()
@@ -0,0 +1,94 @@
+# backend/downsample.py
+"""
+Прореживание временных рядов для графиков.
+
+Оба алгоритма получают координаты точек (x — время в секундах по
+возрастанию, y — значение) и возвращают индексы оставленных точек;
+первая и последняя точки сохраняются всегда.
+
+- lttb — Largest-Triangle-Three-Buckets: из каждой корзины берётся точка,
+  образующая наибольший треугольник с предыдущей выбранной точкой и
+  средним следующей корзины. Сохраняет форму кривой (пики, ступени цены).
+- minmax — из каждой корзины берутся минимум и максимум: ни один
+  экстремум не теряется, но точек внутри корзины вдвое больше.
+
+Пропуски (None/NaN в y) заполняются предыдущим значением.
+"""
+import numpy as np
+
+METHODS = ("lttb", "minmax")
+
+
+def _fill_gaps(y) -> np.ndarray:
+    y = np.array(y, dtype=float)
+    missing = np.isnan(y)
+    if missing.all():
+        return np.zeros_like(y)
+    if missing.any():
+        idx = np.where(missing, 0, np.arange(len(y)))
+        np.maximum.accumulate(idx, out=idx)
+        y = y[idx]
+        # пропуски в начале ряда — первым известным значением
+        y[np.isnan(y)] = y[~np.isnan(y)][0]
+    return y
+
+
+def _edges(n: int, max_points: int) -> np.ndarray | None:
+    """Все индексы, если прореживать нечего, иначе None."""
+    if max_points >= n:
+        return np.arange(n)
+    if max_points <= 2:
+        return np.array([0, n - 1][:max(max_points, 1)])
+    return None
+
+
+def lttb(x, y, max_points: int) -> np.ndarray:
+    n = len(x)
+    kept = _edges(n, max_points)
+    if kept is not None:
+        return kept
+    x = np.asarray(x, dtype=float)
+    y = _fill_gaps(y)
+
+    # внутренние точки 1..n-2 делятся на max_points-2 корзин
+    every = (n - 2) / (max_points - 2)
+    selected = np.empty(max_points, dtype=int)
+    selected[0] = a = 0
+    for i in range(max_points - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    selected[-1] = n - 1
+    return selected
+
+
+def minmax(x, y, max_points: int) -> np.ndarray:
+    n = len(x)
+    kept = _edges(n, max_points)
+    if kept is not None:
+        return kept
+    y = _fill_gaps(y)
+
+    buckets = max((max_points - 2) // 2, 1)
+    selected = {0, n - 1}
+    for bucket in np.array_split(np.arange(1, n - 1), buckets):
+        if len(bucket):
+            values = y[bucket]
+            selected.add(int(bucket[values.argmin()]))
+            selected.add(int(bucket[values.argmax()]))
+    return np.array(sorted(selected))
+
+
+def downsample(x, y, max_points: int, method: str = "lttb") -> np.ndarray:
+    """Индексы точек, оставленных алгоритмом method (lttb или minmax)."""
+    if method not in METHODS:
+        raise ValueError(f"method должен быть одним из: {', '.join(METHODS)}")
+    return (lttb if method == "lttb" else minmax)(x, y, max_points)
@@ -6,7 +6,6 @@ from datetime import datetime
 from zoneinfo import ZoneInfo
 
 import matplotlib.dates as mdates
-from sqlalchemy import desc
 import matplotlib.pyplot as plt
 from reportlab.lib import colors
 from reportlab.lib.units import mm
@@ -24,7 +23,8 @@ from reportlab.platypus import (
     SimpleDocTemplate,
 )
 
-from backend.database import SessionLocal, Product, get_product_history
+from backend.database import get_product, get_product_history
+from backend.records import ProductRecord, format_number
 
 # --- Папки для отчётов ---
 CSV_RESULTS = "/app/csv_results"
@@ -32,6 +32,9 @@ PDF_RESULTS = "/app/pdf_results"
 os.makedirs(CSV_RESULTS, exist_ok=True)
 os.makedirs(PDF_RESULTS, exist_ok=True)
 
+# Сколько точек истории рисуется на графиках PDF-отчёта по товару
+PDF_HISTORY_POINTS = 300
+
 # --- Регистрация шрифта для кириллицы ---
 DEJAVU_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
 if not os.path.isfile(DEJAVU_PATH):
@@ -39,9 +42,9 @@ if not os.path.isfile(DEJAVU_PATH):
 pdfmetrics.registerFont(TTFont("DejaVuSans", DEJAVU_PATH))
 
 
-def export_to_csv(products: list[dict], path: str | None = None) -> str:
+def export_to_csv(products: list, path: str | None = None) -> str:
     """
-    Экспортирует список продуктов в CSV.
+    Экспортирует список продуктов (ProductRecord или словари скрапера) в CSV.
     Возвращает путь к файлу.
     """
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -65,26 +68,25 @@ def export_to_csv(products: list[dict], path: str | None = None) -> str:
     with open(filename, "w", encoding="utf-8", newline="") as f:
         writer = csv.DictWriter(f, fieldnames=fieldnames)
         writer.writeheader()
-        for p in products:
-            labels = p.get("promo_labels") or []
+        for p in map(ProductRecord.coerce, products):
             writer.writerow({
-                "name":                p.get("name", ""),
-                "article":             p.get("article", ""),
-                "price":               p.get("price", ""),
-                "quantity":            p.get("quantity", ""),
-                "image_url":           p.get("image_url", ""),
-                "price_old":           p.get("price_old", ""),
-                "price_new":           p.get("price_new", ""),
-                "discount":            p.get("discount", ""),
-                "promo_labels":        ";".join(labels),
-                "promotion_detected":  p.get("promotion_analysis", {}).get("promotion_detected", False),
-                "detected_keywords":   ";".join(p.get("promotion_analysis", {}).get("detected_keywords", [])),
-                "parsed_at":           p.get("parsed_at", datetime.now().isoformat()),
+                "name":                p.name,
+                "article":             p.article,
+                "price":               format_number(p.price) or "",
+                "quantity":            format_number(p.quantity) or "",
+                "image_url":           p.image_url or "",
+                "price_old":           format_number(p.price_old) or "",
+                "price_new":           format_number(p.price_new) or "",
+                "discount":            format_number(p.discount) or "",
+                "promo_labels":        ";".join(p.promo_labels),
+                "promotion_detected":  p.promotion_detected,
+                "detected_keywords":   ";".join(p.detected_keywords),
+                "parsed_at":           (p.parsed_at or datetime.now()).isoformat(),
             })
     return filename
 
 
-def export_to_pdf(products: list[dict], path: str | None = None) -> str:
+def export_to_pdf(products: list, path: str | None = None) -> str:
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
     filename = path or os.path.join(PDF_RESULTS, f"report_{ts}.pdf")
 
@@ -126,19 +128,19 @@ def export_to_pdf(products: list[dict], path: str | None = None) -> str:
     ]
     data = [[Paragraph(h, styles["Heading2"]) for h in header]]
 
-    for p in products:
+    for p in map(ProductRecord.coerce, products):
         row = [
-            Paragraph(str(p.get("name","")), wrap),
-            Paragraph(str(p.get("article","")), wrap),
-            Paragraph(str(p.get("price","")), wrap),
-            Paragraph(str(p.get("quantity","")), wrap),
-            Paragraph(str(p.get("price_old","")), wrap),
-            Paragraph(str(p.get("price_new","")), wrap),
-            Paragraph(str(p.get("discount","")), wrap),
-            Paragraph(", ".join(p.get("promo_labels",[])), wrap),
-            Paragraph(str(p.get("promotion_detected", False)), wrap),
-            Paragraph(", ".join(p.get("detected_keywords",[])), wrap),
-            Paragraph(str(p.get("parsed_at","")), wrap),
+            Paragraph(p.name, wrap),
+            Paragraph(p.article, wrap),
+            Paragraph(format_number(p.price) or "", wrap),
+            Paragraph(format_number(p.quantity) or "", wrap),
+            Paragraph(format_number(p.price_old) or "", wrap),
+            Paragraph(format_number(p.price_new) or "", wrap),
+            Paragraph(f"{format_number(p.discount)}%" if p.discount is not None else "", wrap),
+            Paragraph(", ".join(p.promo_labels), wrap),
+            Paragraph(str(p.promotion_detected), wrap),
+            Paragraph(", ".join(p.detected_keywords), wrap),
+            Paragraph(p.parsed_at.isoformat() if p.parsed_at else "", wrap),
         ]
         data.append(row)
 
@@ -165,16 +167,12 @@ def export_product_pdf(article: str, path: str | None = None) -> str:
     Формирует PDF-отчёт с карточкой товара и графиками.
     Название, категория, маркетплейс и изображение берутся из последней записи в БД.
     """
-    # 1) Получаем историю и сам товар из БД
-    history = get_product_history(article)
-    session = SessionLocal()
-    prod = (
-        session.query(Product)
-        .filter(Product.article == article)
-        .order_by(desc(Product.parsed_at), desc(Product.timestamp))
-        .first()
+    # 1) Получаем товар и его историю (прореженную до разрешения графика) из БД;
+    # история — того же маркетплейса, что и карточка
+    prod = get_product(article)
+    history = get_product_history(
+        article, max_points=PDF_HISTORY_POINTS, marketplace=prod.marketplace if prod else None
     )
-    session.close()
 
     # 2) Подготовка имени файла
     date_for_name = datetime.now().strftime("%d_%m_%Y")
@@ -222,22 +220,15 @@ def export_product_pdf(article: str, path: str | None = None) -> str:
         elements.append(Paragraph(f"Скидка: {last['discount']}", styles["Normal"]))
     elements.append(Spacer(1, 12))
 
-    # 8) Графики по истории
+    # 8) Графики по истории: каждая точка разбирается один раз
+    points = [ProductRecord.from_scraped(h) for h in history]
+    dates = [pt.parsed_at for pt in points]
     for key, title in [
         ("price", "Динамика цены"),
         ("discount", "Динамика скидки"),
         ("quantity", "Динамика остатков")
     ]:
-        # собираем даты и значения
-        dates_iso = [h["parsed_at"] for h in history]
-        dates = [datetime.fromisoformat(d) for d in dates_iso]
-        vals = []
-        for h in history:
-            try:
-                v = float(str(h.get(key)).replace("%", "").replace(",", "."))
-            except Exception:
-                v = 0.0
-            vals.append(v)
+        vals = [float(getattr(pt, key) or 0.0) for pt in points]
 
         # строим график
         fig, ax = plt.subplots(figsize=(6, 3))
@@ -0,0 +1,188 @@
+# backend/http_cache.py
+"""
+HTTP-кэширование ответов на чтение: валидаторы и сжатие.
+
+- conditional(state) — декоратор маршрута: ETag и Last-Modified строятся
+  из дешёвого состояния данных (версия ingest_version и время её изменения),
+  а не из тела ответа. Если клиент прислал совпадающий If-None-Match
+  (или If-Modified-Since не старше данных), маршрут не вызывается вовсе —
+  ответ 304 без тела.
+- cached(cache, min_size) — декоратор маршрута: готовое тело ответа хранится
+  в cache.LRUCache по маршруту, параметрам запроса, состоянию данных из
+  conditional и выбранному Content-Encoding — уже сжатым; повторный запрос
+  не вызывает маршрут и не сжимает тело заново.
+- compress_response(response, min_size) — обработчик after_request:
+  JSON-ответы не меньше min_size байт сжимаются br (если установлен пакет
+  brotli и клиент его принимает) или gzip; потоковые JSON-ответы (размер
+  заранее неизвестен) сжимаются всегда, фрагмент за фрагментом.
+
+ETag слабые (W/"..."): сжатые и несжатые варианты ответа совпадают по смыслу.
+"""
+import gzip
+import zlib
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import current_app, g, make_response, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+COMPRESSIBLE = ("application/json",)
+
+
+def _etag(tag) -> str:
+    """ETag варианта ответа: маршрут, состояние данных и параметры запроса."""
+    # Accept входит в ключ: /products отдаёт NDJSON по Accept: application/x-ndjson
+    variant = f"{request.full_path}|{request.headers.get('Accept', '')}"
+    return f"{request.endpoint}-{tag}-{zlib.crc32(variant.encode()):08x}"
+
+
+def _http_time(value: datetime | None) -> datetime | None:
+    """Время в UTC с точностью до секунды, как в заголовках HTTP."""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).replace(microsecond=0)
+
+
+def _not_modified(etag: str, modified: datetime | None) -> bool:
+    # If-None-Match важнее If-Modified-Since (RFC 9110, 13.2.2)
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    since = request.if_modified_since
+    return since is not None and modified is not None and modified <= since
+
+
+def _set_validators(response, etag: str, modified: datetime | None):
+    response.set_etag(etag, weak=True)
+    if modified is not None:
+        response.last_modified = modified
+    # браузер хранит ответ, но каждый раз сверяет его с сервером
+    response.cache_control.no_cache = True
+
+
+def conditional(state):
+    """
+    Декоратор маршрута GET. state() возвращает (tag, last_modified):
+    tag меняется при каждом изменении данных маршрута, last_modified —
+    время этого изменения (datetime или None).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            tag, modified = state()
+            # состояние данных — часть ключа кэша ответов (cached)
+            g.data_tag = tag
+            etag, modified = _etag(tag), _http_time(modified)
+            if _not_modified(etag, modified):
+                response = make_response("", 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            _set_validators(response, etag, modified)
+            return response
+        return wrapper
+    return decorator
+
+
+def _cache_key(encoding: str | None) -> tuple:
+    """Путь, параметры запроса без учёта порядка, Accept, состояние данных и сжатие."""
+    args = tuple(sorted(request.args.items(multi=True)))
+    return request.path, args, request.headers.get("Accept", ""), g.get("data_tag"), encoding
+
+
+def cached(cache, min_size: int = 1024):
+    """
+    Декоратор маршрута GET: успешные непотоковые ответы сохраняются в cache
+    (cache.LRUCache со значениями (тело, статус, mimetype, Content-Encoding)).
+    Тело сжимается здесь же (compress_response с тем же min_size, что и в
+    after_request) и хранится сжатым, поэтому попадание в кэш не тратит CPU
+    на сжатие. Ставится под conditional, чтобы ключ включал версию данных:
+    тогда другой воркер, записавший данные, не оставит в этом процессе
+    устаревший ответ.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = _cache_key(_choose_encoding())
+            entry = cache.get(key)
+            if entry is not None:
+                body, status, mimetype, encoding = entry
+                response = current_app.response_class(body, status, mimetype=mimetype)
+                if mimetype in COMPRESSIBLE:
+                    response.vary.add("Accept-Encoding")
+                if encoding:
+                    response.headers["Content-Encoding"] = encoding
+                return response
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed and not response.direct_passthrough:
+                response = compress_response(response, min_size)
+                cache.set(key, (
+                    response.get_data(), response.status_code, response.mimetype,
+                    response.headers.get("Content-Encoding"),
+                ))
+            return response
+        return wrapper
+    return decorator
+
+
+def _choose_encoding() -> str | None:
+    accept = request.accept_encodings
+    if brotli is not None and accept["br"]:
+        return "br"
+    if accept["gzip"]:
+        return "gzip"
+    return None
+
+
+def _compress_stream(chunks, encoding: str):
+    """Сжатие потока по фрагментам: каждый фрагмент уходит клиенту сразу."""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+        return
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def compress_response(response, min_size: int = 1024):
+    """
+    Сжимает JSON-ответ, если клиент это принимает: готовый — при размере
+    тела не меньше min_size, потоковый — всегда.
+    """
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or response.mimetype not in COMPRESSIBLE
+        or "Content-Encoding" in response.headers
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = _choose_encoding()
+    if encoding is None:
+        return response
+    if response.is_streamed:
+        response.response = _compress_stream(response.iter_encoded(), encoding)
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+        if encoding == "br":
+            response.set_data(brotli.compress(data, quality=BROTLI_QUALITY))
+        else:
+            response.set_data(gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0))
+    response.headers["Content-Encoding"] = encoding
+    return response
@@ -0,0 +1,58 @@
+# backend/json_provider.py
+"""
+JSON-провайдер Flask для больших ответов.
+
+Если установлен orjson, ответы сериализуются им (в разы быстрее стандартного
+json, сразу в байты); иначе — стандартным json. В обоих случаях:
+- datetime и date — ISO 8601 (как isoformat), а не формат HTTP-даты Flask;
+- Decimal — число;
+- ключи не сортируются, кириллица не экранируется (\\uXXXX).
+
+Поэтому записи можно отдавать с datetime внутри, без isoformat() по строкам.
+"""
+from datetime import date
+from decimal import Decimal
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS if orjson is not None else 0
+
+
+def _default(value):
+    """Типы, которых нет в JSON (для orjson — кроме datetime, их он пишет сам)."""
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    sort_keys = False
+    ensure_ascii = False
+    default = staticmethod(_default)
+
+    def dumps(self, obj, **kwargs) -> str:
+        if orjson is not None and not kwargs:
+            return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS).decode()
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        # тело сразу в байтах, без промежуточной строки
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS) + b"\n",
+            mimetype=self.mimetype,
+        )
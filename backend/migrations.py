@@ -0,0 +1,339 @@
+# backend/migrations.py
+"""
+Версионированные миграции схемы.
+
+init_db сначала применяет миграции, затем создаёт недостающие таблицы через
+create_all (он не меняет уже существующие) и запускает миграции ещё раз. Изменения существующих таблиц
+описываются здесь: каждая миграция — функция migrate(engine) с номером
+версии. Применённые версии
+записываются в таблицу schema_migrations, поэтому каждая миграция
+выполняется один раз. Миграция, вернувшая False, не записывается и будет
+повторена при следующем запуске (init_db запускает миграции и после create_all). Миграции пишутся идемпотентными: на пустой базе и на
+базе, созданной по текущим моделям, они ничего не делают, а прерванную
+миграцию можно запустить повторно.
+"""
+import logging
+
+import numpy as np
+from sqlalchemy import inspect, select, insert, text, String, Numeric, Integer, BigInteger, DateTime
+
+from backend.models import Base, Product, Observation, ProductLatest, SchemaMigration
+from backend.normalize import parse_prices, parse_discounts, parse_quantities
+from backend.partitions import partition_observations, is_partitioned
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory-блокировки PostgreSQL: миграции не выполняются
+# одновременно из нескольких процессов (воркеры gunicorn)
+_LOCK_KEY = 7203501
+
+# Колонки products, переведённые из строк в числа: тип и пакетный парсер.
+# Описания схемы в миграциях зафиксированы на момент их написания и не
+# зависят от текущих моделей.
+TYPED_COLUMNS = {
+    "price": (Numeric(12, 2), parse_prices),
+    "quantity": (Integer(), parse_quantities),
+    "price_old": (Numeric(12, 2), parse_prices),
+    "price_new": (Numeric(12, 2), parse_prices),
+    "discount": (Numeric(5, 2), parse_discounts),
+}
+
+# Индексы «широкой» таблицы products (до разделения на products и observations)
+WIDE_PRODUCTS_INDEXES = [
+    ("ix_products_article_parsed_at", ("article", "parsed_at", "timestamp")),
+    ("ix_products_category", ("category",)),
+    ("ix_products_marketplace", ("marketplace",)),
+    ("ix_products_timestamp", ("timestamp",)),
+]
+
+
+def _columns(engine, table: str) -> dict:
+    return {c["name"]: c for c in inspect(engine).get_columns(table)}
+
+
+def _is_wide_products(engine) -> bool:
+    """products ещё в «широкой» схеме: цены хранятся в самой таблице товаров."""
+    return inspect(engine).has_table("products") and "price" in _columns(engine, "products")
+
+
+def _column_limit(column_type) -> float:
+    """Наименьшее по модулю значение, которое уже не помещается в колонку."""
+    if isinstance(column_type, Numeric):
+        return 10.0 ** (column_type.precision - column_type.scale)
+    return 2.0 ** 31
+
+
+def _typed_numeric_columns(engine, chunk_size: int = 5000):
+    """
+    Строковые price, quantity, price_old, price_new, discount → Numeric/Integer.
+
+    1. строковая колонка переименовывается в <name>_legacy, рядом добавляется
+       типизированная колонка с прежним именем;
+    2. значения разбираются пачками по chunk_size строк (по возрастанию id),
+       каждая пачка — отдельная транзакция; значения, не помещающиеся в
+       колонку (мусор вида «12345678901 ₽»), записываются как NULL, иначе
+       PostgreSQL отверг бы всю пачку;
+    3. колонки *_legacy удаляются.
+    """
+    if not _is_wide_products(engine):
+        return
+    table = "products"
+    cols = _columns(engine, table)
+    with engine.begin() as conn:
+        for name in TYPED_COLUMNS:
+            legacy = f"{name}_legacy"
+            if name in cols and isinstance(cols[name]["type"], String) and legacy not in cols:
+                conn.execute(text(f"ALTER TABLE {table} RENAME COLUMN {name} TO {legacy}"))
+                cols[legacy] = cols.pop(name)
+            if legacy in cols and name not in cols:
+                ddl = TYPED_COLUMNS[name][0].compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+                cols[name] = None
+
+    pending = [name for name in TYPED_COLUMNS if f"{name}_legacy" in cols]
+    if not pending:
+        return
+
+    select_sql = text(
+        f"SELECT id, {', '.join(f'{n}_legacy' for n in pending)} FROM {table} "
+        f"WHERE id > :last_id ORDER BY id LIMIT :limit"
+    )
+    update_sql = text(
+        f"UPDATE {table} SET {', '.join(f'{n} = :{n}' for n in pending)} WHERE id = :id"
+    )
+    last_id, total = 0, 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(select_sql, {"last_id": last_id, "limit": chunk_size}).all()
+            if not rows:
+                break
+            ids = [r[0] for r in rows]
+            params = [{"id": i} for i in ids]
+            for pos, name in enumerate(pending, start=1):
+                column_type, parse = TYPED_COLUMNS[name]
+                values, mask = parse([r[pos] for r in rows])
+                mask &= np.abs(np.nan_to_num(values)) < _column_limit(column_type)
+                for p, v, ok in zip(params, values.tolist(), mask.tolist()):
+                    p[name] = v if ok else None
+            conn.execute(update_sql, params)
+        last_id = ids[-1]
+        total += len(rows)
+        logger.info(f"[MIGRATE] {table}: преобразовано строк {total}")
+
+    with engine.begin() as conn:
+        for name in pending:
+            conn.execute(text(f"ALTER TABLE {table} DROP COLUMN {name}_legacy"))
+
+
+def _create_indexes(engine, table: str, indexes: list[tuple[str, tuple[str, ...]]],
+                    concurrently: bool = True):
+    """
+    Создаёт недостающие индексы из списка (имя, колонки).
+    На PostgreSQL — CREATE INDEX CONCURRENTLY (без блокировки записи в таблицу);
+    индекс, оставшийся невалидным после прерванного создания, пересоздаётся.
+    concurrently=False — для секционированных таблиц, где CONCURRENTLY недоступен.
+    """
+    postgres = engine.dialect.name == "postgresql"
+    existing = {ix["name"] for ix in inspect(engine).get_indexes(table)}
+    # CONCURRENTLY нельзя выполнять внутри транзакции
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for name, columns in indexes:
+            if postgres and name in existing:
+                valid = conn.execute(
+                    text("SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                         "WHERE c.relname = :name"),
+                    {"name": name},
+                ).scalar()
+                if valid:
+                    continue
+                logger.warning(f"[MIGRATE] индекс {name} невалиден, пересоздаётся")
+                conn.execute(text(f"DROP INDEX {'CONCURRENTLY ' if concurrently else ''}IF EXISTS {name}"))
+            elif name in existing:
+                continue
+            mode = "CONCURRENTLY " if postgres and concurrently else ""
+            logger.info(f"[MIGRATE] создаётся индекс {name} ({', '.join(columns)})")
+            conn.execute(text(f"CREATE INDEX {mode}{name} ON {table} ({', '.join(columns)})"))
+
+
+def _products_indexes(engine):
+    """Индексы истории, фильтров и очистки для «широкой» таблицы products."""
+    if _is_wide_products(engine):
+        _create_indexes(engine, "products", WIDE_PRODUCTS_INDEXES)
+
+
+def _split_products(engine, chunk_size: int = 50000):
+    """
+    «Широкая» products → products (товар, ключ marketplace + article)
+    и observations (цены, остатки, промо, время).
+
+    1. products переименовывается в products_legacy, её индексы удаляются
+       (их имена нужны новой схеме);
+    2. создаются новые таблицы по моделям;
+    3. для каждой пары (marketplace, article) в products переносятся
+       название, изображение и категория из последней строки;
+    4. наблюдения переносятся пачками по диапазонам id с сохранением id;
+    5. products_legacy удаляется.
+    """
+    postgres = engine.dialect.name == "postgresql"
+    if not inspect(engine).has_table("products_legacy"):
+        if not _is_wide_products(engine):
+            return
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE products RENAME TO products_legacy"))
+            for ix in inspect(conn).get_indexes("products_legacy"):
+                conn.execute(text(f"DROP INDEX {ix['name']}"))
+            if postgres:
+                conn.execute(text("ALTER INDEX IF EXISTS products_pkey RENAME TO products_legacy_pkey"))
+    Base.metadata.create_all(bind=engine, tables=[Product.__table__, Observation.__table__])
+
+    key = "COALESCE(l.marketplace, '')"
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO products (marketplace, article, name, image_url, category, created_at, updated_at) "
+            f"SELECT {key}, l.article, l.name, l.image_url, l.category, l.timestamp, l.timestamp "
+            "FROM products_legacy l "
+            "WHERE l.id IN (SELECT max(id) FROM products_legacy GROUP BY COALESCE(marketplace, ''), article) "
+            f"AND NOT EXISTS (SELECT 1 FROM products p WHERE p.marketplace = {key} AND p.article = l.article)"
+        ))
+        last_id = conn.execute(text("SELECT COALESCE(max(id), 0) FROM observations")).scalar()
+        max_id = conn.execute(text("SELECT COALESCE(max(id), 0) FROM products_legacy")).scalar()
+
+    columns = (
+        "price, quantity, price_old, price_new, discount, "
+        "promotion_detected, detected_keywords, promo_labels, parsed_at, timestamp"
+    )
+    copy_sql = text(
+        f"INSERT INTO observations (id, product_id, {columns}) "
+        f"SELECT l.id, p.id, {', '.join('l.' + c.strip() for c in columns.split(','))} "
+        f"FROM products_legacy l JOIN products p ON p.marketplace = {key} AND p.article = l.article "
+        "WHERE l.id > :lo AND l.id <= :hi"
+    )
+    while last_id < max_id:
+        with engine.begin() as conn:
+            conn.execute(copy_sql, {"lo": last_id, "hi": last_id + chunk_size})
+        last_id += chunk_size
+        logger.info(f"[MIGRATE] observations: перенесено до id {min(last_id, max_id)} из {max_id}")
+
+    with engine.begin() as conn:
+        if postgres:
+            # id перенесены явно — последовательность нужно сдвинуть
+            conn.execute(text(
+                "SELECT setval(pg_get_serial_sequence('observations', 'id'), "
+                "(SELECT COALESCE(max(id), 0) + 1 FROM observations), false)"
+            ))
+        conn.execute(text("DROP TABLE products_legacy"))
+
+
+def _observations_last_seen_at(engine):
+    """Колонка observations.last_seen_at для записи только изменений."""
+    if inspect(engine).has_table("observations") and "last_seen_at" not in _columns(engine, "observations"):
+        ddl = DateTime(timezone=True).compile(dialect=engine.dialect)
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE observations ADD COLUMN last_seen_at {ddl}"))
+
+
+def _product_latest(engine, chunk_size: int = 50000):
+    """
+    Таблица product_latest заполняется последним наблюдением (наибольший id)
+    каждого существующего товара, пачками по диапазонам products.id.
+    Возвращает False, если таблицы observations ещё нет.
+    """
+    if not inspect(engine).has_table("observations"):
+        return False
+    Base.metadata.create_all(bind=engine, tables=[ProductLatest.__table__])
+    product_columns = "marketplace, article, name, image_url, category"
+    observation_columns = (
+        "price, quantity, price_old, price_new, discount, promotion_detected, "
+        "detected_keywords, promo_labels, parsed_at, timestamp, last_seen_at"
+    )
+    fill_sql = text(
+        f"INSERT INTO product_latest (product_id, observation_id, {product_columns}, {observation_columns}) "
+        f"SELECT p.id, o.id, {', '.join('p.' + c.strip() for c in product_columns.split(','))}, "
+        f"{', '.join('o.' + c.strip() for c in observation_columns.split(','))} "
+        "FROM observations o JOIN products p ON p.id = o.product_id "
+        "WHERE o.id IN (SELECT max(id) FROM observations "
+        "WHERE product_id > :lo AND product_id <= :hi GROUP BY product_id) "
+        "AND NOT EXISTS (SELECT 1 FROM product_latest l WHERE l.product_id = p.id)"
+    )
+    with engine.connect() as conn:
+        max_id = conn.execute(text("SELECT COALESCE(max(id), 0) FROM products")).scalar()
+    last_id = 0
+    while last_id < max_id:
+        with engine.begin() as conn:
+            conn.execute(fill_sql, {"lo": last_id, "hi": last_id + chunk_size})
+        last_id += chunk_size
+        logger.info(f"[MIGRATE] product_latest: заполнено до товара {min(last_id, max_id)} из {max_id}")
+
+
+def _observations_keyset_index(engine):
+    """
+    Индекс observations (timestamp, id) для постраничной выдачи /products
+    вместо индекса только по timestamp (очистке хватает его префикса).
+    """
+    if not inspect(engine).has_table("observations"):
+        return False
+    _create_indexes(engine, "observations", [("ix_observations_timestamp_id", ("timestamp", "id"))],
+                    concurrently=not is_partitioned(engine))
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX IF EXISTS ix_observations_timestamp"))
+
+
+def _observations_seq(engine):
+    """
+    Колонка observations.seq (версия данных, в которой строка вставлена или
+    изменена) и индекс (seq, id) для ленты изменений /products/changes.
+    Существующие строки получают seq = 0: ADD COLUMN с постоянным значением
+    по умолчанию не переписывает таблицу.
+    """
+    if not inspect(engine).has_table("observations"):
+        return False
+    if "seq" not in _columns(engine, "observations"):
+        ddl = BigInteger().compile(dialect=engine.dialect)
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE observations ADD COLUMN seq {ddl} NOT NULL DEFAULT 0"))
+    _create_indexes(engine, "observations", [("ix_observations_seq_id", ("seq", "id"))],
+                    concurrently=not is_partitioned(engine))
+
+
+# (версия, имя, функция) в порядке применения
+MIGRATIONS = [
+    (1, "typed_numeric_columns", _typed_numeric_columns),
+    (2, "products_indexes", _products_indexes),
+    (3, "split_products_observations", _split_products),
+    (4, "observations_last_seen_at", _observations_last_seen_at),
+    (5, "partition_observations", partition_observations),
+    (6, "product_latest", _product_latest),
+    (7, "observations_keyset_index", _observations_keyset_index),
+    (8, "observations_seq", _observations_seq),
+]
+
+
+def run_migrations(engine) -> list[int]:
+    """Применяет миграции, которых ещё нет в schema_migrations. Возвращает их версии."""
+    SchemaMigration.__table__.create(bind=engine, checkfirst=True)
+    lock = None
+    if engine.dialect.name == "postgresql":
+        # блокировка уровня сессии; AUTOCOMMIT — чтобы соединение не держало открытую
+        # транзакцию, которую ждал бы CREATE INDEX CONCURRENTLY
+        lock = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+        lock.execute(text("SELECT pg_advisory_lock(:key)"), {"key": _LOCK_KEY})
+    try:
+        with engine.connect() as conn:
+            applied = set(conn.execute(select(SchemaMigration.version)).scalars())
+        done = []
+        for version, name, migrate in MIGRATIONS:
+            if version in applied:
+                continue
+            logger.info(f"[MIGRATE] применяется миграция {version}: {name}")
+            if migrate(engine) is False:
+                # таблицы, которую меняет миграция, ещё нет — повторим после create_all
+                logger.info(f"[MIGRATE] миграция {version} отложена")
+                continue
+            with engine.begin() as conn:
+                conn.execute(insert(SchemaMigration).values(version=version, name=name))
+            done.append(version)
+        return done
+    finally:
+        if lock is not None:
+            lock.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _LOCK_KEY})
+            lock.close()
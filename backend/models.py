@@ -1,31 +1,78 @@
 # backend/models.py
 
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, func
+from sqlalchemy import (
+    Column, Integer, BigInteger, String, Boolean, Date, DateTime, Float, Numeric, Index, ForeignKey, UniqueConstraint,
+    func, text,
+)
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import relationship, synonym
 
 Base = declarative_base()
 
 class Product(Base):
+    """
+    Товар маркетплейса: неизменяемые и редко меняющиеся поля (название,
+    изображение, категория). Ключ — (marketplace, article); товар без
+    маркетплейса хранится с marketplace = "". Цены и остатки — в Observation.
+    """
     __tablename__ = "products"
+    __table_args__ = (
+        UniqueConstraint("marketplace", "article", name="uq_products_marketplace_article"),
+        # поиск товара по артикулу без маркетплейса (история, отчёт по товару)
+        Index("ix_products_article", "article"),
+        # DISTINCT для /categories и /marketplaces, фильтры списка товаров
+        Index("ix_products_category", "category"),
+        Index("ix_products_marketplace", "marketplace"),
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, nullable=False)
+    id = Column(Integer, primary_key=True)
+    marketplace = Column(String, nullable=False, server_default="")
     article = Column(String, nullable=False)
-    price = Column(String, nullable=False)
-    quantity = Column(String, nullable=False)
+    name = Column(String, nullable=False)
     image_url = Column(String, nullable=True)
+    category = Column(String, nullable=True)
 
-    promotion_detected = Column(Boolean, default=False)
-    detected_keywords = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
-    # Поля для категории и маркетплейса
-    marketplace = Column(String, nullable=True)
-    category    = Column(String, nullable=True)
+    observations = relationship("Observation", back_populates="product", passive_deletes=True)
+
+    def __repr__(self):
+        return (
+            f"<Product(id={self.id!r}, marketplace={self.marketplace!r}, "
+            f"article={self.article!r}, name={self.name!r})>"
+        )
+
+
+class Observation(Base):
+    """
+    Наблюдение цены и остатка товара при очередном скрапинге.
+    Строка узкая: только числа, флаги и время, текст товара — в Product.
+    """
+    __tablename__ = "observations"
+    __table_args__ = (
+        # история товара: WHERE product_id = ? ORDER BY parsed_at, timestamp
+        Index("ix_observations_product_parsed_at", "product_id", "parsed_at", "timestamp"),
+        # очистка старых данных (WHERE timestamp < ?) и постраничная
+        # выдача /products (ORDER BY timestamp, id)
+        Index("ix_observations_timestamp_id", "timestamp", "id"),
+        # лента изменений /products/changes: WHERE (seq, id) > (?, ?) ORDER BY seq, id
+        Index("ix_observations_seq_id", "seq", "id"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
 
-    # Поля для хранения данных скидок и промо-лейблов
-    price_old    = Column(String, nullable=True)
-    price_new    = Column(String, nullable=True)
-    discount     = Column(String, nullable=True)
+    # asdecimal=False — ORM отдаёт float, а не Decimal
+    price = Column(Numeric(12, 2, asdecimal=False), nullable=True)
+    quantity = Column(Integer, nullable=True)
+    price_old = Column(Numeric(12, 2, asdecimal=False), nullable=True)
+    price_new = Column(Numeric(12, 2, asdecimal=False), nullable=True)
+    # скидка в процентах, без знака: 18 для "-18%"
+    discount = Column(Numeric(5, 2, asdecimal=False), nullable=True)
+
+    promotion_detected = Column(Boolean, default=False)
+    detected_keywords = Column(String, nullable=True)
     promo_labels = Column(String, nullable=True)
 
     parsed_at = Column(DateTime(timezone=True), nullable=True)
@@ -34,9 +81,207 @@ class Product(Base):
         server_default=func.now(),
         nullable=False
     )
+    # при записи только изменений: последний скрапинг, в котором значения
+    # не изменились; NULL — наблюдение видели один раз (в parsed_at)
+    last_seen_at = Column(DateTime(timezone=True), nullable=True)
+    # версия данных (ingest_version), в которой строка вставлена или последний
+    # раз изменена; 0 — строки, записанные до появления колонки
+    seq = Column(BigInteger, nullable=False, server_default=text("0"))
+
+    product = relationship("Product", back_populates="observations")
 
     def __repr__(self):
         return (
-            f"<Product(id={self.id!r}, name={self.name!r}, article={self.article!r}, "
+            f"<Observation(id={self.id!r}, product_id={self.product_id!r}, "
             f"price={self.price!r}, quantity={self.quantity!r})>"
         )
+
+
+class ProductLatest(Base):
+    """
+    Последнее наблюдение каждого товара вместе с полями товара: одна строка
+    на (marketplace, article). Обновляется upsert'ом в той же транзакции,
+    что и запись наблюдений (database._write_observations), поэтому список
+    текущих товаров читается без обхода истории.
+    """
+    __tablename__ = "product_latest"
+    __table_args__ = (
+        Index("ix_product_latest_category", "category"),
+    )
+
+    marketplace = Column(String, primary_key=True)
+    article = Column(String, primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False, unique=True)
+    # id наблюдения из observations; строка заменяется только более новым
+    observation_id = Column(Integer, nullable=False)
+
+    name = Column(String, nullable=False)
+    image_url = Column(String, nullable=True)
+    category = Column(String, nullable=True)
+
+    price = Column(Numeric(12, 2, asdecimal=False), nullable=True)
+    quantity = Column(Integer, nullable=True)
+    price_old = Column(Numeric(12, 2, asdecimal=False), nullable=True)
+    price_new = Column(Numeric(12, 2, asdecimal=False), nullable=True)
+    discount = Column(Numeric(5, 2, asdecimal=False), nullable=True)
+    promotion_detected = Column(Boolean, default=False)
+    detected_keywords = Column(String, nullable=True)
+    promo_labels = Column(String, nullable=True)
+
+    parsed_at = Column(DateTime(timezone=True), nullable=True)
+    timestamp = Column(DateTime(timezone=True), nullable=False)
+    last_seen_at = Column(DateTime(timezone=True), nullable=True)
+
+    # строка читается как наблюдение (ProductRecord.from_db): id — id наблюдения
+    id = synonym("observation_id")
+
+    def __repr__(self):
+        return (
+            f"<ProductLatest(marketplace={self.marketplace!r}, article={self.article!r}, "
+            f"observation_id={self.observation_id!r})>"
+        )
+
+
+class CrawlFrontier(Base):
+    """
+    Фронтир обхода дерева категорий: каждая строка — URL категории,
+    найденный краулером. Все строки обхода вместе образуют visited-set
+    (ключ — канонический URL), строки со статусом pending — очередь.
+    """
+    __tablename__ = "crawl_frontier"
+    __table_args__ = (
+        UniqueConstraint("crawl_id", "url_key", name="uq_crawl_frontier_url"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    crawl_id = Column(String, nullable=False, index=True)
+    url_key = Column(String, nullable=False)
+    url = Column(String, nullable=False)
+    depth = Column(Integer, nullable=False, default=0)
+    # pending → in_progress → done / failed
+    status = Column(String, nullable=False, default="pending", index=True)
+    products_found = Column(Integer, nullable=False, default=0)
+
+    discovered_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    def __repr__(self):
+        return (
+            f"<CrawlFrontier(crawl_id={self.crawl_id!r}, url={self.url!r}, "
+            f"depth={self.depth!r}, status={self.status!r})>"
+        )
+
+
+class PageSnapshot(Base):
+    """
+    Индекс хранилища сырых страниц: одна строка — один увиденный скрапером
+    ответ (HTML или JSON). Само содержимое лежит сжатым файлом, адресуемым
+    по sha256 (digest), поэтому одинаковые ответы хранятся один раз.
+    """
+    __tablename__ = "page_snapshots"
+
+    id = Column(Integer, primary_key=True, index=True)
+    digest = Column(String(64), nullable=False, index=True)
+    # ozon_composer, wb_category_html, wb_article_html, product_html
+    kind = Column(String, nullable=False, index=True)
+    url = Column(String, nullable=False)
+    marketplace = Column(String, nullable=True)
+    category = Column(String, nullable=True)
+    size = Column(Integer, nullable=False, default=0)
+    captured_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<PageSnapshot(kind={self.kind!r}, url={self.url!r}, digest={self.digest[:12]!r})>"
+
+
+class SchemaMigration(Base):
+    """Применённые миграции схемы (backend/migrations.py)."""
+    __tablename__ = "schema_migrations"
+
+    version = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    applied_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    def __repr__(self):
+        return f"<SchemaMigration(version={self.version!r}, name={self.name!r})>"
+
+
+class RetentionRun(Base):
+    """
+    Запуск очистки старых наблюдений (database.clean_old_data).
+    last_id — позиция обхода по первичному ключу: незавершённый
+    (completed = False) запуск продолжается со следующей строки.
+    """
+    __tablename__ = "retention_runs"
+
+    id = Column(Integer, primary_key=True)
+    started_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    cutoff = Column(DateTime(timezone=True), nullable=False)
+    rows_deleted = Column(Integer, nullable=False, default=0)
+    batches = Column(Integer, nullable=False, default=0)
+    last_id = Column(Integer, nullable=False, default=0)
+    completed = Column(Boolean, nullable=False, default=False)
+    duration_seconds = Column(Float, nullable=True)
+    # насколько очистка отстаёт: возраст самой старой оставшейся устаревшей строки
+    # относительно cutoff, в секундах (0 — всё устаревшее удалено)
+    lag_seconds = Column(Float, nullable=True)
+
+    def __repr__(self):
+        return (
+            f"<RetentionRun(id={self.id!r}, rows_deleted={self.rows_deleted!r}, "
+            f"completed={self.completed!r})>"
+        )
+
+
+class ServiceState(Base):
+    """
+    Служебные значения ключ → значение (водяные знаки фоновых задач и т. п.).
+    value — строка, структурированные значения хранятся в JSON.
+    """
+    __tablename__ = "service_state"
+
+    key = Column(String, primary_key=True)
+    value = Column(String, nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+    def __repr__(self):
+        return f"<ServiceState(key={self.key!r}, value={self.value!r})>"
+
+
+class Rollup(Base):
+    """
+    Агрегат наблюдений за день или неделю по артикулу или категории
+    (backend/rollups.py). Хранятся суммы и счётчики, а не средние и доли,
+    чтобы агрегаты можно было объединять (дни → недели, артикулы → категории,
+    маркетплейсы при чтении).
+    """
+    __tablename__ = "rollups"
+
+    # day | week
+    period = Column(String, primary_key=True)
+    # article | category
+    scope = Column(String, primary_key=True)
+    # артикул или категория
+    key = Column(String, primary_key=True)
+    marketplace = Column(String, primary_key=True)
+    # день или понедельник недели
+    bucket = Column(Date, primary_key=True)
+
+    # число пар (наблюдение, день): неизменное несколько дней наблюдение учитывается в каждом
+    observations = Column(Integer, nullable=False, default=0)
+    price_count = Column(Integer, nullable=False, default=0)
+    min_price = Column(Numeric(12, 2, asdecimal=False), nullable=True)
+    max_price = Column(Numeric(12, 2, asdecimal=False), nullable=True)
+    sum_price = Column(Numeric(18, 2, asdecimal=False), nullable=False, default=0)
+    last_price = Column(Numeric(12, 2, asdecimal=False), nullable=True)
+    last_at = Column(DateTime(timezone=True), nullable=True)
+    promo_count = Column(Integer, nullable=False, default=0)
+    min_quantity = Column(Integer, nullable=True)
+    max_quantity = Column(Integer, nullable=True)
+
+    def __repr__(self):
+        return (
+            f"<Rollup(period={self.period!r}, scope={self.scope!r}, key={self.key!r}, "
+            f"marketplace={self.marketplace!r}, bucket={self.bucket!r})>"
+        )
@@ -0,0 +1,143 @@
+# backend/normalize.py
+"""
+Единый разбор цен, скидок и остатков.
+
+Все регулярные выражения скомпилированы один раз. Поддерживаются:
+  - пробелы-разделители разрядов, включая NBSP (U+00A0), тонкий (U+2009)
+    и узкий неразрывный (U+202F) пробелы: "1 234 ₽";
+  - знаки валют и подписи: "₽", "руб.", "$", "€";
+  - десятичная запятая и точка, разделители разрядов "," и ".":
+    "1 234,50", "1,234.50", "1.234,50";
+  - проценты со знаком: "-18%", "18 %".
+
+Пакетные функции (parse_prices, parse_discounts, parse_quantities) принимают
+список или массив значений и возвращают numpy-массив чисел и маску валидности.
+"""
+import re
+import math
+
+import numpy as np
+
+# Первое число в строке: цифры, разделители разрядов и дробная часть
+_NUMBER_RE = re.compile(r"[-\u2212]?\d[\d\s\u00a0\u2009\u202f.,']*")
+# Пробелы всех видов и апостроф (швейцарский разделитель разрядов)
+_SPACES = dict.fromkeys(map(ord, " \t\n\r\u00a0\u2009\u202f'"), None)
+_DIGITS_RE = re.compile(r"\d+")
+
+
+def _to_float(token: str) -> float | None:
+    token = token.translate(_SPACES).rstrip(".,")
+    negative = token[:1] in ("-", "\u2212")
+    if negative:
+        token = token[1:]
+    comma, dot = token.rfind(","), token.rfind(".")
+    if comma != -1 and dot != -1:
+        # десятичный разделитель — тот, что стоит последним
+        if comma > dot:
+            token = token.replace(".", "").replace(",", ".")
+        else:
+            token = token.replace(",", "")
+    elif comma != -1:
+        # несколько запятых — разряды, одна — десятичная запятая
+        token = token.replace(",", "") if token.count(",") > 1 else token.replace(",", ".")
+    elif token.count(".") > 1:
+        token = token.replace(".", "")
+    try:
+        value = float(token)
+    except ValueError:
+        return None
+    return -value if negative else value
+
+
+def parse_price(value) -> float | None:
+    """
+    Цена из числа или строки ("1 234,50 ₽", "1,234.50$", 99) → float.
+    Возвращает None для пустых и неразборчивых значений.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        value = float(value)
+        return value if math.isfinite(value) else None
+    s = str(value)
+    try:
+        # быстрый путь для уже чистых строк ("1234.5")
+        value = float(s)
+        return value if math.isfinite(value) else None
+    except ValueError:
+        pass
+    m = _NUMBER_RE.search(s)
+    return _to_float(m.group()) if m else None
+
+
+def parse_discount(value) -> float | None:
+    """Скидка в процентах ("-18%", "18 %", 18) → 18.0; знак отбрасывается."""
+    pct = parse_price(value)
+    return abs(pct) if pct is not None else None
+
+
+def parse_quantity(value) -> int | None:
+    """
+    Остаток ("осталось 12 шт", "1 200", 7.0) → int.
+    Цифры склеиваются через пробелы-разделители; пустое значение → None.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        return int(value) if math.isfinite(value) else None
+    s = str(value)
+    if s.isdigit():
+        return int(s)
+    m = _NUMBER_RE.search(s)
+    if not m:
+        return None
+    digits = "".join(_DIGITS_RE.findall(m.group().split(",")[0].split(".")[0]))
+    return int(digits) if digits else None
+
+
+def _batch(parse, values, dtype, fill, vector=None):
+    """
+    Общая часть пакетного разбора. Уже числовые массивы обрабатываются
+    векторно (vector — преобразование numpy-массива), строки разбираются
+    один раз на уникальное значение.
+    """
+    arr = values if isinstance(values, np.ndarray) else np.asarray(values, dtype=object)
+    if arr.dtype.kind in "iuf":
+        mask = np.isfinite(arr) if arr.dtype.kind == "f" else np.ones(arr.shape, dtype=bool)
+        clean = np.where(mask, arr, 0)
+        out = (vector(clean) if vector else clean).astype(dtype)
+        out[~mask] = fill
+        return out, mask
+
+    cache: dict = {}
+    out = np.full(arr.shape, fill, dtype=dtype)
+    mask = np.zeros(arr.shape, dtype=bool)
+    flat_out, flat_mask = out.reshape(-1), mask.reshape(-1)
+    for i, v in enumerate(arr.reshape(-1).tolist()):
+        if type(v) is str:
+            parsed = cache.get(v, cache)
+            if parsed is cache:
+                parsed = cache[v] = parse(v)
+        else:
+            parsed = parse(v)
+        if parsed is not None:
+            flat_out[i] = parsed
+            flat_mask[i] = True
+    return out, mask
+
+
+def parse_prices(values) -> tuple[np.ndarray, np.ndarray]:
+    """Пакетный parse_price: (float64-массив с NaN на месте ошибок, маска валидности)."""
+    return _batch(parse_price, values, np.float64, np.nan)
+
+
+def parse_discounts(values) -> tuple[np.ndarray, np.ndarray]:
+    """Пакетный parse_discount: (float64-массив процентов, маска валидности)."""
+    return _batch(parse_discount, values, np.float64, np.nan, vector=np.abs)
+
+
+def parse_quantities(values) -> tuple[np.ndarray, np.ndarray]:
+    """Пакетный parse_quantity: (int64-массив с 0 на месте ошибок, маска валидности)."""
+    return _batch(parse_quantity, values, np.int64, 0, vector=np.trunc)
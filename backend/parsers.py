@@ -0,0 +1,170 @@
+# backend/parsers.py
+"""
+Извлечение товаров из сырых ответов маркетплейсов без браузера.
+
+Функции работают только с текстом/JSON, поэтому используются и в живом
+скрапинге, и при офлайн-перепарсинге сохранённых снимков (backend/snapshots.py).
+"""
+import re
+from datetime import datetime
+from html.parser import HTMLParser
+
+from backend.normalize import parse_price
+
+# HTML void-элементы не имеют закрывающего тега
+_VOID_TAGS = {"img", "br", "hr", "input", "meta", "link", "source", "wbr", "area", "col", "embed"}
+
+
+def parse_ozon_composer(payload: dict, limit: int, categories: list[str], parsed_at: str | None = None) -> list[dict]:
+    """
+    Разбирает ответ composer-API Ozon (виджет searchResultsV2) в список товаров.
+    """
+    parsed_at = parsed_at or datetime.utcnow().isoformat()
+    items = (
+        (payload or {})
+        .get("widgetStates", {})
+        .get("searchResultsV2", {})
+        .get("data", {})
+        .get("items", [])
+    )
+
+    products = []
+    for ent in items[:limit]:
+        e = ent.get("entity", {})
+        link      = e.get("link", "")
+        article   = str(e["id"]) if e.get("id") is not None else None
+        name      = e.get("title")
+        images    = e.get("images", [])
+        img_url   = images[0].get("url") if images else None
+        price_obj = e.get("price", {})
+        new_p     = price_obj.get("value")
+        old_p     = price_obj.get("oldValue")
+        disc      = price_obj.get("discount")
+        stock_obj = e.get("stock", {}).get("items", [])
+        qty       = stock_obj[0].get("count") if stock_obj else None
+        badges    = e.get("badges", [])
+        promo_lbl = [b.get("text") for b in badges if b.get("text")]
+
+        products.append({
+            "url":           f"https://www.ozon.ru{link}",
+            "name":          name,
+            "article":       article,
+            "price":         new_p,
+            "quantity":      qty,
+            "image_url":     img_url,
+            "marketplace":   "Ozon",
+            "category":      categories[0] if categories else None,
+            "price_new":     new_p,
+            "price_old":     old_p,
+            "discount":      f"{disc}%" if disc is not None else None,
+            "promo_labels":  promo_lbl,
+            "parsed_at":     parsed_at
+        })
+    return products
+
+
+class _WbCardsParser(HTMLParser):
+    """
+    Потоковый разбор HTML листинга WB (карточки div.product-card__wrapper)
+    без DOM браузера. Используется и при скрапинге, и при перепарсинге снимков.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.cards: list[dict] = []
+        self._card: dict | None = None
+        self._stack: list[tuple[str, set]] = []
+        self._card_depth = 0
+
+    def _inside(self, cls: str = None, tag: str = None) -> bool:
+        for t, classes in self._stack[self._card_depth:]:
+            if (cls is None or cls in classes) and (tag is None or t == tag):
+                return True
+        return False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = set((attrs.get("class") or "").split())
+
+        if self._card is None and tag == "div" and "product-card__wrapper" in classes:
+            self._card = {"href": "", "img": None, "brand": "", "name": "",
+                          "new": "", "old": "", "discount": "", "tips": []}
+            self._card_depth = len(self._stack)
+        elif self._card is not None:
+            if tag == "a" and "product-card__link" in classes and not self._card["href"]:
+                self._card["href"] = attrs.get("href") or ""
+            if tag == "img" and self._card["img"] is None:
+                self._card["img"] = attrs.get("src")
+
+        if tag not in _VOID_TAGS:
+            self._stack.append((tag, classes))
+
+    def handle_endtag(self, tag):
+        if tag in _VOID_TAGS:
+            return
+        # закрываем до ближайшего совпадающего тега (терпимо к кривой разметке)
+        for i in range(len(self._stack) - 1, -1, -1):
+            if self._stack[i][0] == tag:
+                del self._stack[i:]
+                break
+        if self._card is not None and len(self._stack) <= self._card_depth:
+            self.cards.append(self._card)
+            self._card = None
+
+    def handle_data(self, data):
+        if self._card is None:
+            return
+        if self._inside("product-card__brand"):
+            self._card["brand"] += data
+        elif self._inside("product-card__name"):
+            self._card["name"] += data
+        elif self._inside("price__lower-price", "ins"):
+            self._card["new"] += data
+        elif self._inside(tag="del"):
+            self._card["old"] += data
+        elif self._inside("percentage-sale"):
+            self._card["discount"] += data
+        elif self._inside("product-card__tip") and self._inside("product-card__tips--bottom"):
+            if data.strip():
+                self._card["tips"].append(data.strip())
+
+
+def parse_wb_category_html(html: str, limit: int, categories: list[str], parsed_at: str | None = None) -> list[dict]:
+    """
+    Разбирает HTML страницы листинга Wildberries в список товаров.
+    """
+    parsed_at = parsed_at or datetime.utcnow().isoformat()
+    parser = _WbCardsParser()
+    parser.feed(html or "")
+    parser.close()
+
+    products = []
+    for card in parser.cards[:limit]:
+        m = re.search(r"/catalog/(\d+)/", card["href"])
+        if not m:
+            continue
+        new_price = parse_price(card["new"])
+        old_price = parse_price(card["old"])
+        products.append({
+            "url":          card["href"],
+            "name":         f"{card['brand'].strip()} {card['name'].strip()}".strip(),
+            "article":      m.group(1),
+            "price":        new_price,
+            "quantity":     "",
+            "image_url":    card["img"],
+            "marketplace":  "Wildberries",
+            "category":     categories[0] if categories else None,
+            "price_new":    new_price,
+            "price_old":    old_price,
+            "discount":     card["discount"].strip() or None,
+            "promo_labels": card["tips"],
+            "parsed_at":    parsed_at
+        })
+    return products
+
+
+# Парсеры по типу снимка (см. SnapshotStore.put)
+PARSERS = {
+    "ozon_composer": parse_ozon_composer,
+    "wb_category_html": parse_wb_category_html,
+}
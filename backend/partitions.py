@@ -0,0 +1,217 @@
+# backend/partitions.py
+"""
+Помесячное секционирование таблицы observations (только PostgreSQL).
+
+observations секционируется по RANGE(timestamp): одна секция на месяц
+(observations_pYYYYMM) и секция по умолчанию observations_default для строк
+вне созданных диапазонов. Секции создаются заранее на months_ahead месяцев
+вперёд (init_db и ежедневная задача планировщика), а очистка старых данных
+отсоединяет или удаляет секцию целиком вместо DELETE по всей таблице.
+
+На SQLite секционирования нет: все функции модуля ничего не делают,
+а clean_old_data удаляет строки пачками.
+"""
+import logging
+from datetime import date, datetime
+
+from sqlalchemy import inspect, text
+
+from backend.models import Observation
+
+logger = logging.getLogger(__name__)
+
+TABLE = Observation.__tablename__
+DEFAULT_PARTITION = f"{TABLE}_default"
+
+
+def month_start(value: datetime | date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, n: int) -> date:
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{TABLE}_p{month:%Y%m}"
+
+
+def partition_month(name: str) -> date | None:
+    """Месяц секции по её имени; None для секции по умолчанию и чужих таблиц."""
+    prefix = f"{TABLE}_p"
+    suffix = name[len(prefix):]
+    if not name.startswith(prefix) or len(suffix) != 6 or not suffix.isdigit():
+        return None
+    return date(int(suffix[:4]), int(suffix[4:]), 1)
+
+
+def is_partitioned(engine) -> bool:
+    if engine.dialect.name != "postgresql":
+        return False
+    with engine.connect() as conn:
+        return conn.execute(text(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table pt "
+            "JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = :table)"
+        ), {"table": TABLE}).scalar()
+
+
+def list_partitions(conn) -> list[str]:
+    """Имена секций observations."""
+    return [name for (name,) in conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :table ORDER BY c.relname"
+    ), {"table": TABLE})]
+
+
+def _create_partitions(conn, first: date, last: date) -> list[str]:
+    existing = set(list_partitions(conn))
+    created = []
+    month = first
+    while month <= last:
+        name = partition_name(month)
+        if name not in existing:
+            conn.execute(text(
+                f"CREATE TABLE {name} PARTITION OF {TABLE} "
+                f"FOR VALUES FROM ('{month} 00:00:00+00') TO ('{add_months(month, 1)} 00:00:00+00')"
+            ))
+            created.append(name)
+        month = add_months(month, 1)
+    return created
+
+
+def ensure_future_partitions(engine, months_ahead: int = 3) -> list[str]:
+    """
+    Создаёт секции с текущего месяца на months_ahead месяцев вперёд.
+    Возвращает имена созданных секций.
+    """
+    if not is_partitioned(engine):
+        return []
+    current = month_start(datetime.utcnow())
+    with engine.begin() as conn:
+        created = _create_partitions(conn, current, add_months(current, months_ahead))
+    if created:
+        logger.info(f"[PARTITIONS] созданы секции: {', '.join(created)}")
+    return created
+
+
+def drop_old_partitions(engine, cutoff: datetime, detach_only: bool = False) -> int:
+    """
+    Отсоединяет (detach_only=True) или удаляет секции, целиком лежащие
+    до cutoff. Секция пропускается, если в ней есть наблюдения, продлённые
+    после cutoff (last_seen_at): их строки удаляет clean_old_data пачками.
+    Возвращает число строк в убранных секциях.
+    """
+    if not is_partitioned(engine):
+        return 0
+    removed = 0
+    with engine.connect() as conn:
+        names = list_partitions(conn)
+    for name in names:
+        month = partition_month(name)
+        if month is None or datetime.combine(add_months(month, 1), datetime.min.time()) > cutoff:
+            continue
+        with engine.begin() as conn:
+            live = conn.execute(
+                text(f"SELECT EXISTS (SELECT 1 FROM {name} WHERE last_seen_at >= :cutoff)"),
+                {"cutoff": cutoff},
+            ).scalar()
+            if live:
+                continue
+            rows = conn.execute(text(f"SELECT count(*) FROM {name}")).scalar()
+            conn.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {name}"))
+            if not detach_only:
+                conn.execute(text(f"DROP TABLE {name}"))
+        removed += rows
+        logger.info(f"[PARTITIONS] {'отсоединена' if detach_only else 'удалена'} секция {name}: {rows} строк")
+    return removed
+
+
+def _column_ddl(engine) -> list[str]:
+    """Определения колонок observations по модели (id — из общей последовательности)."""
+    quote = engine.dialect.identifier_preparer.quote
+    columns = []
+    for col in Observation.__table__.columns:
+        if col.name == "id":
+            columns.append(f"id INTEGER NOT NULL DEFAULT nextval('{TABLE}_id_seq')")
+            continue
+        ddl = f"{quote(col.name)} {col.type.compile(dialect=engine.dialect)}"
+        if col.server_default is not None:
+            ddl += f" DEFAULT {col.server_default.arg.compile(dialect=engine.dialect)}"
+        if not col.nullable:
+            ddl += " NOT NULL"
+        for fk in col.foreign_keys:
+            ddl += f" REFERENCES {fk.column.table.name} ({fk.column.name})"
+            if fk.ondelete:
+                ddl += f" ON DELETE {fk.ondelete}"
+        columns.append(ddl)
+    # первичный ключ секционированной таблицы обязан включать ключ секционирования
+    columns.append('PRIMARY KEY (id, "timestamp")')
+    return columns
+
+
+def partition_observations(engine, months_ahead: int = 3, chunk_size: int = 50000):
+    """
+    Миграция: обычная таблица observations → секционированная по месяцам.
+
+    1. observations переименовывается в observations_legacy, её индексы удаляются,
+       последовательность id отвязывается от старой таблицы;
+    2. создаётся секционированная observations с секциями от месяца самой
+       старой строки до months_ahead месяцев вперёд и секцией по умолчанию;
+    3. строки переносятся пачками по диапазонам id;
+    4. observations_legacy удаляется, последовательность привязывается к новой таблице.
+
+    Возвращает False, если таблицы observations ещё нет (миграция будет
+    применена после create_all).
+    """
+    if engine.dialect.name != "postgresql":
+        return None
+    insp = inspect(engine)
+    legacy = f"{TABLE}_legacy"
+    if not insp.has_table(legacy):
+        if not insp.has_table(TABLE):
+            return False
+        if is_partitioned(engine):
+            return None
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {TABLE} RENAME TO {legacy}"))
+            for ix in inspect(conn).get_indexes(legacy):
+                conn.execute(text(f"DROP INDEX {ix['name']}"))
+            conn.execute(text(f"ALTER INDEX IF EXISTS {TABLE}_pkey RENAME TO {legacy}_pkey"))
+            conn.execute(text(f"ALTER SEQUENCE {TABLE}_id_seq OWNED BY NONE"))
+
+    quote = engine.dialect.identifier_preparer.quote
+    # колонки, добавленные моделью позже этой миграции, заполняются значениями по умолчанию
+    legacy_columns = {c["name"] for c in inspect(engine).get_columns(legacy)}
+    columns = ", ".join(quote(c.name) for c in Observation.__table__.columns if c.name in legacy_columns)
+    with engine.begin() as conn:
+        if not is_partitioned(engine):
+            conn.execute(text(
+                f'CREATE TABLE {TABLE} ({", ".join(_column_ddl(engine))}) PARTITION BY RANGE ("timestamp")'
+            ))
+            conn.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT"))
+            for index in Observation.__table__.indexes:
+                cols = ", ".join(quote(c.name) for c in index.columns)
+                conn.execute(text(f"CREATE INDEX {index.name} ON {TABLE} ({cols})"))
+        oldest = conn.execute(text(f'SELECT min("timestamp") FROM {legacy}')).scalar()
+        current = month_start(datetime.utcnow())
+        _create_partitions(conn, month_start(oldest) if oldest else current, add_months(current, months_ahead))
+        last_id = conn.execute(text(f"SELECT COALESCE(max(id), 0) FROM {TABLE}")).scalar()
+        max_id = conn.execute(text(f"SELECT COALESCE(max(id), 0) FROM {legacy}")).scalar()
+
+    copy_sql = text(
+        f"INSERT INTO {TABLE} ({columns}) SELECT {columns} FROM {legacy} "
+        "WHERE id > :lo AND id <= :hi"
+    )
+    while last_id < max_id:
+        with engine.begin() as conn:
+            conn.execute(copy_sql, {"lo": last_id, "hi": last_id + chunk_size})
+        last_id += chunk_size
+        logger.info(f"[MIGRATE] {TABLE}: перенесено в секции до id {min(last_id, max_id)} из {max_id}")
+
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE {legacy}"))
+        conn.execute(text(f"ALTER SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id"))
+    return None
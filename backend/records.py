@@ -0,0 +1,217 @@
+# backend/records.py
+"""
+Типизированная запись о товаре, общая для скрапера, БД, экспорта и анализа.
+
+Скраперы отдают «сырые» словари, где цена может быть числом или строкой вида
+"1 234 ₽", а остаток — пустой строкой. ProductRecord.from_scraped разбирает
+их один раз на границе скрапера; дальше все слои работают с числами.
+"""
+from dataclasses import dataclass, asdict
+from datetime import datetime
+
+from backend.normalize import parse_price, parse_discount, parse_quantity
+
+
+# Поля наблюдения, изменение которых даёт новую строку observations
+# при записи только изменений (database.add_products(dedupe=True))
+TRACKED_FIELDS = (
+    "price", "quantity", "price_old", "price_new", "discount",
+    "promotion_detected", "promo_labels",
+)
+
+
+def _parse_labels(value) -> tuple[str, ...]:
+    if not value:
+        return ()
+    if isinstance(value, str):
+        value = value.split(";")
+    return tuple(v.strip() for v in value if v and str(v).strip())
+
+
+def _parse_datetime(value) -> datetime | None:
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def _parse_bool(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ("true", "1", "yes")
+    return bool(value)
+
+
+def format_number(value) -> str | None:
+    """Число → строка без лишнего ".0" (100.0 → "100", 99.5 → "99.5")."""
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+@dataclass(slots=True)
+class ProductRecord:
+    name: str = ""
+    article: str = ""
+    price: float | None = None
+    quantity: int | None = None
+    image_url: str | None = None
+    marketplace: str | None = None
+    category: str | None = None
+    price_old: float | None = None
+    price_new: float | None = None
+    discount: float | None = None
+    promo_labels: tuple[str, ...] = ()
+    promotion_detected: bool = False
+    detected_keywords: tuple[str, ...] = ()
+    parsed_at: datetime | None = None
+    url: str | None = None
+    # заполняются только для записей, прочитанных из БД
+    id: int | None = None
+    timestamp: datetime | None = None
+    # до какого момента наблюдение не менялось (запись только изменений)
+    last_seen_at: datetime | None = None
+
+    @classmethod
+    def from_scraped(cls, data: dict, marketplace: str | None = None,
+                     category: str | None = None) -> "ProductRecord":
+        """
+        Разбирает словарь скрапера (или строки CSV) в запись.
+        marketplace и category, если переданы, имеют приоритет над полями словаря.
+        """
+        labels = _parse_labels(data.get("promo_labels"))
+        analysis = data.get("promotion_analysis") or {}
+        keywords = _parse_labels(data.get("detected_keywords") or analysis.get("detected_keywords"))
+        if "promotion_detected" in data:
+            promo = _parse_bool(data["promotion_detected"])
+        elif "promotion_detected" in analysis:
+            promo = _parse_bool(analysis["promotion_detected"])
+        else:
+            promo = bool(data.get("discount") or labels)
+
+        return cls(
+            name=data.get("name") or "",
+            article=str(data.get("article") or ""),
+            price=parse_price(data.get("price")),
+            quantity=parse_quantity(data.get("quantity")),
+            image_url=data.get("image_url") or None,
+            marketplace=marketplace or data.get("marketplace") or None,
+            category=category or data.get("category") or None,
+            price_old=parse_price(data.get("price_old")),
+            price_new=parse_price(data.get("price_new")),
+            discount=parse_discount(data.get("discount")),
+            promo_labels=labels,
+            promotion_detected=promo,
+            detected_keywords=keywords or labels,
+            parsed_at=_parse_datetime(data.get("parsed_at")),
+            url=data.get("url"),
+            id=data.get("id"),
+            timestamp=_parse_datetime(data.get("timestamp")),
+            last_seen_at=_parse_datetime(data.get("last_seen_at")),
+        )
+
+    @classmethod
+    def coerce(cls, value) -> "ProductRecord":
+        """Запись как есть или разобранный словарь."""
+        return value if isinstance(value, cls) else cls.from_scraped(value)
+
+    @classmethod
+    def from_db(cls, product, observation) -> "ProductRecord":
+        """
+        Запись из строк таблиц products и observations
+        (или строки product_latest, переданной в оба аргумента).
+        """
+        return cls(
+            name=product.name,
+            article=product.article,
+            price=observation.price,
+            quantity=observation.quantity,
+            image_url=product.image_url,
+            marketplace=product.marketplace or None,
+            category=product.category,
+            price_old=observation.price_old,
+            price_new=observation.price_new,
+            discount=observation.discount,
+            promo_labels=_parse_labels(observation.promo_labels),
+            promotion_detected=bool(observation.promotion_detected),
+            detected_keywords=_parse_labels(observation.detected_keywords),
+            parsed_at=observation.parsed_at,
+            id=observation.id,
+            timestamp=observation.timestamp,
+            last_seen_at=observation.last_seen_at,
+        )
+
+    @property
+    def key(self) -> tuple[str, str]:
+        """Ключ товара в таблице products: (marketplace, article)."""
+        return (self.marketplace or "", self.article)
+
+    def to_product_row(self) -> dict:
+        """Значения колонок таблицы products (товар)."""
+        return {
+            "marketplace": self.marketplace or "",
+            "article": self.article,
+            "name": self.name,
+            "image_url": self.image_url,
+            "category": self.category,
+        }
+
+    def to_observation_row(self, product_id: int) -> dict:
+        """Значения колонок таблицы observations (наблюдение)."""
+        return {
+            "product_id": product_id,
+            "price": self.price,
+            "quantity": self.quantity,
+            "price_old": self.price_old,
+            "price_new": self.price_new,
+            "discount": self.discount,
+            "promotion_detected": self.promotion_detected,
+            "detected_keywords": ";".join(self.detected_keywords),
+            "promo_labels": ";".join(self.promo_labels),
+            "parsed_at": self.parsed_at,
+            "last_seen_at": self.last_seen_at,
+        }
+
+    def to_dict(self) -> dict:
+        """JSON-совместимое представление (даты в ISO, списки вместо кортежей)."""
+        d = asdict(self)
+        d["promo_labels"] = list(self.promo_labels)
+        d["detected_keywords"] = list(self.detected_keywords)
+        d["parsed_at"] = self.parsed_at.isoformat() if self.parsed_at else None
+        d["timestamp"] = self.timestamp.isoformat() if self.timestamp else None
+        d["last_seen_at"] = self.last_seen_at.isoformat() if self.last_seen_at else None
+        return d
+
+
+def row_to_dict(row) -> dict:
+    """
+    JSON-представление строки запроса с колонками по полям записи
+    (database._record_columns) — то же, что ProductRecord.from_db(row, row).to_dict(),
+    но без промежуточной записи. Даты остаются datetime: их сериализует
+    JSON-провайдер приложения (backend.json_provider).
+    """
+    return {
+        "name": row.name,
+        "article": row.article,
+        "price": row.price,
+        "quantity": row.quantity,
+        "image_url": row.image_url,
+        "marketplace": row.marketplace or None,
+        "category": row.category,
+        "price_old": row.price_old,
+        "price_new": row.price_new,
+        "discount": row.discount,
+        "promo_labels": list(_parse_labels(row.promo_labels)),
+        "promotion_detected": bool(row.promotion_detected),
+        "detected_keywords": list(_parse_labels(row.detected_keywords)),
+        "parsed_at": row.parsed_at,
+        "url": None,
+        "id": row.id,
+        "timestamp": row.timestamp,
+        "last_seen_at": row.last_seen_at,
+    }
@@ -0,0 +1,334 @@
+# backend/rollups.py
+"""
+Дневные и недельные агрегаты наблюдений по артикулам и категориям.
+
+update_rollups пересчитывает только корзины (период × артикул/категория ×
+день/неделя), затронутые с прошлого запуска: новые и продлённые записью
+только изменений наблюдения. Водяной знак — seq наблюдений (версия загрузки,
+см. database._bump_ingest_version): версия выдаётся под блокировкой строки
+service_state, поэтому seq растёт в порядке коммитов, и строка, закоммиченная
+позже, не окажется ниже водяного знака (в отличие от id). Водяной знак
+хранится в service_state, пересчёт корзины идемпотентен (удаление и вставка),
+поэтому прерванный запуск просто повторяется.
+
+Наблюдение, не менявшееся несколько дней, учитывается в каждом дне отрезка
+[parsed_at, last_seen_at]. Дневные агрегаты артикулов считаются из
+наблюдений, категории и недели собираются из дневных агрегатов артикулов.
+"""
+import json
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, or_
+
+from backend.database import SessionLocal, _utc
+from backend.models import Product, Observation, ServiceState, Rollup
+
+logger = logging.getLogger(__name__)
+
+PERIODS = ("day", "week")
+SCOPES = ("article", "category")
+WATERMARK_KEY = "rollups_watermark"
+
+# Колонки агрегата, которые объединяются при сборке корзин
+_AGGREGATE_FIELDS = (
+    "observations", "price_count", "min_price", "max_price", "sum_price",
+    "last_price", "last_at", "promo_count", "min_quantity", "max_quantity",
+)
+
+
+def week_start(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+
+def _days(first: date, last: date):
+    day = first
+    while day <= last:
+        yield day
+        day += timedelta(days=1)
+
+
+def _sample(price, quantity, promo, at: datetime) -> dict:
+    """Агрегат одного наблюдения за один день."""
+    return {
+        "observations": 1,
+        "price_count": int(price is not None),
+        "min_price": price,
+        "max_price": price,
+        "sum_price": price or 0,
+        "last_price": price,
+        "last_at": at,
+        "promo_count": int(bool(promo)),
+        "min_quantity": quantity,
+        "max_quantity": quantity,
+    }
+
+
+def _merge(parts: list[dict]) -> dict:
+    """Объединение агрегатов; last_price — у агрегата с наибольшим last_at."""
+    def pick(name, fn):
+        values = [p[name] for p in parts if p[name] is not None]
+        return fn(values) if values else None
+
+    def at(part):
+        return _utc(part["last_at"]) if part["last_at"] else datetime.min
+
+    # при равном времени побеждает более поздний по порядку агрегат
+    last = parts[0]
+    for part in parts[1:]:
+        if at(part) >= at(last):
+            last = part
+    return {
+        "observations": sum(p["observations"] for p in parts),
+        "price_count": sum(p["price_count"] for p in parts),
+        "min_price": pick("min_price", min),
+        "max_price": pick("max_price", max),
+        "sum_price": sum(p["sum_price"] or 0 for p in parts),
+        "last_price": last["last_price"],
+        "last_at": last["last_at"],
+        "promo_count": sum(p["promo_count"] for p in parts),
+        "min_quantity": pick("min_quantity", min),
+        "max_quantity": pick("max_quantity", max),
+    }
+
+
+def _parts(row) -> dict:
+    return {name: getattr(row, name) for name in _AGGREGATE_FIELDS}
+
+
+def _rebuild(session, period: str, scope: str, key: str, marketplace: str,
+             first: date, last: date, buckets: dict) -> int:
+    """Заменяет корзины [first, last] одного ряда агрегатами {корзина: [агрегаты]}."""
+    session.query(Rollup).filter(
+        Rollup.period == period, Rollup.scope == scope, Rollup.key == key,
+        Rollup.marketplace == marketplace, Rollup.bucket >= first, Rollup.bucket <= last,
+    ).delete(synchronize_session=False)
+    session.add_all(
+        Rollup(period=period, scope=scope, key=key, marketplace=marketplace, bucket=bucket, **_merge(parts))
+        for bucket, parts in buckets.items()
+    )
+    return len(buckets)
+
+
+def _load_watermark(session) -> dict:
+    state = session.get(ServiceState, WATERMARK_KEY)
+    value = json.loads(state.value) if state and state.value else {}
+    seen = value.get("last_seen_at")
+    obs_id = value.get("observation_id", 0)
+    seq = value.get("seq")
+    if seq is None:
+        # водяной знак старого формата (только id): всё до него уже посчитано
+        seq = session.query(func.max(Observation.seq)).filter(Observation.id <= obs_id).scalar() or 0
+    return {
+        "seq": seq,
+        "observation_id": obs_id,
+        "last_seen_at": datetime.fromisoformat(seen) if seen else None,
+    }
+
+
+def _touched_spans(session, watermark: dict, max_seq: int) -> tuple[dict, int, datetime | None]:
+    """
+    Товары, затронутые с водяного знака: {product_id: [первый день, последний день]},
+    наибольший id среди них и новое значение водяного знака по last_seen_at.
+    """
+    spans = {}
+    max_id = watermark["observation_id"]
+    seen_mark = watermark["last_seen_at"]
+
+    def touch(product_id, start, end):
+        first, last = _utc(start).date(), _utc(max(end, start, key=_utc)).date()
+        span = spans.setdefault(product_id, [first, last])
+        span[0], span[1] = min(span[0], first), max(span[1], last)
+
+    # продление наблюдения тоже переписывает его seq, поэтому один проход
+    # по seq находит и новые, и продлённые строки
+    for obs_id, product_id, parsed_at, timestamp, last_seen_at in (
+        session.query(Observation.id, Observation.product_id, Observation.parsed_at,
+                      Observation.timestamp, Observation.last_seen_at)
+        .filter(Observation.seq > watermark["seq"], Observation.seq <= max_seq)
+    ):
+        max_id = max(max_id, obs_id)
+        start = _utc(parsed_at or timestamp)
+        if last_seen_at is None:
+            touch(product_id, start, start)
+            continue
+        if obs_id <= watermark["observation_id"] and watermark["last_seen_at"]:
+            # продлённая строка: дни до прошлого водяного знака уже посчитаны
+            start = max(start, watermark["last_seen_at"])
+        touch(product_id, start, last_seen_at)
+        seen = _utc(last_seen_at)
+        seen_mark = max(seen_mark, seen) if seen_mark else seen
+    return spans, max_id, seen_mark
+
+
+def _rollup_articles(session, spans: dict, chunk_size: int) -> tuple[dict, int]:
+    """
+    Дневные агрегаты артикулов для затронутых товаров.
+    Возвращает затронутые категории {(marketplace, category): [первый, последний день]}
+    и число пересчитанных корзин.
+    """
+    categories = {}
+    written = 0
+    product_ids = sorted(spans)
+    for offset in range(0, len(product_ids), chunk_size):
+        chunk = product_ids[offset:offset + chunk_size]
+        first = min(spans[p][0] for p in chunk)
+        last = max(spans[p][1] for p in chunk)
+        products = {
+            p.id: p for p in
+            session.query(Product.id, Product.marketplace, Product.article, Product.category)
+            .filter(Product.id.in_(chunk))
+        }
+        buckets = defaultdict(lambda: defaultdict(list))
+        rows = (
+            session.query(Observation.product_id, Observation.price, Observation.quantity,
+                          Observation.promotion_detected, Observation.parsed_at,
+                          Observation.timestamp, Observation.last_seen_at)
+            .filter(
+                Observation.product_id.in_(chunk),
+                func.coalesce(Observation.parsed_at, Observation.timestamp) < last + timedelta(days=1),
+                or_(Observation.last_seen_at >= first, Observation.parsed_at >= first,
+                    Observation.timestamp >= first),
+            )
+            .order_by(Observation.id)
+        )
+        for obs in rows:
+            span_first, span_last = spans[obs.product_id]
+            start = _utc(obs.parsed_at or obs.timestamp)
+            end = max(_utc(obs.last_seen_at), start) if obs.last_seen_at else start
+            for day in _days(max(start.date(), span_first), min(end.date(), span_last)):
+                buckets[obs.product_id][day].append(
+                    _sample(obs.price, obs.quantity, obs.promotion_detected, start)
+                )
+
+        for product_id in chunk:
+            product = products.get(product_id)
+            if product is None:
+                continue
+            span_first, span_last = spans[product_id]
+            written += _rebuild(session, "day", "article", product.article, product.marketplace,
+                                span_first, span_last, buckets[product_id])
+            if product.category:
+                span = categories.setdefault((product.marketplace, product.category), [span_first, span_last])
+                span[0], span[1] = min(span[0], span_first), max(span[1], span_last)
+        session.commit()
+    return categories, written
+
+
+def _rollup_categories(session, categories: dict) -> int:
+    """Дневные агрегаты категорий из дневных агрегатов их артикулов."""
+    written = 0
+    for (marketplace, category), (first, last) in categories.items():
+        buckets = defaultdict(list)
+        rows = (
+            session.query(Rollup)
+            .join(Product, (Product.marketplace == Rollup.marketplace) & (Product.article == Rollup.key))
+            .filter(
+                Rollup.period == "day", Rollup.scope == "article", Rollup.marketplace == marketplace,
+                Product.category == category, Rollup.bucket >= first, Rollup.bucket <= last,
+            )
+        )
+        for row in rows:
+            buckets[row.bucket].append(_parts(row))
+        written += _rebuild(session, "day", "category", category, marketplace, first, last, buckets)
+    session.commit()
+    return written
+
+
+def _rollup_weeks(session, series: list[tuple[str, str, str, date, date]]) -> int:
+    """Недельные агрегаты рядов (scope, key, marketplace, первый день, последний день)."""
+    written = 0
+    for scope, key, marketplace, first, last in series:
+        first, last = week_start(first), week_start(last)
+        buckets = defaultdict(list)
+        rows = session.query(Rollup).filter(
+            Rollup.period == "day", Rollup.scope == scope, Rollup.key == key,
+            Rollup.marketplace == marketplace,
+            Rollup.bucket >= first, Rollup.bucket <= last + timedelta(days=6),
+        )
+        for row in rows:
+            buckets[week_start(row.bucket)].append(_parts(row))
+        written += _rebuild(session, "week", scope, key, marketplace, first, last, buckets)
+    session.commit()
+    return written
+
+
+def update_rollups(chunk_size: int = 500) -> dict:
+    """
+    Пересчитывает дневные и недельные агрегаты, затронутые с прошлого запуска,
+    и сдвигает водяной знак. Возвращает {"products": n, "buckets": n}.
+    """
+    session = SessionLocal()
+    try:
+        watermark = _load_watermark(session)
+        # seq ещё не закоммиченной загрузки не виден и больше max_seq:
+        # её строки попадут в следующий запуск
+        max_seq = session.query(func.max(Observation.seq)).scalar() or 0
+        spans, max_id, seen_mark = _touched_spans(session, watermark, max_seq)
+
+        categories, written = _rollup_articles(session, spans, chunk_size)
+        written += _rollup_categories(session, categories)
+
+        articles = {
+            (p.marketplace, p.article): spans[p.id]
+            for p in session.query(Product.id, Product.marketplace, Product.article)
+            .filter(Product.id.in_(list(spans)))
+        } if spans else {}
+        series = [("article", article, mp, first, last) for (mp, article), (first, last) in articles.items()]
+        series += [("category", cat, mp, first, last) for (mp, cat), (first, last) in categories.items()]
+        written += _rollup_weeks(session, series)
+
+        session.merge(ServiceState(key=WATERMARK_KEY, value=json.dumps({
+            "seq": max_seq,
+            "observation_id": max_id,
+            "last_seen_at": seen_mark.isoformat() if seen_mark else None,
+        })))
+        session.commit()
+        if spans:
+            logger.info(f"[ROLLUPS] пересчитано корзин: {written}, товаров: {len(spans)}")
+        return {"products": len(spans), "buckets": written}
+    finally:
+        session.close()
+
+
+def get_rollups(scope: str, key: str, period: str = "day", marketplace: str | None = None,
+                date_from: date | None = None, date_to: date | None = None) -> list[dict]:
+    """
+    Агрегаты ряда по возрастанию корзины. Без marketplace ряды всех
+    маркетплейсов с тем же артикулом или категорией объединяются.
+    """
+    if scope not in SCOPES:
+        raise ValueError(f"scope должен быть одним из {SCOPES}")
+    if period not in PERIODS:
+        raise ValueError(f"period должен быть одним из {PERIODS}")
+    session = SessionLocal()
+    try:
+        query = session.query(Rollup).filter(Rollup.period == period, Rollup.scope == scope, Rollup.key == key)
+        if marketplace is not None:
+            query = query.filter(Rollup.marketplace == marketplace)
+        if date_from:
+            query = query.filter(Rollup.bucket >= date_from)
+        if date_to:
+            query = query.filter(Rollup.bucket <= date_to)
+        buckets = defaultdict(list)
+        for row in query.order_by(Rollup.bucket):
+            buckets[row.bucket].append(_parts(row))
+
+        result = []
+        for bucket, parts in buckets.items():
+            agg = _merge(parts)
+            result.append({
+                "bucket": bucket.isoformat(),
+                "observations": agg["observations"],
+                "min_price": agg["min_price"],
+                "max_price": agg["max_price"],
+                "avg_price": round(agg["sum_price"] / agg["price_count"], 2) if agg["price_count"] else None,
+                "last_price": agg["last_price"],
+                "promo_share": round(agg["promo_count"] / agg["observations"], 4) if agg["observations"] else None,
+                "min_quantity": agg["min_quantity"],
+                "max_quantity": agg["max_quantity"],
+            })
+        return result
+    finally:
+        session.close()
@@ -3,8 +3,13 @@ import time
 import schedule
 from datetime import datetime
 import logging
-from backend.scraper import scrape_marketplace
-from backend.database import add_product, clean_old_data
+from backend.scraper import scrape_marketplace, refresh_marketplace
+from backend.database import save_scraped_products, clean_old_data, get_latest_observations, engine
+from backend.partitions import ensure_future_partitions
+from backend.rollups import update_rollups
+from backend.config_parser import STORAGE
+from backend.utils.marketplace_urls import build_search_url
+from backend.snapshots import get_snapshot_store
 
 logger = logging.getLogger(__name__)
 
@@ -14,7 +19,8 @@ SCRAPE_CONFIG = {
     "type":        "category", # "category" или "product"
     "query":       "хлебцы",
     "limit":       10,
-    "interval":    1           # раз в X дней
+    "interval":    1,          # раз в X дней
+    "mode":        "full"      # "full" или "listing_first" (страницы товаров только при изменениях)
 }
 
 def job_scrape_and_save():
@@ -23,38 +29,52 @@ def job_scrape_and_save():
     и сохраняет результаты в БД.
     """
     logger.info(f"Начинаем запланированный скрапинг: {datetime.utcnow().isoformat()}")
-    prods = scrape_marketplace(
-        f"https://www.ozon.ru/search/?text={SCRAPE_CONFIG['query']}"
-        if SCRAPE_CONFIG["type"] == "category"
-        else SCRAPE_CONFIG["query"],
-        category_filter=[SCRAPE_CONFIG["query"]] if SCRAPE_CONFIG["type"] == "category" else None,
-        article_filter=[SCRAPE_CONFIG["query"]]   if SCRAPE_CONFIG["type"] == "product"  else None,
-        limit=SCRAPE_CONFIG["limit"]
-    )
-    for p in prods:
-        product_data = {
-            "name": p.get("name", ""),
-            "article": p.get("article", ""),
-            "price": str(p.get("price", "")),
-            "quantity": str(p.get("quantity", "")),
-            "image_url": p.get("image_url", ""),
-            "promotion_detected": p.get("promotion_analysis", {}).get("promotion_detected", False),
-            "detected_keywords": ";".join(p.get("promotion_analysis", {}).get("detected_keywords", [])),
-            "price_old": p.get("price_old", ""),
-            "price_new": p.get("price_new", ""),
-            "discount": p.get("discount", ""),
-            "promo_labels": ";".join(p.get("promo_labels", [])),
-        }
-        add_product(product_data)
+    if SCRAPE_CONFIG.get("mode") == "listing_first" and SCRAPE_CONFIG["type"] == "category":
+        prods = refresh_marketplace(
+            build_search_url(SCRAPE_CONFIG["marketplace"], SCRAPE_CONFIG["query"]),
+            lookup=get_latest_observations,
+            category_filter=[SCRAPE_CONFIG["query"]],
+            limit=SCRAPE_CONFIG["limit"],
+            marketplace=SCRAPE_CONFIG["marketplace"]
+        )
+    else:
+        prods = scrape_marketplace(
+            f"https://www.ozon.ru/search/?text={SCRAPE_CONFIG['query']}"
+            if SCRAPE_CONFIG["type"] == "category"
+            else SCRAPE_CONFIG["query"],
+            category_filter=[SCRAPE_CONFIG["query"]] if SCRAPE_CONFIG["type"] == "category" else None,
+            article_filter=[SCRAPE_CONFIG["query"]]   if SCRAPE_CONFIG["type"] == "product"  else None,
+            limit=SCRAPE_CONFIG["limit"]
+        )
+    save_scraped_products(prods)
+    update_rollups()
     logger.info("Запланированный скрапинг завершён.")
 
 def job_cleanup():
     """
-    Задача: удаляет записи старше 60 дней.
+    Задача: создаёт секции observations на ближайшие месяцы (PostgreSQL)
+    и удаляет записи старше 60 дней пачками с паузами; не уложившаяся
+    в бюджет времени очистка продолжается при следующем запуске.
     """
+    ensure_future_partitions(engine, STORAGE.get("partition_months_ahead", 3))
     deleted = clean_old_data(60)
     logger.info(f"Очистка БД: удалено записей старше 60 дней: {deleted}")
 
+def job_rollups():
+    """
+    Задача: пересчитывает дневные и недельные агрегаты, затронутые
+    с прошлого запуска (в том числе загрузками через /import/csv и /start).
+    """
+    update_rollups()
+
+def job_prune_snapshots():
+    """
+    Задача: удаляет снимки страниц старше срока хранения из [SNAPSHOTS].
+    """
+    store = get_snapshot_store()
+    if store is not None:
+        store.prune()
+
 def start_scheduler():
     """
     Регистрирует задачи и запускает цикл schedule в фоновом потоке.
@@ -63,6 +83,10 @@ def start_scheduler():
     schedule.every(SCRAPE_CONFIG["interval"]).days.do(job_scrape_and_save).tag("scrape_job")
     # Ежедневная очистка в 03:00 UTC
     schedule.every().day.at("03:00").do(job_cleanup).tag("cleanup_job")
+    # Ежечасный пересчёт агрегатов для графиков
+    schedule.every().hour.do(job_rollups).tag("rollups_job")
+    # Ежедневная очистка хранилища снимков в 03:30 UTC
+    schedule.every().day.at("03:30").do(job_prune_snapshots).tag("snapshots_job")
 
     def run_loop():
         while True:
@@ -4,7 +4,7 @@ import tempfile
 from backend.app import app
 import backend.config_parser as config_parser
 import backend.scraper as scraper
-from backend.database import add_product
+from backend.database import add_products
 from backend.promo_detector import PromoDetector
 from backend.analysis import compare_product_data
 from backend.exporter import export_to_csv, export_to_pdf
@@ -21,7 +21,7 @@ def run_scheduled_analysis(config_path="config/config.conf"):
             products = scraper.scrape_marketplace(url,
                           category_filter=settings.get("SEARCH",{}).get("categories","").split(","))
             if settings.get("EXPORT",{}).get("save_to_db","False").lower()=="true":
-                for p in products: add_product(p)
+                add_products(products)
             all_products.extend(products)
         # экспорт файлов
         export_to_csv(all_products, "scheduled_products.csv")
@@ -5,7 +5,11 @@ import random
 from datetime import datetime
 from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
 from urllib.parse import urljoin
-from backend.utils.marketplace_urls import build_search_url, build_product_url
+from backend.utils.marketplace_urls import build_search_url, build_product_url, is_category_url
+from backend.analysis import listing_needs_detail
+from backend.parsers import parse_ozon_composer, parse_wb_category_html
+from backend.normalize import parse_price, parse_quantity
+from backend.snapshots import get_snapshot_store
 import requests
 import urllib.parse
 from datetime import datetime
@@ -18,7 +22,9 @@ def encodeURIComponent(x: str) -> str:
 
 
 class MarketplaceScraper:
-    def __init__(self):
+    def __init__(self, snapshots=None):
+        # Хранилище сырых страниц (HTML/JSON) для офлайн-перепарсинга; None — выключено
+        self._snapshots = snapshots if snapshots is not None else get_snapshot_store()
         self._pw = sync_playwright().start()
         self._browser = self._pw.chromium.launch(
             headless=True,
@@ -70,6 +76,26 @@ class MarketplaceScraper:
     def _human_delay(self, a=1, b=3):
         time.sleep(random.uniform(a,b))
 
+    def _snapshot(self, kind: str, url: str, payload, categories: list[str] | None = None):
+        """Сохраняет сырой ответ в хранилище снимков, если оно включено."""
+        if not self._snapshots:
+            return
+        try:
+            self._snapshots.put(kind, url, payload, category=(categories or [None])[0])
+        except Exception:
+            logger.exception(f"Не удалось сохранить снимок {kind} для {url}")
+
+    def _collect_category_links(self, page) -> list[str]:
+        """
+        Собирает со страницы ссылки на другие листинги (подкатегории) того же маркетплейса.
+        """
+        try:
+            hrefs = page.eval_on_selector_all("a[href]", "els => els.map(e => e.href)")
+        except Exception:
+            logger.warning("Не удалось собрать ссылки на подкатегории")
+            return []
+        return [h for h in dict.fromkeys(hrefs) if is_category_url(h)]
+
     def scrape_product(self, marketplace: str, url: str) -> dict:
         page = self._context.new_page()
         result = {
@@ -99,6 +125,8 @@ class MarketplaceScraper:
             t = random.uniform(15,60)
             logger.info(f"Human-like reading time: {t:.0f}s for {url}")
             time.sleep(t)
+            if self._snapshots:
+                self._snapshot("product_html", url, page.content())
 
             # общий блок: парсим meta description для названия и артикула, если Wildberries
             if "wildberries.ru" in url:
@@ -142,7 +170,7 @@ class MarketplaceScraper:
                         "> div.mo9_28.a2100-a.a2100-a3 > button > span > div > div.n1k_28.k2n_28 "
                         "> div > div > span"
                     ).text_content()
-                    result["price"] = float(re.sub(r"[^\d,\.]", "", price_text).replace(",", "."))
+                    result["price"] = parse_price(price_text)
                 except Exception:
                     pass
 
@@ -208,7 +236,7 @@ class MarketplaceScraper:
                         "> div.product-page__price-block.product-page__price-block--common "
                         "> div.product-page__price-block-wrap > div > div > div > p > span > span"
                     ).text_content()
-                    result["price"] = float(re.sub(r"[^\d,\.]", "", price_text).replace(",", "."))
+                    result["price"] = parse_price(price_text)
                 except Exception:
                     pass
 
@@ -234,8 +262,8 @@ class MarketplaceScraper:
                 # скидка расчет или селектор
                 if result.get("price_old") and result.get("price_new"):
                     try:
-                        old_f = float(re.sub(r"[^\d,\.]", "", result["price_old"]).replace(",", "."))
-                        new_f = float(re.sub(r"[^\d,\.]", "", result["price_new"]).replace(",", "."))
+                        old_f = parse_price(result["price_old"])
+                        new_f = parse_price(result["price_new"])
                         result["discount"] = f"{(old_f-new_f)/old_f*100:.0f}%"
                     except Exception:
                         pass
@@ -266,10 +294,12 @@ class MarketplaceScraper:
 
 
 
-    def _scrape_ozon_category_by_url(self, url: str, limit: int, marketplace: str, categories: list[str]):
+    def _scrape_ozon_category_by_url(self, url: str, limit: int, marketplace: str, categories: list[str],
+                                     discovered: list[str] | None = None):
         """
         Скрапинг категории Ozon по готовому URL через встроенный JSON-API в контексте
         браузера (чтобы автоматически передать все антибот-куки и заголовки).
+        Если передан список discovered, в него добавляются ссылки на подкатегории.
         """
         logger.info(f"[OZON-CAT] marketplace={marketplace!r}, categories={categories!r}")
         logger.info(f"[OZON-CAT] {url} ⏳")
@@ -285,6 +315,8 @@ class MarketplaceScraper:
             page.goto(url, timeout=30000)
             page.wait_for_load_state("networkidle", timeout=15000)
             self._human_scroll(page)
+            if discovered is not None:
+                discovered.extend(self._collect_category_links(page))
 
             # вытягиваем чистый путь без параметров
             category_path = url.split("?", 1)[0]
@@ -311,47 +343,8 @@ class MarketplaceScraper:
                 api_url
             )
 
-            # парсим ответ
-            items = (
-                payload
-                .get("widgetStates", {})
-                .get("searchResultsV2", {})
-                .get("data", {})
-                .get("items", [])
-            )
-
-            for ent in items[:limit]:
-                e = ent.get("entity", {})
-                link      = e.get("link", "")
-                article   = str(e.get("id")) or None
-                name      = e.get("title")
-                images    = e.get("images", [])
-                img_url   = images[0].get("url") if images else None
-                price_obj = e.get("price", {})
-                new_p     = price_obj.get("value")
-                old_p     = price_obj.get("oldValue")
-                disc      = price_obj.get("discount")
-                stock_obj = e.get("stock", {}).get("items", [])
-                qty       = stock_obj[0].get("count") if stock_obj else None
-                badges    = e.get("badges", [])
-                promo_lbl = [b.get("text") for b in badges if b.get("text")]
-
-                products.append({
-                    "url":           f"https://www.ozon.ru{link}",
-                    "name":          name,
-                    "article":       article,
-                    "price":         new_p,
-                    "quantity":      qty,
-                    "image_url":     img_url,
-                    "marketplace":   "Ozon",    # например "Wildberries" или "Ozon"
-                    "category":      categories[0],
-                    "price_new":     new_p,
-                    "price_old":     old_p,
-                    "discount":      f"{disc}%" if disc is not None else None,
-                    "promo_labels":  promo_lbl,
-                    "parsed_at":     datetime.utcnow().isoformat()
-                })
-
+            self._snapshot("ozon_composer", url, payload, categories)
+            products = parse_ozon_composer(payload, limit, categories)
         except Exception:
             logger.exception(f"Error scraping OZON category {url}")
         finally:
@@ -370,7 +363,8 @@ class MarketplaceScraper:
 
 
 
-    def _scrape_wb_category_by_url(self, url: str, limit: int, marketplace: str, categories: list[str]):
+    def _scrape_wb_category_by_url(self, url: str, limit: int, marketplace: str, categories: list[str],
+                                   discovered: list[str] | None = None):
         logger.info(f"[WB-CAT] marketplace={marketplace!r}, categories={categories!r}")
         logger.info(f"[WB-CAT] {url} ⏳")
         page = self._context.new_page()
@@ -383,83 +377,14 @@ class MarketplaceScraper:
             page.goto(url, timeout=30000)
             page.wait_for_load_state("networkidle", timeout=15000)
             self._human_scroll(page)
-
-            cards = page.locator("div.product-card__wrapper")
-            total = min(cards.count(), limit)
-            logger.info(f"[WB-CAT] found {total} cards")
-            
-            for i in range(total):
-                card = cards.nth(i)
-                # 1) Ссылка и артикул
-                href = card.locator("a.product-card__link").get_attribute("href") or ""
-                # вытаскиваем артикул из URL
-                m = re.search(r"/catalog/(\d+)/", href)
-                article = m.group(1) if m else None
-                #первое изображение
-                try:
-                    img = card.locator("img").nth(0).get_attribute("src")
-                except Exception:
-                    img = None
-                # название категории-товара
-                brand = card.locator("span.product-card__brand").text_content().strip() or ''
-                name_part = card.locator("span.product-card__name").text_content().strip() or ''
-                title = f"{brand} {name_part}".strip()
-                # 4) Новая (текущая) цена из <ins>
-                new_price = None
-                try:
-                    price_text = card.locator("ins.price__lower-price").text_content().strip()
-                    # убираем нечисловые символы и конвертим в float
-                    new_price = float(
-                      re.sub(r"[^\d,\.]", "",
-                        price_text.replace("\u00A0", "")
-                      ).replace(",", ".")
-                    )
-                except Exception:
-                    pass
-
-                # 5) Старая цена из <del>, если есть
-                old_price = None
-                if card.locator("del").count() > 0:
-                    try:
-                        old_text  = card.locator("del").text_content().strip()
-                        old_price = float(
-                          re.sub(r"[^\d,\.]", "",
-                            old_text.replace("\u00A0", "")
-                          ).replace(",", ".")
-                        )
-                    except Exception:
-                        pass
-
-                # 6) Процент скидки из <span class="percentage-sale">
-                discount = None
-                if card.locator("span.percentage-sale").count() > 0:
-                    discount = card.locator("span.percentage-sale").text_content().strip()
-                # 7) Промо-лейблы: любые теги .product-card__tip (sale, new, и т.д.)
-                promo_labels = card.locator("div.product-card__tips--bottom .product-card__tip").all_text_contents()
-                # убираем пустые строки
-                promo_labels = [t.strip() for t in promo_labels if t.strip()]
-
-                if article:
-                    products.append({
-                        "url":         href,
-                        "name":        title,
-                        "article":     article,
-                        "price":       new_price,
-                        "quantity":    "",           # WB в категории не показывает остатки
-                        "image_url":   img,
-                        "marketplace": "Wildberries",    # например "Wildberries" или "Ozon"
-                        "category":    categories[0],
-                        "price_new":   new_price,
-                        "price_old":   old_price,
-                        "discount":    discount,
-                        "promo_labels": promo_labels,
-                        "parsed_at":     datetime.utcnow().isoformat()
-                    })
-                else:
-                    logger.warning(f"[WB-CAT] не нашли артикул в карточке #{i}")
-
-                time.sleep(random.uniform(5, 30))
-
+            if discovered is not None:
+                discovered.extend(self._collect_category_links(page))
+            html = page.content()
+            if self._snapshots:
+                self._snapshot("wb_category_html", url, html, categories)
+            # карточки разбирает тот же парсер, что и при перепарсинге снимков
+            products = parse_wb_category_html(html, limit, categories)
+            logger.info(f"[WB-CAT] extracted {len(products)} items")
         except Exception:
             logger.exception(f"Error scraping WB category {url}")
         finally:
@@ -513,6 +438,7 @@ class MarketplaceScraper:
             page.goto(url, timeout=30000)
             page.wait_for_load_state("networkidle", timeout=15000)
             html = page.content()
+            self._snapshot("wb_article_html", url, html, categories)
             # --- DEBUG: raw HTML snippet around the category link ---
             start = html.find('<a class="product-page__category-link"')
             end = html.find('</a>', start) + 4 if start != -1 else -1
@@ -585,15 +511,13 @@ class MarketplaceScraper:
                     "span.price-block__wallet-price.red-price, span.price-block__current-price"
                 ).nth(0)
                 txt = sel.text_content().strip()
-                num = re.sub(r"[^\d,\.]+", "", txt).replace(",", ".")
-                result["price_new"] = float(num)
+                result["price_new"] = parse_price(txt)
                 result["price"] = result["price_new"]
             except Exception:
                 pass
             try:
                 old_txt = page.locator("del.price-block__old-price span").nth(0).text_content().strip()
-                old_num = re.sub(r"[^\d,\.]+", "", old_txt).replace(",", ".")
-                result["price_old"] = float(old_num)
+                result["price_old"] = parse_price(old_txt)
             except Exception:
                 pass
 
@@ -605,7 +529,7 @@ class MarketplaceScraper:
             # 7) Количество (если есть)
             try:
                 qty_txt = page.locator(".stock-count__text").text_content().strip()
-                result["quantity"] = re.sub(r"[^\d]", "", qty_txt)
+                result["quantity"] = parse_quantity(qty_txt)
             except Exception:
                 pass
 
@@ -639,6 +563,84 @@ class MarketplaceScraper:
 
 
 
+def _fetch_detail(mp: MarketplaceScraper, listing: dict, marketplace: str | None, categories: list[str]) -> dict:
+    """
+    Загружает страницу товара для карточки из листинга и дополняет её данными.
+    Непустые поля со страницы товара имеют приоритет над полями листинга.
+    """
+    mp_name = (listing.get("marketplace") or marketplace or "").lower()
+    is_wb = mp_name in ("wildberries", "wb", "вб") or "wildberries.ru" in (listing.get("url") or "")
+    url = listing.get("url") or build_product_url("wildberries" if is_wb else "ozon", listing["article"])
+
+    if is_wb:
+        detail = mp._scrape_wb_article(url, marketplace, categories)
+    else:
+        detail = mp.scrape_product("ozon", url)
+
+    merged = dict(listing)
+    for key, value in detail.items():
+        if value not in (None, "", []):
+            merged[key] = value
+    # артикул и категорию оставляем из листинга — по ним идёт сравнение с БД
+    merged["article"] = listing["article"]
+    if listing.get("category"):
+        merged["category"] = listing["category"]
+    return merged
+
+
+def refresh_marketplace(
+    url: str,
+    lookup,
+    category_filter: list[str] | None = None,
+    article_filter: list[str] | None = None,
+    limit: int = 10,
+    marketplace: str | None = None,
+):
+    """
+    Двухуровневое обновление: сначала листинг категории, затем страницы товаров
+    только для тех артикулов, у которых листинг показал изменение
+    (или в БД не хватает полей, например остатков).
+
+    lookup — функция (articles) -> {article: последнее сохранённое наблюдение},
+    обычно database.get_latest_observations.
+    Для неизменившихся товаров остатки переносятся из последнего наблюдения.
+    """
+    mp = MarketplaceScraper()
+    try:
+        categories = category_filter or []
+        if "ozon.ru/category/" in url:
+            listing = mp._scrape_ozon_category_by_url(url, limit, marketplace, categories)
+        elif "wildberries.ru/catalog/0/search.aspx" in url:
+            listing = mp._scrape_wb_category_by_url(url, limit, marketplace, categories)
+        else:
+            raise ValueError(f"Листинговое обновление поддерживает только URL категорий: {url}")
+
+        if article_filter:
+            listing = [p for p in listing if p.get("article") in article_filter]
+        listing = listing[:limit]
+        latest = lookup([p.get("article") for p in listing]) if listing else {}
+
+        prods = []
+        fetched = 0
+        for item in listing:
+            stored = latest.get(item.get("article"))
+            if listing_needs_detail(item, stored):
+                prods.append(_fetch_detail(mp, item, marketplace, categories))
+                fetched += 1
+            else:
+                if item.get("quantity") in (None, ""):
+                    item["quantity"] = stored.get("quantity")
+                prods.append(item)
+
+        logger.info(
+            f"[REFRESH] {url}: {len(listing)} в листинге, "
+            f"загружено страниц товара: {fetched}, пропущено: {len(listing) - fetched}"
+        )
+        return prods
+    finally:
+        mp.close()
+
+
 def scrape_marketplace(
     url: str,
     category_filter: list[str] | None = None,
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Запись наблюдений через add_products: время одной загрузки --rows товаров.
+
+Каждый прогон пишет тот же набор артикулов с новым parsed_at:
+- insert — обычная запись (каждая загрузка добавляет --rows наблюдений);
+- dedupe — запись только изменений (--changed доля товаров с новой ценой,
+  остальные наблюдения продлеваются).
+
+База берётся из DATABASE_URL; таблицы создаются, если их нет.
+
+    DATABASE_URL=sqlite:///bench_ingest.db python -m backend.scripts.bench_ingest --rows 10000
+"""
+import time
+import random
+import argparse
+import statistics
+from datetime import datetime, timedelta
+
+from backend.database import init_db, add_products
+from backend.records import ProductRecord
+
+
+def batch(rows: int, at: datetime, rnd: random.Random, changed: float) -> list[ProductRecord]:
+    """Записи уже разобраны: замеряется запись в БД, а не нормализация."""
+    return [
+        ProductRecord.from_scraped({
+            "name": f"товар {i}", "article": str(i),
+            "price": 100 + i % 500 + (rnd.randrange(1, 50) if rnd.random() < changed else 0),
+            "quantity": i % 300, "marketplace": ("Ozon", "Wildberries")[i % 2],
+            "category": f"категория {i % 50}", "parsed_at": at.isoformat(),
+        })
+        for i in range(rows)
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--changed", type=float, default=0.1, help="доля изменившихся товаров для dedupe")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    init_db()
+    rnd = random.Random(1)
+    at = datetime(2025, 1, 1)
+    for mode in ("insert", "dedupe"):
+        times = []
+        for _ in range(args.repeat):
+            at += timedelta(hours=1)
+            records = batch(args.rows, at, rnd, args.changed)
+            t = time.perf_counter()
+            stats = add_products(records, batch_size=args.batch_size, dedupe=mode == "dedupe")
+            times.append(time.perf_counter() - t)
+        print(f"{mode:7} {args.rows} строк: медиана {statistics.median(times) * 1000:.0f} мс "
+              f"(вставлено {stats['inserted']}, без изменений {stats['unchanged']})")
+
+
+if __name__ == "__main__":
+    main()
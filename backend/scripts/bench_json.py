@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Сериализация полного списка /products: прежний путь против быстрого.
+
+- прежний: ORM-объекты Product и Observation → ProductRecord.from_db →
+  to_dict (isoformat по строкам) → стандартный JSON-провайдер Flask;
+- новый: кортежи колонок (iter_products(as_dicts=True)) → records.row_to_dict →
+  backend.json_provider.FastJSONProvider (orjson, если установлен).
+
+База берётся из DATABASE_URL; если в ней меньше --rows наблюдений,
+недостающие добавляются синтетическими (add_products).
+
+    DATABASE_URL=sqlite:///bench_json.db python -m backend.scripts.bench_json --rows 100000
+"""
+import time
+import random
+import argparse
+import statistics
+from datetime import datetime, timedelta
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from backend.database import init_db, add_products, iter_products, SessionLocal
+from backend.json_provider import FastJSONProvider, orjson
+from backend.models import Product, Observation
+from backend.records import ProductRecord
+
+
+def fill(rows: int):
+    session = SessionLocal()
+    try:
+        existing = session.query(Observation).count()
+    finally:
+        session.close()
+    rnd = random.Random(1)
+    start = datetime(2025, 1, 1)
+    missing = max(0, rows - existing)
+    add_products(
+        {
+            "name": f"товар {i % 5000}", "article": str(i % 5000),
+            "price": round(rnd.uniform(50, 5000), 2), "quantity": rnd.randrange(500),
+            "marketplace": rnd.choice(("Ozon", "Wildberries")),
+            "category": f"категория {rnd.randrange(50)}", "promo_labels": "скидка",
+            "parsed_at": (start + timedelta(seconds=rnd.randrange(365 * 86400))).isoformat(),
+        }
+        for i in range(missing)
+    )
+    return existing, missing
+
+
+def legacy_payload() -> list[dict]:
+    session = SessionLocal()
+    try:
+        rows = (
+            session.query(Product, Observation)
+            .join(Observation.product)
+            .order_by(Observation.timestamp, Observation.id)
+            .all()
+        )
+        return [ProductRecord.from_db(*row).to_dict() for row in rows]
+    finally:
+        session.close()
+
+
+def fast_payload() -> list[dict]:
+    return list(iter_products(as_dicts=True))
+
+
+def measure(app, build, repeat: int) -> tuple[float, float, int]:
+    """Медианы (чтение+словари, сериализация) в мс и размер тела в байтах."""
+    build_times, dump_times, size = [], [], 0
+    with app.app_context():
+        for _ in range(repeat):
+            t = time.perf_counter()
+            payload = build()
+            build_times.append(time.perf_counter() - t)
+            t = time.perf_counter()
+            body = app.json.response(payload).get_data()
+            dump_times.append(time.perf_counter() - t)
+            size = len(body)
+    return statistics.median(build_times) * 1000, statistics.median(dump_times) * 1000, size
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=100_000)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    init_db()
+    existing, added = fill(args.rows)
+    print(f"наблюдений: {existing + added} (добавлено {added}); orjson: {'да' if orjson else 'нет'}")
+
+    legacy_app = Flask("legacy")
+    legacy_app.json = DefaultJSONProvider(legacy_app)
+    fast_app = Flask("fast")
+    fast_app.json = FastJSONProvider(fast_app)
+
+    results = {
+        "прежний (ORM + to_dict + json)": measure(legacy_app, legacy_payload, args.repeat),
+        "новый (кортежи + row_to_dict + provider)": measure(fast_app, fast_payload, args.repeat),
+    }
+    print(f"медиана из {args.repeat} запусков")
+    print(f"{'путь':42} {'строки, мс':>11} {'JSON, мс':>10} {'итого, мс':>10} {'байт':>12}")
+    for name, (build, dump, size) in results.items():
+        print(f"{name:42} {build:11.1f} {dump:10.1f} {build + dump:10.1f} {size:12}")
+
+
+if __name__ == "__main__":
+    main()
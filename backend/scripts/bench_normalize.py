@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Сравнение разбора цен: прежний inline-вариант из scraper.py
+(re.sub на каждый вызов) против backend.normalize.parse_prices.
+
+    python -m backend.scripts.bench_normalize --n 1000000
+"""
+import re
+import time
+import random
+import argparse
+
+from backend.normalize import parse_price, parse_prices
+
+
+def legacy_parse(text: str):
+    try:
+        return float(re.sub(r"[^\d,\.]", "", text).replace(",", "."))
+    except Exception:
+        return None
+
+
+def make_samples(n: int, unique: int) -> list[str]:
+    rnd = random.Random(42)
+    formats = [
+        lambda v: f"{v:,.0f} ₽".replace(",", " "),
+        lambda v: f"{v:,.2f}".replace(",", " ").replace(".", ",") + " руб.",
+        lambda v: f"{v:.2f}",
+        lambda v: f"{v:,.2f}$",
+        lambda v: f"{v:,.0f}".replace(",", " ") + " ₽",
+    ]
+    pool = [rnd.choice(formats)(rnd.uniform(10, 250_000)) for _ in range(unique)]
+    return [rnd.choice(pool) for _ in range(n)]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=1_000_000)
+    ap.add_argument("--unique", type=int, default=50_000, help="число различных строк в выборке")
+    args = ap.parse_args()
+
+    samples = make_samples(args.n, args.unique)
+
+    t = time.perf_counter()
+    legacy = [legacy_parse(s) for s in samples]
+    t_legacy = time.perf_counter() - t
+
+    t = time.perf_counter()
+    single = [parse_price(s) for s in samples]
+    t_single = time.perf_counter() - t
+
+    t = time.perf_counter()
+    values, mask = parse_prices(samples)
+    t_batch = time.perf_counter() - t
+
+    legacy_ok = sum(1 for v in legacy if v is not None)
+    print(f"строк: {args.n}, уникальных: {args.unique}")
+    print(f"inline re.sub:        {t_legacy:6.2f} c, разобрано {legacy_ok}")
+    print(f"parse_price (цикл):   {t_single:6.2f} c, разобрано {sum(v is not None for v in single)}")
+    print(f"parse_prices (пакет): {t_batch:6.2f} c, разобрано {int(mask.sum())}")
+
+
+if __name__ == "__main__":
+    main()
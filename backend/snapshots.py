@@ -0,0 +1,285 @@
+# backend/snapshots.py
+"""
+Хранилище сырых страниц и офлайн-перепарсинг.
+
+Каждый HTML/JSON-ответ, увиденный скрапером, сжимается gzip и сохраняется
+в файл <path>/<ab>/<sha256>.gz; одинаковые ответы хранятся один раз.
+Метаданные (тип, URL, категория, время) пишутся в таблицу page_snapshots.
+
+Перепарсинг прогоняет парсеры из backend/parsers.py по сохранённым снимкам
+параллельно на всех ядрах, без браузера:
+
+    python -m backend.snapshots reparse --kind ozon_composer --since 2025-05-01 --save
+    python -m backend.snapshots prune
+"""
+import os
+import gzip
+import json
+import time
+import hashlib
+import logging
+import argparse
+import tempfile
+import urllib.parse
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+from backend.database import SessionLocal, save_scraped_products
+from backend.models import PageSnapshot
+from backend.parsers import PARSERS
+
+logger = logging.getLogger(__name__)
+
+# Типы снимков, содержимое которых — JSON
+JSON_KINDS = {"ozon_composer"}
+
+
+class SnapshotStore:
+    def __init__(self, path: str, retention_days: int = 30, compress_level: int = 6):
+        self.path = path
+        self.retention_days = retention_days
+        self.compress_level = compress_level
+        os.makedirs(self.path, exist_ok=True)
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.path, digest[:2], f"{digest}.gz")
+
+    def _write_blob(self, blob: str, raw: bytes):
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(blob), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(gzip.compress(raw, compresslevel=self.compress_level))
+            os.replace(tmp, blob)
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def put(self, kind: str, url: str, payload, category: str | None = None,
+            captured_at: datetime | None = None) -> str:
+        """
+        Сохраняет ответ и возвращает его sha256. Содержимое пишется атомарно
+        (через временный файл), повторы того же содержимого не занимают места.
+        Время изменения файла — время последнего снимка с этим содержимым:
+        prune не удаляет файлы новее срока хранения, даже если запись о снимке
+        ещё не зафиксирована.
+        """
+        if isinstance(payload, (dict, list)):
+            raw = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        elif isinstance(payload, bytes):
+            raw = payload
+        else:
+            raw = str(payload).encode("utf-8")
+        digest = hashlib.sha256(raw).hexdigest()
+
+        blob = self._blob_path(digest)
+        seen = captured_at.replace(tzinfo=timezone.utc).timestamp() if captured_at else time.time()
+        try:
+            # файл уже есть — продлеваем его время (prune мог убрать его из-под
+            # имени, тогда FileNotFoundError и файл пишется заново)
+            seen = max(seen, os.stat(blob).st_mtime)
+            os.utime(blob, (seen, seen))
+        except FileNotFoundError:
+            self._write_blob(blob, raw)
+            os.utime(blob, (seen, seen))
+
+        host = urllib.parse.urlsplit(url).netloc.lower()
+        marketplace = "Ozon" if "ozon.ru" in host else "Wildberries" if "wildberries.ru" in host else None
+
+        session = SessionLocal()
+        try:
+            snap = PageSnapshot(
+                digest=digest, kind=kind, url=url, marketplace=marketplace,
+                category=category, size=len(raw),
+            )
+            if captured_at:
+                snap.captured_at = captured_at
+            session.add(snap)
+            session.commit()
+        finally:
+            session.close()
+        return digest
+
+    def load(self, digest: str, kind: str | None = None):
+        """Читает снимок; для JSON-типов возвращает разобранный объект."""
+        with open(self._blob_path(digest), "rb") as f:
+            text = gzip.decompress(f.read()).decode("utf-8")
+        return json.loads(text) if kind in JSON_KINDS else text
+
+    def _in_use(self, digest: str, path: str, cutoff: datetime) -> bool:
+        """Есть ли запись со ссылкой на файл или сам файл новее cutoff."""
+        if os.stat(path).st_mtime >= cutoff.replace(tzinfo=timezone.utc).timestamp():
+            return True
+        session = SessionLocal()
+        try:
+            return session.query(PageSnapshot.id).filter(PageSnapshot.digest == digest).first() is not None
+        finally:
+            session.close()
+
+    def _remove_blob(self, digest: str, cutoff: datetime) -> bool:
+        """
+        Удаляет файл без ссылок. Файл сначала переименовывается, и проверка
+        повторяется: put, успевший продлить файл или записать ссылку, его
+        сохранит, а put после переименования запишет файл заново.
+        """
+        blob = self._blob_path(digest)
+        try:
+            if self._in_use(digest, blob, cutoff):
+                return False
+            doomed = f"{blob}.{os.getpid()}.prune"
+            os.rename(blob, doomed)
+        except FileNotFoundError:
+            return False
+        if self._in_use(digest, doomed, cutoff):
+            os.replace(doomed, blob)
+            return False
+        os.remove(doomed)
+        return True
+
+    def prune(self, retention_days: int | None = None) -> dict:
+        """
+        Удаляет записи старше срока хранения и файлы, на которые
+        больше не ссылается ни одна запись (и которые не новее срока хранения).
+        """
+        days = self.retention_days if retention_days is None else retention_days
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        session = SessionLocal()
+        try:
+            digests = {
+                d for (d,) in session.query(PageSnapshot.digest)
+                .filter(PageSnapshot.captured_at < cutoff)
+                .distinct()
+            }
+            rows = (
+                session.query(PageSnapshot)
+                .filter(PageSnapshot.captured_at < cutoff)
+                .delete(synchronize_session=False)
+            )
+            session.commit()
+        finally:
+            session.close()
+
+        blobs = sum(self._remove_blob(digest, cutoff) for digest in digests)
+        logger.info(f"[SNAPSHOTS] удалено записей: {rows}, файлов: {blobs}")
+        return {"rows": rows, "blobs": blobs}
+
+
+_store: SnapshotStore | None = None
+
+
+def get_snapshot_store() -> SnapshotStore | None:
+    """
+    Хранилище из секции [SNAPSHOTS] конфига или None, если оно выключено.
+    """
+    global _store
+    from backend.config_parser import SNAPSHOTS
+    if not SNAPSHOTS.get("enabled"):
+        return None
+    if _store is None:
+        _store = SnapshotStore(SNAPSHOTS["path"], SNAPSHOTS.get("retention_days", 30))
+    return _store
+
+
+def _reparse_one(task: tuple) -> list[dict]:
+    """Разбирает один снимок (выполняется в дочернем процессе)."""
+    path, digest, kind, category, captured_at = task
+    store = SnapshotStore(path)
+    payload = store.load(digest, kind)
+    return PARSERS[kind](payload, 10**6, [category] if category else [], parsed_at=captured_at)
+
+
+def reparse_snapshots(
+    store: SnapshotStore,
+    kinds: list[str] | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    workers: int | None = None,
+    on_products=None,
+    batch_size: int = 500,
+) -> dict:
+    """
+    Перепарсивает сохранённые снимки текущими парсерами.
+    Снимки читаются из индекса пачками по batch_size (по возрастанию id),
+    разбор идёт в пуле процессов. on_products(products) вызывается в основном
+    процессе для каждого снимка — например, для дозаписи истории в БД.
+    Снимки без офлайн-парсера (страницы товаров) пропускаются.
+    """
+    kinds = [k for k in (kinds or PARSERS) if k in PARSERS]
+    stats = {"snapshots": 0, "products": 0, "failed": 0}
+    last_id = 0
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        while True:
+            session = SessionLocal()
+            try:
+                q = (
+                    session.query(PageSnapshot.id, PageSnapshot.digest, PageSnapshot.kind,
+                                  PageSnapshot.category, PageSnapshot.captured_at)
+                    .filter(PageSnapshot.id > last_id, PageSnapshot.kind.in_(kinds))
+                )
+                if since:
+                    q = q.filter(PageSnapshot.captured_at >= since)
+                if until:
+                    q = q.filter(PageSnapshot.captured_at < until)
+                batch = q.order_by(PageSnapshot.id).limit(batch_size).all()
+            finally:
+                session.close()
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            tasks = [
+                (store.path, r.digest, r.kind, r.category, r.captured_at.isoformat())
+                for r in batch
+            ]
+            futures = [pool.submit(_reparse_one, t) for t in tasks]
+            for task, fut in zip(tasks, futures):
+                try:
+                    products = fut.result()
+                except Exception as e:
+                    logger.error(f"[SNAPSHOTS] не удалось разобрать {task[1][:12]} ({task[2]}): {e}")
+                    stats["failed"] += 1
+                    continue
+                stats["snapshots"] += 1
+                stats["products"] += len(products)
+                if on_products and products:
+                    on_products(products)
+
+    logger.info(f"[SNAPSHOTS] перепарсинг завершён: {stats}")
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Хранилище снимков страниц маркетплейсов")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rp = sub.add_parser("reparse", help="перепарсить сохранённые снимки")
+    rp.add_argument("--kind", action="append", choices=sorted(PARSERS), help="тип снимка (можно несколько)")
+    rp.add_argument("--since", type=datetime.fromisoformat, help="с даты (ISO)")
+    rp.add_argument("--until", type=datetime.fromisoformat, help="по дату (ISO, не включая)")
+    rp.add_argument("--workers", type=int, default=None, help="число процессов (по умолчанию — все ядра)")
+    rp.add_argument("--save", action="store_true", help="записать полученные товары в БД")
+
+    pr = sub.add_parser("prune", help="удалить снимки старше срока хранения")
+    pr.add_argument("--days", type=int, default=None)
+
+    args = parser.parse_args(argv)
+    store = get_snapshot_store()
+    if store is None:
+        parser.error("хранилище снимков выключено: включите [SNAPSHOTS] enabled в конфиге")
+
+    if args.command == "reparse":
+        stats = reparse_snapshots(
+            store, kinds=args.kind, since=args.since, until=args.until, workers=args.workers,
+            # снимки, уже записанные в историю при скрапинге, не дублируются
+            on_products=partial(save_scraped_products, skip_existing=True) if args.save else None,
+        )
+    else:
+        stats = store.prune(args.days)
+    print(json.dumps(stats, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,84 @@
+# backend/streaming.py
+"""
+Потоковая выдача больших списков записей.
+
+JSON-массив, NDJSON и CSV формируются по мере чтения записей из БД
+(database.iter_products) фрагментами по CHUNK_ROWS записей, поэтому память
+сервера не зависит от числа строк, а первый байт уходит клиенту сразу.
+"""
+import csv
+import io
+
+from backend.records import format_number
+
+# Сколько записей собирается в один фрагмент ответа
+CHUNK_ROWS = 500
+
+CSV_FIELDS = [
+    "id", "name", "article", "price", "quantity", "image_url",
+    "price_old", "price_new", "discount", "promo_labels",
+    "promotion_detected", "detected_keywords", "parsed_at", "timestamp",
+]
+
+
+def _chunks(records, dumps, chunk_rows: int):
+    chunk = []
+    for record in records:
+        # ProductRecord или уже готовый словарь (database.iter_products(as_dicts=True))
+        chunk.append(dumps(record if isinstance(record, dict) else record.to_dict()))
+        if len(chunk) >= chunk_rows:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def json_array(records, dumps, chunk_rows: int = CHUNK_ROWS):
+    """JSON-массив записей: "[", записи через запятую, "]"."""
+    yield "["
+    separator = ""
+    for chunk in _chunks(records, dumps, chunk_rows):
+        yield separator + ",".join(chunk)
+        separator = ","
+    yield "]"
+
+
+def ndjson(records, dumps, chunk_rows: int = CHUNK_ROWS):
+    """NDJSON: по одной записи на строку."""
+    for chunk in _chunks(records, dumps, chunk_rows):
+        yield "\n".join(chunk) + "\n"
+
+
+def csv_row(record) -> dict:
+    """Строка CSV-выгрузки из ProductRecord."""
+    return {
+        "id": record.id,
+        "name": record.name,
+        "article": record.article,
+        "price": format_number(record.price),
+        "quantity": record.quantity,
+        "image_url": record.image_url,
+        "price_old": format_number(record.price_old),
+        "price_new": format_number(record.price_new),
+        "discount": format_number(record.discount),
+        "promo_labels": ";".join(record.promo_labels),
+        "promotion_detected": record.promotion_detected,
+        "detected_keywords": ";".join(record.detected_keywords),
+        "parsed_at": record.parsed_at.isoformat() if record.parsed_at else "",
+        "timestamp": record.timestamp.isoformat() if record.timestamp else "",
+    }
+
+
+def csv_lines(records, chunk_rows: int = CHUNK_ROWS):
+    """CSV с BOM (Excel открывает UTF-8 без вопросов) и строкой заголовка."""
+    buf = io.StringIO()
+    buf.write("\ufeff")
+    writer = csv.DictWriter(buf, fieldnames=CSV_FIELDS)
+    writer.writeheader()
+    for i, record in enumerate(records, start=1):
+        writer.writerow(csv_row(record))
+        if i % chunk_rows == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
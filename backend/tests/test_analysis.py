@@ -1,5 +1,5 @@
 import unittest
-from backend.analysis import compare_product_data
+from backend.analysis import compare_product_data, listing_needs_detail
 
 class TestAnalysis(unittest.TestCase):
     def test_compare_product_data(self):
@@ -11,5 +11,25 @@ class TestAnalysis(unittest.TestCase):
         self.assertEqual(result["quantity_change"], -2)      # 18 - 20 = -2
         self.assertTrue(result["image_changed"])             # URL изображения изменился
 
+    def test_listing_needs_detail(self):
+        stored = {"price": "100.0", "price_old": "120.0", "discount": "17%",
+                  "quantity": "5", "promo_labels": "Распродажа"}
+        same = {"price": 100, "price_old": "120 ₽", "discount": "17%",
+                "quantity": "", "promo_labels": ["Распродажа"]}
+        # Листинг совпадает с БД — страница товара не нужна
+        self.assertFalse(listing_needs_detail(same, stored))
+        # Нет наблюдений в БД
+        self.assertTrue(listing_needs_detail(same, None))
+        # Изменилась цена
+        self.assertTrue(listing_needs_detail({**same, "price": 95}, stored))
+        # Появился новый бейдж
+        self.assertTrue(listing_needs_detail({**same, "promo_labels": ["Распродажа", "Хит"]}, stored))
+        # В БД нет остатков, в листинге тоже
+        self.assertTrue(listing_needs_detail(same, {**stored, "quantity": ""}))
+        # ... но не для WB: его страница товара остатков обычно не отдаёт
+        wb = {**same, "marketplace": "Wildberries"}
+        self.assertFalse(listing_needs_detail(wb, {**stored, "quantity": "", "marketplace": "Wildberries"}))
+        self.assertTrue(listing_needs_detail({**same, "marketplace": "Ozon"}, {**stored, "quantity": ""}))
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,46 @@
+from backend.cache import LRUCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_evicts_least_recently_read():
+    cache = LRUCache(2, ttl=60)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == ("1", "3")
+    assert cache.stats()["evictions"] == 1
+
+
+def test_lru_bytes_limit_and_ttl():
+    clock = FakeClock()
+    cache = LRUCache(10, ttl=5, max_bytes=10, clock=clock)
+    cache.set("big", b"x" * 11)
+    assert cache.get("big") is None
+    cache.set("a", b"x" * 6)
+    cache.set("b", b"x" * 6)
+    assert cache.get("a") is None and cache.stats()["bytes"] == 6
+    clock.now = 5
+    assert cache.get("b") is None
+
+
+def test_lru_counters_clear_and_disable():
+    cache = LRUCache(10, ttl=60)
+    cache.set("a", "1")
+    cache.get("a")
+    cache.get("missing")
+    cache.clear()
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["invalidations"], stats["entries"]) == (1, 2, 1, 0)
+    cache.enabled = False
+    cache.set("a", "1")
+    assert cache.get("a") is None
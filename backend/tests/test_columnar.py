@@ -0,0 +1,47 @@
+import gzip
+import json
+from datetime import datetime, timezone
+
+from backend.columnar import from_columns, to_columns
+
+
+def _history(n):
+    return [
+        {"parsed_at": f"2025-05-01T10:{i // 60:02d}:{i % 60:02d}", "price": 100.0 + i % 3,
+         "image_url": "https://cdn.example/a.jpg" if i < n // 2 else "https://cdn.example/b.jpg"}
+        for i in range(n)
+    ]
+
+def test_times_become_epoch_seconds():
+    rows = [
+        {"parsed_at": datetime(2025, 5, 1, 10, tzinfo=timezone.utc), "price": 1},
+        {"parsed_at": "2025-05-01T10:00:00", "price": 2},
+        {"parsed_at": None, "price": 3},
+    ]
+    columns = to_columns(rows)["columns"]
+    assert columns["parsed_at"] == [1746093600, 1746093600, None]
+    assert columns["price"] == [1, 2, 3]
+
+def test_repeated_strings_are_dictionary_encoded():
+    payload = to_columns(_history(10))
+    assert payload["length"] == 10
+    assert payload["dictionaries"] == {"image_url": ["https://cdn.example/a.jpg", "https://cdn.example/b.jpg"]}
+    assert payload["columns"]["image_url"] == [0] * 5 + [1] * 5
+
+def test_unique_strings_stay_plain():
+    rows = [{"name": f"P{i}", "tag": None} for i in range(4)]
+    payload = to_columns(rows)
+    assert payload["columns"]["name"] == ["P0", "P1", "P2", "P3"]
+    assert payload["dictionaries"] == {}
+
+def test_round_trip():
+    rows = [{"article": "A1", "price": 10, "labels": ["x"]}, {"article": "A1", "price": None, "labels": []}]
+    assert from_columns(to_columns(rows)) == rows
+    assert from_columns(to_columns([])) == []
+
+def test_columns_are_smaller_than_rows():
+    rows = _history(500)
+    plain = json.dumps(rows).encode()
+    packed = json.dumps(to_columns(rows)).encode()
+    assert len(packed) * 3 < len(plain)
+    assert len(gzip.compress(packed)) < len(gzip.compress(plain))
@@ -0,0 +1,92 @@
+import pytest
+from backend.crawler import CategoryCrawler
+from backend.database import init_db, engine
+from backend.models import Base
+from backend.utils.marketplace_urls import canonicalize_url
+
+ROOT = "https://www.ozon.ru/category/hlebtsy-9359/?from_global=true"
+
+# Дерево категорий: страница → (ссылки на подкатегории, число товаров)
+TREE = {
+    "https://www.ozon.ru/category/hlebtsy-9359/": (
+        ["https://www.ozon.ru/category/hlebtsy-grechnevye-1/",
+         "https://www.ozon.ru/category/hlebtsy-risovye-2/?tracking=1",
+         "https://www.ozon.ru/category/hlebtsy-risovye-2/"],
+        3,
+    ),
+    "https://www.ozon.ru/category/hlebtsy-grechnevye-1/": (
+        ["https://www.ozon.ru/category/hlebtsy-9359/", "https://www.ozon.ru/category/glubzhe-3/"],
+        2,
+    ),
+    "https://www.ozon.ru/category/hlebtsy-risovye-2/": ([], 2),
+    "https://www.ozon.ru/category/glubzhe-3/": ([], 5),
+}
+
+
+@pytest.fixture(autouse=True)
+def prepare_db():
+    init_db()
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def fake_scraper(monkeypatch):
+    visited = []
+
+    class FakeScraper:
+        def _scrape_ozon_category_by_url(self, url, limit, marketplace, categories, discovered=None):
+            key = url.split("?", 1)[0]
+            visited.append(key)
+            links, count = TREE[key]
+            discovered.extend(links)
+            return [{"article": f"{key}#{i}"} for i in range(count)]
+        def close(self):
+            pass
+
+    monkeypatch.setattr("backend.crawler.MarketplaceScraper", FakeScraper)
+    return visited
+
+
+def test_canonicalize_url_drops_tracking_params():
+    assert canonicalize_url("https://www.ozon.ru/category/x-1?from_global=true&text=a#top") == \
+        "https://ozon.ru/category/x-1/?text=a"
+
+
+def test_crawler_dedupes_and_respects_depth(fake_scraper):
+    emitted = []
+    crawler = CategoryCrawler(ROOT, "Ozon", "хлебцы", max_depth=1, workers=1,
+                              min_delay=0, on_products=emitted.extend)
+    stats = crawler.run()
+    # каждая категория посещена один раз, glubzhe-3 глубже лимита
+    assert sorted(fake_scraper) == sorted([
+        "https://www.ozon.ru/category/hlebtsy-9359/",
+        "https://www.ozon.ru/category/hlebtsy-grechnevye-1/",
+        "https://www.ozon.ru/category/hlebtsy-risovye-2/",
+    ])
+    assert len(emitted) == 7
+    assert stats["frontier"] == {"done": 3}
+
+
+def test_crawler_stops_at_max_skus(fake_scraper):
+    emitted = []
+    crawler = CategoryCrawler(ROOT, "Ozon", "хлебцы", max_depth=5, max_skus=4, workers=1,
+                              min_delay=0, on_products=emitted.extend)
+    crawler.run()
+    assert len(emitted) == 4
+
+
+def test_resumed_crawl_counts_earlier_skus(fake_scraper):
+    # первый запуск исчерпал лимит на корне, подкатегории остались в очереди
+    first = []
+    crawler = CategoryCrawler(ROOT, "Ozon", "хлебцы", max_depth=5, max_skus=3, workers=1,
+                              min_delay=0, on_products=first.extend)
+    assert crawler.run()["frontier"]["pending"] == 2
+    assert len(first) == 3
+
+    # продолжение того же обхода с лимитом 4: остаётся один товар
+    resumed = []
+    crawler = CategoryCrawler(ROOT, "Ozon", "хлебцы", max_depth=5, max_skus=4, workers=1,
+                              min_delay=0, crawl_id=crawler.crawl_id, on_products=resumed.extend)
+    assert crawler.run()["skus"] == 4
+    assert len(resumed) == 1
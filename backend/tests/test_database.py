@@ -1,7 +1,7 @@
 import unittest
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from backend.database import init_db, Product, Base
+from backend.database import init_db, Product, Observation, Base
 
 class TestDatabase(unittest.TestCase):
     def setUp(self):
@@ -16,18 +16,19 @@ class TestDatabase(unittest.TestCase):
         sample_product = {
             "name": "Тестовый продукт",
             "article": "TEST001",
-            "price": "50 руб.",
-            "quantity": "10",
+            "marketplace": "Ozon",
             "image_url": "http://example.com/test.jpg"
         }
-        # Добавляем продукт через ORM напрямую (проверяем работу модели)
+        # Добавляем товар и наблюдение через ORM напрямую (проверяем работу моделей)
         product = Product(**sample_product)
+        product.observations.append(Observation(price=50, quantity=10))
         session.add(product)
         session.commit()
         # Запрашиваем из базы и проверяем
         products = session.query(Product).all()
         self.assertEqual(len(products), 1)
         self.assertEqual(products[0].name, "Тестовый продукт")
+        self.assertEqual(products[0].observations[0].price, 50)
         session.close()
 
 if __name__ == "__main__":
@@ -1,5 +1,7 @@
+from datetime import date, datetime, timedelta
 import pytest
-from backend.database import init_db, add_product, get_products, engine
+from backend.database import init_db, add_product, add_products, get_products, get_products_page, get_product_changes, get_retention_horizon, get_latest_products, get_product, get_product_history, get_products_history, get_dashboard_stats, get_categories, get_marketplaces, get_ingest_state, get_latest_observations, clean_old_data, get_retention_runs, on_ingest, SessionLocal, engine
+from backend.models import Product, Observation
 from backend.models import Base
 
 @pytest.fixture(autouse=True)
@@ -27,4 +29,377 @@ def test_add_and_get_single_product():
     prods = get_products()
     assert len(prods) == 1
     assert prods[0].name == "P1"
-    assert prods[0].article == "A1"
\ No newline at end of file
+    assert prods[0].article == "A1"
+
+def test_get_latest_observations_returns_last_row_per_article():
+    """get_latest_observations() отдаёт только последнее наблюдение по каждому артикулу."""
+    add_product({"name": "P1", "article": "A1", "price": "10", "quantity": "1"})
+    add_product({"name": "P1", "article": "A1", "price": "12", "quantity": "3"})
+    add_product({"name": "P2", "article": "A2", "price": "7", "quantity": "2"})
+    latest = get_latest_observations(["A1", "A2", "A3"])
+    assert set(latest) == {"A1", "A2"}
+    assert latest["A1"]["price"] == 12
+    assert latest["A1"]["quantity"] == 3
+
+def test_latest_products_hold_one_row_per_product():
+    """product_latest обновляется при записи: одна строка на (marketplace, article)."""
+    add_product({"name": "P1", "article": "A1", "price": "10", "quantity": "1"})
+    add_products([
+        {"name": "P1", "article": "A1", "price": "12", "quantity": "3"},
+        {"name": "P1 Ozon", "article": "A1", "price": "15", "quantity": "4", "marketplace": "Ozon"},
+        {"name": "P2", "article": "A2", "price": "7", "quantity": "2"},
+    ])
+    latest = get_latest_products()
+    assert [(p.marketplace, p.article, p.price) for p in latest] == [
+        (None, "A1", 12), ("Ozon", "A1", 15), (None, "A2", 7),
+    ]
+    # id — последнего наблюдения, как в полном списке
+    assert {p.id for p in latest} <= {p.id for p in get_products()}
+
+def test_latest_products_follow_dedupe_extension():
+    """Продление наблюдения без изменений отражается в product_latest."""
+    def obs(day):
+        return {"name": "P1", "article": "A1", "price": "10", "quantity": "5",
+                "parsed_at": f"2025-05-{day:02d}T10:00:00"}
+
+    add_products([obs(1)], dedupe=True)
+    add_products([obs(2)], dedupe=True)
+    [latest] = get_latest_products()
+    assert latest.parsed_at.day == 1
+    assert latest.last_seen_at.day == 2
+
+def test_latest_products_match_history_after_mixed_batch():
+    """product_latest после пачки с новыми, продлёнными и переименованными товарами."""
+    def obs(article, price, day, name="P"):
+        return {"name": name, "article": article, "price": price, "quantity": "5",
+                "parsed_at": f"2025-05-{day:02d}T10:00:00"}
+
+    add_products([obs("A1", "10", 1), obs("A2", "20", 1)], dedupe=True)
+    add_products([obs("A1", "10", 2, name="P new"), obs("A2", "21", 2), obs("A2", "22", 3), obs("A3", "30", 3)],
+                 dedupe=True)
+    latest = {p.article: p for p in get_latest_products()}
+    history = {}
+    for p in get_products():
+        history[p.article] = p
+    assert {a: p.id for a, p in latest.items()} == {a: p.id for a, p in history.items()}
+    assert (latest["A1"].name, latest["A1"].price, latest["A1"].last_seen_at.day) == ("P new", 10, 2)
+    assert (latest["A2"].price, latest["A2"].parsed_at.day) == (22, 3)
+    assert latest["A3"].timestamp is not None
+
+def test_products_page_walks_all_rows_by_cursor():
+    """Постраничная выдача по курсору отдаёт все строки ровно один раз."""
+    add_products({"name": f"P{i}", "article": f"A{i}", "price": str(i), "quantity": "1"} for i in range(7))
+    seen, cursor = [], None
+    while True:
+        page, cursor = get_products_page(3, cursor)
+        seen += [p.article for p in page]
+        if cursor is None:
+            break
+    assert seen == [f"A{i}" for i in range(7)]
+
+def test_products_page_filters():
+    """Фильтры применяются в БД."""
+    add_products([
+        {"name": "P1", "article": "A1", "price": "10", "quantity": "1", "marketplace": "Ozon",
+         "category": "хлебцы", "parsed_at": "2025-05-01T10:00:00"},
+        {"name": "P2", "article": "A2", "price": "50", "quantity": "1", "marketplace": "Ozon",
+         "category": "хлебцы", "promotion_detected": True, "parsed_at": "2025-05-03T10:00:00"},
+        {"name": "P3", "article": "A3", "price": "30", "quantity": "1", "marketplace": "Wildberries",
+         "category": "чай", "parsed_at": "2025-05-02T10:00:00"},
+    ])
+    def articles(**filters):
+        return [p.article for p in get_products_page(10, **filters)[0]]
+
+    assert articles(marketplace="Ozon") == ["A1", "A2"]
+    assert articles(category="чай") == ["A3"]
+    assert articles(promo=True) == ["A2"]
+    assert articles(price_min=20, price_max=40) == ["A3"]
+    assert articles(date_from=date(2025, 5, 2), date_to=date(2025, 5, 2)) == ["A3"]
+    assert articles(view="latest", article="A2") == ["A2"]
+
+def test_products_page_rejects_broken_cursor():
+    with pytest.raises(ValueError):
+        get_products_page(10, "не курсор")
+
+def test_dashboard_stats_aggregates_in_sql():
+    """Сводка дашборда: счётчики, итоги и сравнение двух последних наблюдений."""
+    assert get_dashboard_stats()["last_compare"] == {}
+    add_product({"name": "P1", "article": "A1", "price": "10", "quantity": "5",
+                 "marketplace": "Ozon", "category": "хлебцы"})
+    add_product({"name": "P2", "article": "A2", "price": "7", "quantity": "1",
+                 "marketplace": "Wildberries", "category": "хлебцы"})
+    add_product({"name": "P1", "article": "A1", "price": "12", "quantity": "3",
+                 "marketplace": "Ozon", "category": "хлебцы"})
+    stats = get_dashboard_stats()
+    assert (stats["products_count"], stats["unique_products"]) == (3, 2)
+    assert (stats["categories_count"], stats["marketplaces_count"]) == (1, 2)
+    assert stats["last_compare"] == {"price_diff": 5, "quantity_diff": 2}
+    assert stats["by_marketplace"] == [
+        {"marketplace": "Ozon", "products": 1, "observations": 2},
+        {"marketplace": "Wildberries", "products": 1, "observations": 1},
+    ]
+    assert stats["by_category"] == [{"category": "хлебцы", "products": 2, "observations": 3}]
+
+def test_ingest_version_bumped_by_writes():
+    """Каждая запись наблюдений увеличивает версию данных."""
+    assert get_ingest_state() == (0, None)
+    add_product({"name": "P1", "article": "A1", "price": "10", "quantity": "1",
+                 "marketplace": "Ozon", "category": "хлебцы"})
+    assert get_ingest_state()[0] == 1
+    add_products([{"name": "P2", "article": "A2", "price": "7", "quantity": "1", "category": "чай"}])
+    assert get_ingest_state()[0] == 2
+    assert get_categories() == ["хлебцы", "чай"]
+    assert get_marketplaces() == ["Ozon"]
+
+def test_add_products_in_batches():
+    """add_products() пишет все товары пачками и возвращает счётчики."""
+    items = ({"name": f"P{i}", "article": f"A{i}", "price": f"{i} ₽", "quantity": "1"} for i in range(2500))
+    result = add_products(items, batch_size=1000)
+    assert result == {"inserted": 2500, "unchanged": 0, "rejected": 0, "errors": []}
+    prods = get_products()
+    assert len(prods) == 2500
+    assert prods[-1].price == 2499
+
+def test_add_products_rejects_only_bad_rows():
+    """Ошибка в одной строке не отменяет остальные строки пачки."""
+    items = [
+        {"name": "P1", "article": "A1", "price": "10", "quantity": "1"},
+        {"name": object(), "article": "BAD", "price": "10", "quantity": "1"},
+        {"name": "P3", "article": "A3", "price": "10", "quantity": "1"},
+    ]
+    result = add_products(items, batch_size=10)
+    assert result["inserted"] == 2
+    assert result["rejected"] == 1
+    assert result["errors"][0]["index"] == 1
+    assert result["errors"][0]["article"] == "BAD"
+    assert sorted(p.article for p in get_products()) == ["A1", "A3"]
+
+def test_add_products_retries_rows_without_copy(monkeypatch):
+    """Построчный повтор пачки пишет обычным INSERT, а не COPY, и ловит не только SQLAlchemyError."""
+    import backend.database as database
+    calls = []
+
+    def failing_copy(session, table, rows):
+        # как ошибка psycopg2 в COPY: не оборачивается в SQLAlchemyError
+        calls.append(len(rows))
+        raise RuntimeError("COPY failed")
+
+    monkeypatch.setattr(database, "_copy_rows", failing_copy)
+    items = [{"name": f"P{i}", "article": f"A{i}", "price": "10", "quantity": "1"} for i in range(3)]
+    result = add_products(items, batch_size=10)
+    assert calls == [3]
+    assert result["inserted"] == 3
+    assert result["rejected"] == 0
+    assert len(get_products()) == 3
+
+def test_observations_share_one_product_row():
+    """Повторные наблюдения товара не дублируют название и изображение."""
+    add_products([
+        {"name": "P1", "article": "A1", "price": "10", "quantity": "1", "marketplace": "Ozon"},
+        {"name": "P1", "article": "A1", "price": "11", "quantity": "1", "marketplace": "Wildberries"},
+    ])
+    add_products([
+        {"name": "P1 v2", "article": "A1", "price": "12", "quantity": "2", "marketplace": "Ozon",
+         "parsed_at": "2025-05-23T09:45:21"},
+    ])
+    session = SessionLocal()
+    try:
+        assert session.query(Product).count() == 2
+        assert session.query(Observation).count() == 3
+    finally:
+        session.close()
+    assert [p.name for p in get_products()] == ["P1 v2", "P1", "P1 v2"]
+    assert get_product("A1").article == "A1"
+
+def test_skip_existing_does_not_duplicate_history():
+    """Повторная запись тех же моментов (перепарсинг снимков) не удваивает историю."""
+    def obs(price, day):
+        return {"name": "P1", "article": "A1", "price": price, "quantity": "5",
+                "marketplace": "Ozon", "parsed_at": f"2025-05-{day:02d}T10:00:00"}
+
+    add_products([obs("10", 1), obs("11", 2)])
+    add_products([obs("10", 3), obs("10", 5)], dedupe=True)
+    result = add_products([obs("10", 1), obs("11", 2), obs("10", 4), obs("13", 6)], skip_existing=True)
+    assert (result["inserted"], result["unchanged"]) == (1, 3)
+    assert [p.price for p in get_products()] == [10, 11, 10, 13]
+
+def test_dedupe_extends_last_seen_and_history_keeps_series():
+    """Без изменений наблюдение продлевается, история восстанавливает все точки."""
+    def obs(price, day):
+        return {"name": "P1", "article": "A1", "price": price, "quantity": "5",
+                "marketplace": "Ozon", "parsed_at": f"2025-05-{day:02d}T10:00:00"}
+
+    assert add_products([obs("10", 1), obs("10", 2)], dedupe=True)["inserted"] == 1
+    result = add_products([obs("10", 3)], dedupe=True)
+    assert (result["inserted"], result["unchanged"]) == (0, 1)
+    assert add_products([obs("12", 4)], dedupe=True)["inserted"] == 1
+
+    prods = get_products()
+    assert [p.price for p in prods] == [10, 12]
+    assert prods[0].last_seen_at.day == 3
+
+    history = get_product_history("A1")
+    assert [(h["parsed_at"][:10], h["price"]) for h in history] == [
+        ("2025-05-01", 10), ("2025-05-03", 10), ("2025-05-04", 12),
+    ]
+
+def test_product_history_range_and_max_points():
+    """История обрезается по диапазону дат и прореживается до max_points."""
+    def obs(price, day):
+        return {"name": "P1", "article": "A1", "price": str(price), "quantity": "5",
+                "marketplace": "Ozon", "parsed_at": f"2025-05-{day:02d}T10:00:00"}
+
+    add_products([obs(10 + day % 7, day) for day in range(1, 31)])
+    assert len(get_product_history("A1")) == 30
+
+    ranged = get_product_history("A1", date(2025, 5, 10), date(2025, 5, 19))
+    assert [h["parsed_at"][:10] for h in ranged] == [f"2025-05-{d}" for d in range(10, 20)]
+
+    thinned = get_product_history("A1", max_points=8)
+    assert len(thinned) == 8
+    assert thinned[0]["parsed_at"][:10] == "2025-05-01"
+    assert thinned[-1]["parsed_at"][:10] == "2025-05-30"
+
+def test_products_history_batch():
+    """История нескольких артикулов одним запросом, как у get_product_history."""
+    add_products(
+        {"name": f"P{a}", "article": f"A{a}", "price": str(10 * a + day), "quantity": "1",
+         "parsed_at": f"2025-05-{day:02d}T10:00:00"}
+        for a in (1, 2) for day in range(1, 6)
+    )
+    batch = get_products_history(["A2", "A1", "A9", "A1"], max_points=3)
+    assert set(batch) == {"A1", "A2"}
+    assert batch["A1"] == get_product_history("A1", max_points=3)
+    assert [h["price"] for h in batch["A2"]][::2] == [21, 25]
+
+def test_product_history_keeps_marketplaces_apart():
+    """Ряды одного артикула на разных маркетплейсах не смешиваются при прореживании."""
+    add_products(
+        {"name": "P1", "article": "A1", "price": str(base + day % 3), "quantity": "1",
+         "marketplace": mp, "parsed_at": f"2025-05-{day:02d}T10:00:00"}
+        for mp, base in (("Ozon", 100), ("Wildberries", 500)) for day in range(1, 21)
+    )
+    ozon = get_product_history("A1", max_points=4, marketplace="Ozon")
+    assert len(ozon) == 4
+    assert {(h["marketplace"], h["price"] < 200) for h in ozon} == {("Ozon", True)}
+
+    both = get_product_history("A1", max_points=4)
+    assert len(both) == 8
+    assert [h for h in both if h["marketplace"] == "Ozon"] == ozon
+    assert all((h["price"] < 200) == (h["marketplace"] == "Ozon") for h in both)
+    assert [h["parsed_at"] for h in both] == sorted(h["parsed_at"] for h in both)
+    assert get_products_history(["A1"], max_points=4, marketplace="Wildberries")["A1"] == \
+        [h for h in both if h["marketplace"] == "Wildberries"]
+
+def test_product_history_range_clamps_extended_observation():
+    """Отрезок, продлённый через границу диапазона, обрезается по ней."""
+    add_products([{"name": "P1", "article": "A1", "price": "10", "quantity": "1",
+                   "parsed_at": "2025-05-01T10:00:00"}])
+    session = SessionLocal()
+    try:
+        session.query(Observation).update({"last_seen_at": datetime(2025, 5, 20, 10)})
+        session.commit()
+    finally:
+        session.close()
+    history = get_product_history("A1", date(2025, 5, 5), date(2025, 5, 9))
+    assert [h["parsed_at"] for h in history] == ["2025-05-05T00:00:00", "2025-05-10T00:00:00"]
+    assert get_product_history("A1", date(2025, 6, 1)) == []
+
+def test_product_changes_feed():
+    """Лента отдаёт новые и продлённые наблюдения после курсора, страницами."""
+    def obs(article, price, day):
+        return {"name": article, "article": article, "price": price, "quantity": "1",
+                "parsed_at": f"2025-05-{day:02d}T10:00:00"}
+
+    add_products([obs("A1", "10", 1), obs("A2", "20", 1), obs("A3", "30", 1)], dedupe=True)
+    items, cursor, has_more = get_product_changes(limit=2)
+    assert [r.article for r in items] == ["A1", "A2"] and has_more
+    items, cursor, has_more = get_product_changes(cursor, limit=2)
+    assert [r.article for r in items] == ["A3"] and not has_more
+
+    # без изменений лента пуста, курсор остаётся прежним
+    assert get_product_changes(cursor) == ([], cursor, False)
+
+    # A1 продлён, A2 изменил цену, A3 не приходил
+    add_products([obs("A1", "10", 2), obs("A2", "25", 2)], dedupe=True)
+    items, cursor, _ = get_product_changes(cursor)
+    assert sorted((r.article, r.price, r.last_seen_at is not None) for r in items) == [
+        ("A1", 10, True), ("A2", 25, False),
+    ]
+    add_product({"name": "A4", "article": "A4", "price": "1", "quantity": "1"})
+    assert [r.article for r in get_product_changes(cursor)[0]] == ["A4"]
+
+    with pytest.raises(ValueError):
+        get_product_changes("not-a-cursor")
+
+def test_retention_horizon_is_latest_cutoff():
+    """Граница удалений для ленты изменений — cutoff последней очистки."""
+    assert get_retention_horizon() is None
+    clean_old_data(60)
+    first = get_retention_horizon()
+    assert abs(first - (datetime.utcnow() - timedelta(days=60))) < timedelta(minutes=1)
+    clean_old_data(30)
+    assert get_retention_horizon() > first
+
+def test_ingest_listeners_called_after_writes():
+    """Обработчики on_ingest вызываются после каждой записи в БД."""
+    from backend import database
+    calls = []
+    on_ingest(lambda: calls.append(1))
+    try:
+        add_product({"name": "P1", "article": "A1", "price": "10", "quantity": "1"})
+        add_products([{"name": "P2", "article": "A2", "price": "20", "quantity": "1"}])
+        assert len(calls) == 2
+        add_products([])
+        assert len(calls) == 2
+    finally:
+        database._ingest_listeners.pop()
+
+def test_clean_old_data_keeps_extended_observations():
+    """Очистка не удаляет старое наблюдение, продлённое недавним скрапингом."""
+    add_products([{"name": "P1", "article": "A1", "price": "10", "quantity": "1"}])
+    session = SessionLocal()
+    try:
+        session.query(Observation).update({
+            "timestamp": datetime.utcnow() - timedelta(days=90),
+            "last_seen_at": datetime.utcnow(),
+        })
+        session.commit()
+    finally:
+        session.close()
+    assert clean_old_data(60) == 0
+    assert len(get_products()) == 1
+
+def test_clean_old_data_deletes_in_batches():
+    """Старые наблюдения удаляются пачками, свежие остаются."""
+    add_products({"name": f"P{i}", "article": f"A{i}", "price": "1", "quantity": "1"} for i in range(25))
+    session = SessionLocal()
+    try:
+        session.query(Observation).filter(Observation.id <= 20).update(
+            {"timestamp": datetime.utcnow() - timedelta(days=90)}
+        )
+        session.commit()
+    finally:
+        session.close()
+    assert clean_old_data(60, batch_size=7, pause=0) == 20
+    assert len(get_products()) == 5
+    run = get_retention_runs(1)[0]
+    assert (run["rows_deleted"], run["batches"], run["completed"]) == (20, 3, True)
+    assert run["lag_seconds"] == 0
+
+def test_clean_old_data_resumes_after_time_budget():
+    """Запуск, превысивший бюджет времени, продолжается следующим запуском."""
+    add_products({"name": f"P{i}", "article": f"A{i}", "price": "1", "quantity": "1"} for i in range(10))
+    session = SessionLocal()
+    try:
+        session.query(Observation).update({"timestamp": datetime.utcnow() - timedelta(days=90)})
+        session.commit()
+    finally:
+        session.close()
+    assert clean_old_data(60, batch_size=4, pause=0, time_budget=0) == 4
+    run = get_retention_runs(1)[0]
+    assert not run["completed"]
+    assert run["lag_seconds"] > 0
+    assert clean_old_data(60, batch_size=4, pause=0) == 6
+    assert get_retention_runs(1)[0]["completed"]
+    assert get_products() == []
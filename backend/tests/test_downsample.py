@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from backend.downsample import downsample, lttb, minmax
+
+
+def test_short_series_is_kept():
+    assert list(lttb([0, 1, 2], [1, 2, 3], 10)) == [0, 1, 2]
+    assert list(minmax([0, 1, 2], [1, 2, 3], 3)) == [0, 1, 2]
+
+def test_lttb_keeps_edges_and_peak():
+    x = np.arange(1000)
+    y = np.zeros(1000)
+    y[437] = 100  # одиночный всплеск цены
+    kept = lttb(x, y, 50)
+    assert len(kept) == 50
+    assert kept[0] == 0 and kept[-1] == 999
+    assert 437 in kept
+    assert list(kept) == sorted(set(kept))
+
+def test_minmax_keeps_extremes():
+    x = np.arange(500)
+    y = np.sin(x / 10.0)
+    y[200], y[300] = 5, -5
+    kept = minmax(x, y, 40)
+    assert len(kept) <= 40
+    assert {0, 200, 300, 499} <= set(kept)
+
+def test_gaps_are_filled():
+    y = [float("nan"), 1, float("nan"), 1, 9, float("nan"), 1]
+    assert len(lttb(range(7), y, 4)) == 4
+
+def test_tiny_max_points():
+    assert list(lttb(range(10), range(10), 2)) == [0, 9]
+    assert list(lttb(range(10), range(10), 1)) == [0]
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        downsample([0, 1], [0, 1], 1, method="avg")
@@ -0,0 +1,118 @@
+import gzip
+from datetime import datetime, timezone
+
+import pytest
+from flask import Flask, jsonify, request
+
+from backend.cache import LRUCache
+from backend.http_cache import conditional, cached, compress_response
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    state = {"version": 1, "calls": 0}
+    modified = datetime(2025, 5, 1, 10, 0, 0, 500000, tzinfo=timezone.utc)
+
+    @app.after_request
+    def _compress(response):
+        return compress_response(response, min_size=100)
+
+    @app.route("/items")
+    @conditional(lambda: (state["version"], modified))
+    def items():
+        state["calls"] += 1
+        return jsonify([{"n": i} for i in range(50)])
+
+    cache = LRUCache(10, ttl=60, size=lambda entry: len(entry[0]))
+
+    @app.route("/cached")
+    @conditional(lambda: (state["version"], modified))
+    @cached(cache, min_size=100)
+    def cached_items():
+        state["calls"] += 1
+        return jsonify({"calls": state["calls"], "items": list(range(int(request.args.get("n", 0))))})
+
+    @app.route("/stream")
+    def stream():
+        return app.response_class((f"[{i}]" for i in range(3)), mimetype="application/json")
+
+    @app.route("/small")
+    def small():
+        return jsonify({"ok": True})
+
+    with app.test_client() as c:
+        c.state = state
+        c.cache = cache
+        yield c
+
+def test_etag_and_not_modified(client):
+    first = client.get("/items")
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert etag.startswith('W/"items-1-')
+    assert first.headers["Last-Modified"] == "Thu, 01 May 2025 10:00:00 GMT"
+    assert "no-cache" in first.headers["Cache-Control"]
+
+    again = client.get("/items", headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.data == b""
+    assert client.state["calls"] == 1
+
+    since = client.get("/items", headers={"If-Modified-Since": first.headers["Last-Modified"]})
+    assert since.status_code == 304
+
+def test_new_version_or_other_args_change_etag(client):
+    etag = client.get("/items").headers["ETag"]
+    assert client.get("/items?x=1", headers={"If-None-Match": etag}).status_code == 200
+    client.state["version"] = 2
+    assert client.get("/items", headers={"If-None-Match": etag}).status_code == 200
+
+def test_gzip_when_accepted_and_large_enough(client):
+    plain = client.get("/items")
+    assert "Content-Encoding" not in plain.headers
+    packed = client.get("/items", headers={"Accept-Encoding": "gzip, deflate"})
+    assert packed.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in packed.headers["Vary"]
+    assert gzip.decompress(packed.data) == plain.data
+
+    small = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in small.headers
+
+
+def test_streamed_json_compressed_by_chunks(client):
+    assert client.get("/stream").data == b"[0][1][2]"
+    packed = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+    assert packed.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in packed.headers
+    assert gzip.decompress(packed.data) == b"[0][1][2]"
+
+
+def test_cached_response_keyed_by_args_and_version(client):
+    assert client.get("/cached?a=1&b=2").json["calls"] == 1
+    assert client.get("/cached?b=2&a=1").json["calls"] == 1
+    assert client.get("/cached?a=1").json["calls"] == 2
+    assert client.cache.stats()["hits"] == 1
+
+    client.state["version"] = 2
+    assert client.get("/cached?a=1&b=2").json["calls"] == 3
+    client.cache.clear()
+    assert client.get("/cached?a=1&b=2").json["calls"] == 4
+
+
+def test_cached_response_stored_compressed(client, monkeypatch):
+    import backend.http_cache as http_cache
+    packed = client.get("/cached?n=100", headers={"Accept-Encoding": "gzip"})
+    assert packed.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(packed.data).startswith(b'{"calls":1')
+
+    # попадание в кэш отдаёт уже сжатое тело, не сжимая его снова
+    monkeypatch.setattr(http_cache.gzip, "compress", None)
+    again = client.get("/cached?n=100", headers={"Accept-Encoding": "gzip"})
+    assert again.data == packed.data
+    assert again.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in again.headers["Vary"]
+
+    # клиент без сжатия — отдельная запись кэша
+    plain = client.get("/cached?n=100")
+    assert "Content-Encoding" not in plain.headers
+    assert plain.json["calls"] == 2
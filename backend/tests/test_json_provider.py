@@ -0,0 +1,66 @@
+import json
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import pytest
+from flask import Flask
+
+from backend.database import init_db, add_products, iter_products, get_products_page, engine
+from backend.json_provider import FastJSONProvider
+from backend.models import Base
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    return app
+
+
+@pytest.fixture
+def db():
+    init_db()
+    add_products(
+        {"name": f"Товар {i}", "article": f"A{i}", "price": f"{i}.5", "quantity": "1",
+         "promo_labels": "скидка;хит", "marketplace": "Ozon" if i % 2 else "",
+         "parsed_at": f"2025-05-0{i + 1}T10:00:00.123456"}
+        for i in range(3)
+    )
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_native_types(app):
+    value = {
+        "naive": datetime(2025, 5, 1, 10, 0, 0, 123456),
+        "aware": datetime(2025, 5, 1, 10, tzinfo=timezone.utc),
+        "day": datetime(2025, 5, 1).date(),
+        "amount": Decimal("12.50"),
+        "name": "хлебцы",
+    }
+    text = app.json.dumps(value)
+    assert "хлебцы" in text
+    assert json.loads(text) == {
+        "naive": "2025-05-01T10:00:00.123456",
+        "aware": "2025-05-01T10:00:00+00:00",
+        "day": "2025-05-01",
+        "amount": 12.5,
+        "name": "хлебцы",
+    }
+    with app.app_context():
+        response = app.json.response(value)
+    assert response.mimetype == "application/json"
+    assert app.json.loads(response.get_data()) == json.loads(text)
+
+
+def test_rows_serialize_like_records(app, db):
+    records = [r.to_dict() for r in iter_products()]
+    rows = list(iter_products(as_dicts=True))
+    assert json.loads(app.json.dumps(rows)) == records
+
+    page, cursor = get_products_page(2, as_dicts=True)
+    assert json.loads(app.json.dumps(page)) == records[:2]
+    assert [r.id for r in get_products_page(2, cursor)[0]] == [records[2]["id"]]
+
+    latest = [r.to_dict() for r in iter_products("latest")]
+    assert json.loads(app.json.dumps(list(iter_products("latest", as_dicts=True)))) == latest
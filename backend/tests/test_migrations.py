@@ -0,0 +1,157 @@
+import pytest
+from sqlalchemy import create_engine, inspect, text, Integer, Numeric
+
+from backend.migrations import run_migrations, MIGRATIONS
+from backend.models import Base
+
+
+@pytest.fixture
+def legacy_engine(tmp_path):
+    """База со старой схемой products, где числа хранились строками."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE products ("
+            " id INTEGER PRIMARY KEY, name VARCHAR NOT NULL, article VARCHAR NOT NULL,"
+            " price VARCHAR NOT NULL, quantity VARCHAR NOT NULL, image_url VARCHAR,"
+            " promotion_detected BOOLEAN, detected_keywords VARCHAR,"
+            " marketplace VARCHAR, category VARCHAR,"
+            " price_old VARCHAR, price_new VARCHAR, discount VARCHAR, promo_labels VARCHAR,"
+            " parsed_at DATETIME, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL)"
+        ))
+        conn.execute(text(
+            "INSERT INTO products (name, article, price, quantity, price_old, price_new, discount) VALUES"
+            " ('P1', 'A1', '1 234,50 ₽', '12', '1500', '1 234,50', '-18%'),"
+            " ('P2', 'A2', '', '', NULL, NULL, NULL),"
+            " ('P3', 'A3', '99', 'нет', '', '99', '5')"
+        ))
+    yield engine
+    engine.dispose()
+
+
+def test_migration_converts_legacy_strings(legacy_engine):
+    from backend.migrations import _typed_numeric_columns
+    _typed_numeric_columns(legacy_engine, chunk_size=2)
+
+    cols = {c["name"]: c["type"] for c in inspect(legacy_engine).get_columns("products")}
+    assert not [c for c in cols if c.endswith("_legacy")]
+    assert isinstance(cols["price"], Numeric)
+    assert isinstance(cols["quantity"], Integer)
+
+    with legacy_engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT article, price, quantity, price_old, price_new, discount FROM products ORDER BY id"
+        )).all()
+    assert [tuple(r) for r in rows] == [
+        ("A1", 1234.5, 12, 1500, 1234.5, 18),
+        ("A2", None, None, None, None, None),
+        ("A3", 99, None, None, 99, 5),
+    ]
+
+
+def test_migration_nulls_values_out_of_column_range(legacy_engine):
+    from backend.migrations import _typed_numeric_columns
+    with legacy_engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO products (name, article, price, quantity, price_old, price_new, discount) VALUES"
+            " ('P4', 'A4', '12345678901 ₽', '99999999999', '9999999999.99', '10000000000', '1000%')"
+        ))
+    _typed_numeric_columns(legacy_engine)
+
+    with legacy_engine.connect() as conn:
+        row = conn.execute(text(
+            "SELECT price, quantity, price_old, price_new, discount FROM products WHERE article = 'A4'"
+        )).one()
+    assert tuple(row) == (None, None, 9999999999.99, None, None)
+
+
+def test_run_migrations_records_versions_once(legacy_engine):
+    assert run_migrations(legacy_engine) == [v for v, _, _ in MIGRATIONS]
+    assert run_migrations(legacy_engine) == []
+
+
+def test_migrations_are_noop_on_fresh_schema(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+    Base.metadata.create_all(bind=engine)
+    assert run_migrations(engine) == [v for v, _, _ in MIGRATIONS]
+    cols = {c["name"] for c in inspect(engine).get_columns("products")}
+    assert not [c for c in cols if c.endswith("_legacy")]
+    engine.dispose()
+
+
+def test_indexes_created_on_legacy_table(legacy_engine):
+    from backend.migrations import _products_indexes
+    _products_indexes(legacy_engine)
+    names = {ix["name"] for ix in inspect(legacy_engine).get_indexes("products")}
+    assert {
+        "ix_products_article_parsed_at", "ix_products_category",
+        "ix_products_marketplace", "ix_products_timestamp",
+    } <= names
+    with legacy_engine.connect() as conn:
+        plan = " ".join(str(r[-1]) for r in conn.execute(text(
+            "EXPLAIN QUERY PLAN SELECT * FROM products WHERE article = 'A1' ORDER BY parsed_at"
+        )))
+    assert "ix_products_article_parsed_at" in plan
+
+
+def test_split_into_products_and_observations(legacy_engine):
+    with legacy_engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO products (name, article, price, quantity, marketplace, category, image_url) VALUES"
+            " ('P1 new', 'A1', '1300', '4', NULL, 'хлебцы', 'img1'),"
+            " ('P1 ozon', 'A1', '1400', '5', 'Ozon', NULL, NULL)"
+        ))
+    run_migrations(legacy_engine)
+
+    tables = set(inspect(legacy_engine).get_table_names())
+    assert "products_legacy" not in tables
+    assert "price" not in {c["name"] for c in inspect(legacy_engine).get_columns("products")}
+    with legacy_engine.connect() as conn:
+        products = conn.execute(text(
+            "SELECT marketplace, article, name, category FROM products ORDER BY marketplace, article"
+        )).all()
+        observations = conn.execute(text(
+            "SELECT o.id, p.marketplace, p.article, o.price, o.quantity FROM observations o "
+            "JOIN products p ON p.id = o.product_id ORDER BY o.id"
+        )).all()
+    # название и категория берутся из последней строки товара
+    assert [tuple(r) for r in products] == [
+        ("", "A1", "P1 new", "хлебцы"), ("", "A2", "P2", None), ("", "A3", "P3", None),
+        ("Ozon", "A1", "P1 ozon", None),
+    ]
+    # id наблюдений сохраняются
+    assert [tuple(r) for r in observations] == [
+        (1, "", "A1", 1234.5, 12), (2, "", "A2", None, None), (3, "", "A3", 99, None),
+        (4, "", "A1", 1300, 4), (5, "Ozon", "A1", 1400, 5),
+    ]
+
+
+def test_product_latest_backfilled_from_observations(legacy_engine):
+    with legacy_engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO products (name, article, price, quantity) VALUES ('P1', 'A1', '1300', '4')"
+        ))
+    run_migrations(legacy_engine)
+    with legacy_engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT article, observation_id, name, price, quantity FROM product_latest ORDER BY article"
+        )).all()
+    assert [tuple(r) for r in rows] == [
+        ("A1", 4, "P1", 1300, 4), ("A2", 2, "P2", None, None), ("A3", 3, "P3", 99, None),
+    ]
+
+
+def test_seq_column_added_to_existing_observations(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'seq.db'}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX ix_observations_seq_id"))
+        conn.execute(text("ALTER TABLE observations DROP COLUMN seq"))
+        conn.execute(text("INSERT INTO products (id, marketplace, article, name) VALUES (1, '', 'A1', 'P1')"))
+        conn.execute(text("INSERT INTO observations (product_id, price) VALUES (1, 10)"))
+    from backend.migrations import _observations_seq
+    _observations_seq(engine)
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT seq FROM observations")).scalar() == 0
+    assert "ix_observations_seq_id" in {ix["name"] for ix in inspect(engine).get_indexes("observations")}
+    engine.dispose()
@@ -0,0 +1,60 @@
+import unittest
+
+import numpy as np
+
+from backend.normalize import (
+    parse_price, parse_discount, parse_quantity,
+    parse_prices, parse_discounts, parse_quantities,
+)
+
+
+class TestNormalize(unittest.TestCase):
+    def test_price_formats(self):
+        cases = {
+            "1 234 ₽": 1234.0,
+            "1 234,50 ₽": 1234.5,
+            "1 234 567 руб.": 1234567.0,
+            "1,234.50$": 1234.5,
+            "1.234,50 €": 1234.5,
+            "99.90": 99.9,
+            "от 450 ₽": 450.0,
+            120: 120.0,
+        }
+        for raw, expected in cases.items():
+            self.assertEqual(parse_price(raw), expected, raw)
+
+    def test_price_invalid(self):
+        for raw in (None, "", "нет в наличии", "nan", True, float("inf")):
+            self.assertIsNone(parse_price(raw), raw)
+
+    def test_discount_and_quantity(self):
+        self.assertEqual(parse_discount("-18%"), 18.0)
+        self.assertEqual(parse_discount("18 %"), 18.0)
+        self.assertIsNone(parse_discount(""))
+        self.assertEqual(parse_quantity("осталось 1 200 шт"), 1200)
+        self.assertEqual(parse_quantity(7.0), 7)
+        self.assertIsNone(parse_quantity(""))
+
+    def test_batch_strings(self):
+        values, mask = parse_prices(["1 234 ₽", "", None, "1 234 ₽", "99,5"])
+        self.assertEqual(mask.tolist(), [True, False, False, True, True])
+        self.assertEqual(values[mask].tolist(), [1234.0, 1234.0, 99.5])
+        self.assertTrue(np.isnan(values[1]))
+
+        qty, qmask = parse_quantities(["12 шт", "", 3])
+        self.assertEqual(qty.dtype, np.int64)
+        self.assertEqual(qty.tolist(), [12, 0, 3])
+        self.assertEqual(qmask.tolist(), [True, False, True])
+
+    def test_batch_numeric_arrays(self):
+        disc, mask = parse_discounts(np.array([-18.0, np.nan, 5.0]))
+        self.assertEqual(mask.tolist(), [True, False, True])
+        self.assertEqual(disc[mask].tolist(), [18.0, 5.0])
+
+        qty, qmask = parse_quantities(np.array([1.9, np.inf]))
+        self.assertEqual(qty.tolist(), [1, 0])
+        self.assertEqual(qmask.tolist(), [True, False])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+import unittest
+from datetime import date, datetime
+
+from sqlalchemy import create_engine
+
+from backend.partitions import (
+    add_months, month_start, partition_name, partition_month,
+    is_partitioned, ensure_future_partitions, drop_old_partitions,
+)
+
+
+class TestPartitions(unittest.TestCase):
+    def test_month_arithmetic(self):
+        self.assertEqual(month_start(datetime(2025, 5, 23, 9, 45)), date(2025, 5, 1))
+        self.assertEqual(add_months(date(2025, 11, 1), 3), date(2026, 2, 1))
+        self.assertEqual(add_months(date(2025, 1, 1), -1), date(2024, 12, 1))
+
+    def test_partition_names_roundtrip(self):
+        name = partition_name(date(2025, 5, 1))
+        self.assertEqual(name, "observations_p202505")
+        self.assertEqual(partition_month(name), date(2025, 5, 1))
+        self.assertIsNone(partition_month("observations_default"))
+        self.assertIsNone(partition_month("observations_legacy"))
+
+    def test_noop_on_sqlite(self):
+        engine = create_engine("sqlite:///:memory:")
+        self.assertFalse(is_partitioned(engine))
+        self.assertEqual(ensure_future_partitions(engine), [])
+        self.assertEqual(drop_old_partitions(engine, datetime.utcnow()), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
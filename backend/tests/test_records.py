@@ -0,0 +1,43 @@
+import unittest
+from datetime import datetime
+from backend.records import ProductRecord
+
+
+class TestProductRecord(unittest.TestCase):
+    def test_from_scraped_parses_numbers_once(self):
+        rec = ProductRecord.from_scraped({
+            "name": "Хлебцы", "article": 123, "price": "1 234 ₽", "quantity": "",
+            "price_old": 1500, "discount": "-18%", "promo_labels": ["Хит", " "],
+            "parsed_at": "2025-05-23T09:45:21",
+        }, marketplace="Wildberries", category="хлебцы")
+        self.assertEqual(rec.article, "123")
+        self.assertEqual(rec.price, 1234.0)
+        self.assertIsNone(rec.quantity)
+        self.assertEqual(rec.price_old, 1500.0)
+        self.assertEqual(rec.discount, 18.0)
+        self.assertEqual(rec.promo_labels, ("Хит",))
+        self.assertTrue(rec.promotion_detected)
+        self.assertEqual(rec.parsed_at, datetime(2025, 5, 23, 9, 45, 21))
+        self.assertEqual(rec.marketplace, "Wildberries")
+
+    def test_csv_row_and_db_row(self):
+        rec = ProductRecord.from_scraped({
+            "name": "N", "article": "A", "price": "99.50", "quantity": "7",
+            "promotion_detected": "false", "detected_keywords": "a;b", "promo_labels": "",
+        })
+        self.assertFalse(rec.promotion_detected)
+        self.assertEqual(rec.detected_keywords, ("a", "b"))
+        row = rec.to_observation_row(product_id=5)
+        self.assertEqual(row["product_id"], 5)
+        self.assertEqual(row["price"], 99.5)
+        self.assertEqual(row["quantity"], 7)
+        self.assertEqual(row["detected_keywords"], "a;b")
+        self.assertEqual(rec.to_product_row()["marketplace"], "")
+        self.assertEqual(rec.key, ("", "A"))
+
+    def test_record_has_no_instance_dict(self):
+        self.assertFalse(hasattr(ProductRecord(), "__dict__"))
+
+
+if __name__ == "__main__":
+    unittest.main()
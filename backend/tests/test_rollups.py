@@ -0,0 +1,80 @@
+import pytest
+from sqlalchemy import text
+from backend.database import init_db, add_products, engine
+from backend.models import Base
+from backend.rollups import update_rollups, get_rollups
+
+
+@pytest.fixture(autouse=True)
+def prepare_db():
+    init_db()
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+def obs(article, price, quantity, day, promo=False, category="хлебцы"):
+    return {"name": article, "article": article, "price": price, "quantity": quantity,
+            "marketplace": "Ozon", "category": category, "promotion_detected": promo,
+            "parsed_at": f"2025-05-{day:02d}T10:00:00"}
+
+
+def test_daily_and_weekly_article_rollups():
+    add_products([obs("A1", "10", "5", 5), obs("A1", "14", "3", 5, promo=True), obs("A1", "12", "4", 6)])
+    assert update_rollups()["products"] == 1
+
+    days = get_rollups("article", "A1")
+    assert [d["bucket"] for d in days] == ["2025-05-05", "2025-05-06"]
+    assert days[0] == {
+        "bucket": "2025-05-05", "observations": 2, "min_price": 10, "max_price": 14,
+        "avg_price": 12, "last_price": 14, "promo_share": 0.5, "min_quantity": 3, "max_quantity": 5,
+    }
+    [week] = get_rollups("article", "A1", period="week")
+    assert (week["bucket"], week["observations"], week["last_price"]) == ("2025-05-05", 3, 12)
+
+
+def test_category_rollup_combines_articles():
+    add_products([obs("A1", "10", "5", 5), obs("A2", "20", "1", 5), obs("A3", "99", "1", 5, category="чай")])
+    update_rollups()
+    [day] = get_rollups("category", "хлебцы")
+    assert (day["observations"], day["min_price"], day["max_price"], day["avg_price"]) == (2, 10, 20, 15)
+
+
+def test_incremental_update_touches_only_new_buckets():
+    add_products([obs("A1", "10", "5", 5)])
+    update_rollups()
+    assert update_rollups() == {"products": 0, "buckets": 0}
+
+    add_products([obs("A1", "11", "5", 7)])
+    result = update_rollups()
+    assert result["products"] == 1
+    assert [d["bucket"] for d in get_rollups("article", "A1")] == ["2025-05-05", "2025-05-07"]
+
+
+def test_extended_observation_counts_every_day():
+    add_products([obs("A1", "10", "5", 5)], dedupe=True)
+    update_rollups()
+    add_products([obs("A1", "10", "5", 8)], dedupe=True)
+    assert update_rollups()["products"] == 1
+    days = get_rollups("article", "A1")
+    assert [d["bucket"] for d in days] == ["2025-05-05", "2025-05-06", "2025-05-07", "2025-05-08"]
+    assert all(d["observations"] == 1 and d["last_price"] == 10 for d in days)
+
+
+def test_unknown_scope_rejected():
+    with pytest.raises(ValueError):
+        get_rollups("brand", "x")
+
+
+def test_late_commit_with_lower_id_is_not_skipped():
+    add_products([obs("A1", "10", "5", 5)])
+    add_products([obs("A2", "20", "5", 5)])
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM observations WHERE id = 1"))
+    update_rollups()
+
+    # строка с меньшим id, закоммиченная после прошлого запуска
+    add_products([obs("A3", "30", "5", 6)])
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE observations SET id = 1 WHERE id = (SELECT max(id) FROM observations)"))
+    assert update_rollups()["products"] == 1
+    assert [d["bucket"] for d in get_rollups("article", "A3")] == ["2025-05-06"]
@@ -1,5 +1,5 @@
 import pytest
-from backend.scraper import scrape_marketplace
+from backend.scraper import scrape_marketplace, refresh_marketplace
 
 def make_driver(html):
     class D:
@@ -35,4 +35,42 @@ def test_scrape_missing_tags_produces_defaults(monkeypatch):
     assert p["article"] == "Нет артикула"
     assert p["price"] == "0"
     assert p["quantity"] == "0"
-    assert p["image_url"] == ""
\ No newline at end of file
+    assert p["image_url"] == ""
+
+def test_refresh_marketplace_fetches_only_changed(monkeypatch):
+    """Листинговое обновление открывает страницу товара только для изменившихся артикулов."""
+    listing = [
+        {"article": "1", "price": 100.0, "price_old": 120.0, "discount": "17%",
+         "quantity": "", "promo_labels": [], "url": "https://www.wildberries.ru/catalog/1/detail.aspx",
+         "marketplace": "Wildberries", "category": "хлебцы"},
+        {"article": "2", "price": 50.0, "price_old": None, "discount": None,
+         "quantity": "", "promo_labels": [], "url": "https://www.wildberries.ru/catalog/2/detail.aspx",
+         "marketplace": "Wildberries", "category": "хлебцы"},
+    ]
+    fetched = []
+
+    class FakeScraper:
+        def _scrape_wb_category_by_url(self, url, limit, marketplace, categories):
+            return [dict(p) for p in listing]
+        def _scrape_wb_article(self, url, marketplace, categories):
+            fetched.append(url)
+            return {"quantity": "42", "price": 45.0}
+        def close(self):
+            pass
+
+    monkeypatch.setattr("backend.scraper.MarketplaceScraper", FakeScraper)
+    stored = {
+        "1": {"price": "100.0", "price_old": "120.0", "discount": "17%", "quantity": "7", "promo_labels": ""},
+        "2": {"price": "55.0", "price_old": "", "discount": "", "quantity": "3", "promo_labels": ""},
+    }
+    prods = refresh_marketplace(
+        "https://www.wildberries.ru/catalog/0/search.aspx?search=x",
+        lookup=lambda arts: {a: stored[a] for a in arts if a in stored},
+        limit=10,
+        marketplace="Wildberries",
+    )
+    assert fetched == ["https://www.wildberries.ru/catalog/2/detail.aspx"]
+    by_article = {p["article"]: p for p in prods}
+    assert by_article["1"]["quantity"] == "7"
+    assert by_article["2"]["quantity"] == "42"
+    assert by_article["2"]["price"] == 45.0
@@ -0,0 +1,99 @@
+import os
+import pytest
+from datetime import datetime, timedelta
+from backend.database import init_db, engine
+from backend.models import Base, PageSnapshot
+from backend.parsers import parse_wb_category_html, parse_ozon_composer
+from backend.snapshots import SnapshotStore, reparse_snapshots
+
+OZON_PAYLOAD = {"widgetStates": {"searchResultsV2": {"data": {"items": [
+    {"entity": {"id": 111, "title": "Хлебцы", "link": "/product/111/",
+                "price": {"value": 99.0, "oldValue": 120.0, "discount": 18},
+                "badges": [{"text": "Распродажа"}]}},
+]}}}}
+
+WB_HTML = """
+<div class="product-card__wrapper">
+  <a class="product-card__link" href="https://www.wildberries.ru/catalog/222/detail.aspx"></a>
+  <img src="https://img/222.jpg">
+  <span class="product-card__brand">Бренд</span>
+  <span class="product-card__name">Хлебцы гречневые</span>
+  <ins class="price__lower-price">1&nbsp;234 ₽</ins>
+  <del>1&nbsp;500 ₽</del>
+  <span class="percentage-sale">-18%</span>
+  <div class="product-card__tips--bottom"><span class="product-card__tip">Хит</span></div>
+</div>
+"""
+
+
+@pytest.fixture(autouse=True)
+def prepare_db():
+    init_db()
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SnapshotStore(str(tmp_path / "snaps"), retention_days=30)
+
+
+def test_put_is_content_addressed(store):
+    """Одинаковое содержимое хранится одним файлом, запись в индексе — на каждый ответ."""
+    d1 = store.put("ozon_composer", "https://www.ozon.ru/category/a/", OZON_PAYLOAD, category="хлебцы")
+    d2 = store.put("ozon_composer", "https://www.ozon.ru/category/a/", OZON_PAYLOAD, category="хлебцы")
+    assert d1 == d2
+    assert store.load(d1, "ozon_composer") == OZON_PAYLOAD
+    blobs = [f for _, _, files in os.walk(store.path) for f in files]
+    assert blobs == [f"{d1}.gz"]
+
+
+def test_prune_removes_old_snapshots_and_orphan_blobs(store):
+    old = store.put("wb_category_html", "https://www.wildberries.ru/catalog/0/search.aspx?search=x", "<old/>",
+                    captured_at=datetime.utcnow() - timedelta(days=40))
+    store.put("wb_category_html", "https://www.wildberries.ru/catalog/0/search.aspx?search=x", "<new/>")
+    assert store.prune() == {"rows": 1, "blobs": 1}
+    assert not os.path.exists(store._blob_path(old))
+
+
+def test_prune_keeps_blob_reused_by_concurrent_put(store, monkeypatch):
+    """put того же содержимого во время prune не оставляет запись без файла."""
+    url = "https://www.wildberries.ru/catalog/0/search.aspx?search=x"
+    digest = store.put("wb_category_html", url, "<page/>", captured_at=datetime.utcnow() - timedelta(days=40))
+    rename = os.rename
+
+    def racing_rename(src, dst):
+        # снимок с тем же содержимым сохраняется между проверкой и удалением файла
+        store.put("wb_category_html", url, "<page/>")
+        rename(src, dst)
+
+    monkeypatch.setattr("backend.snapshots.os.rename", racing_rename)
+    assert store.prune() == {"rows": 1, "blobs": 0}
+    assert store.load(digest) == "<page/>"
+
+
+def test_parse_ozon_composer_without_id():
+    payload = {"widgetStates": {"searchResultsV2": {"data": {"items": [{"entity": {"title": "Без id"}}]}}}}
+    assert parse_ozon_composer(payload, 10, [])[0]["article"] is None
+
+
+def test_parse_wb_category_html():
+    prods = parse_wb_category_html(WB_HTML, 10, ["хлебцы"])
+    assert len(prods) == 1
+    p = prods[0]
+    assert p["article"] == "222"
+    assert p["name"] == "Бренд Хлебцы гречневые"
+    assert p["price"] == 1234.0 and p["price_old"] == 1500.0
+    assert p["discount"] == "-18%"
+    assert p["promo_labels"] == ["Хит"]
+    assert p["image_url"] == "https://img/222.jpg"
+
+
+def test_reparse_snapshots(store):
+    store.put("ozon_composer", "https://www.ozon.ru/category/a/", OZON_PAYLOAD, category="хлебцы")
+    store.put("wb_category_html", "https://www.wildberries.ru/catalog/0/search.aspx?search=x", WB_HTML)
+    store.put("product_html", "https://www.ozon.ru/product/111/", "<html/>")
+    collected = []
+    stats = reparse_snapshots(store, workers=2, on_products=collected.extend)
+    assert stats == {"snapshots": 2, "products": 2, "failed": 0}
+    assert {p["article"] for p in collected} == {"111", "222"}
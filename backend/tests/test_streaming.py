@@ -0,0 +1,41 @@
+import csv
+import io
+import json
+
+import pytest
+from backend.database import init_db, add_products, iter_products, engine
+from backend.models import Base
+from backend.streaming import json_array, ndjson, csv_lines, CSV_FIELDS
+
+
+@pytest.fixture(autouse=True)
+def prepare_db():
+    init_db()
+    add_products({"name": f"P{i}", "article": f"A{i}", "price": f"{i}.5", "quantity": "1"} for i in range(5))
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_iter_products_reads_in_batches():
+    assert [p.article for p in iter_products(batch_size=2)] == [f"A{i}" for i in range(5)]
+    assert [p.article for p in iter_products(batch_size=2, price_min=3)] == ["A3", "A4"]
+
+
+def test_json_array_is_valid_json_in_chunks():
+    chunks = list(json_array(iter_products(), json.dumps, chunk_rows=2))
+    assert len(chunks) == 5  # "[", 3 фрагмента, "]"
+    assert [p["article"] for p in json.loads("".join(chunks))] == [f"A{i}" for i in range(5)]
+    assert json.loads("".join(json_array(iter(()), json.dumps))) == []
+
+
+def test_ndjson_one_record_per_line():
+    lines = "".join(ndjson(iter_products(), json.dumps, chunk_rows=2)).splitlines()
+    assert [json.loads(line)["price"] for line in lines] == [0.5, 1.5, 2.5, 3.5, 4.5]
+
+
+def test_csv_lines_header_and_rows():
+    text = "".join(csv_lines(iter_products(), chunk_rows=2))
+    assert text.startswith("\ufeff")
+    rows = list(csv.DictReader(io.StringIO(text.lstrip("\ufeff"))))
+    assert list(rows[0]) == CSV_FIELDS
+    assert [r["price"] for r in rows] == ["0.5", "1.5", "2.5", "3.5", "4.5"]
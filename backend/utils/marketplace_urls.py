@@ -1,5 +1,6 @@
 # backend/utils/marketplace_urls.py
 
+import re
 import urllib.parse
 
 def build_search_url(marketplace: str, query: str) -> str:
@@ -40,3 +41,39 @@ def build_product_url(marketplace: str, article: str) -> str:
         return f"https://www.wildberries.ru/catalog/{a}/detail.aspx"
     else:
         raise ValueError(f"Неподдерживаемый marketplace: {marketplace}")
+
+# Параметры запроса, которые влияют на содержимое листинга; остальные (трекинг,
+# предсказание категории и т.п.) отбрасываются при канонизации
+_SIGNIFICANT_PARAMS = ("text", "search", "page")
+
+def canonicalize_url(url: str) -> str:
+    """
+    Приводит URL категории к каноническому виду для дедупликации:
+    https, хост без www, путь со слешем на конце, только значимые параметры
+    в фиксированном порядке, без фрагмента.
+    """
+    parts = urllib.parse.urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    path = parts.path or "/"
+    if not path.endswith("/") and not path.endswith(".aspx"):
+        path += "/"
+    params = urllib.parse.parse_qs(parts.query)
+    query = urllib.parse.urlencode(
+        [(k, params[k][0]) for k in _SIGNIFICANT_PARAMS if params.get(k)]
+    )
+    return urllib.parse.urlunsplit(("https", host, path, query, ""))
+
+def is_category_url(url: str) -> bool:
+    """
+    True для страниц-листингов: категории Ozon и каталоги/поиск Wildberries
+    (но не карточки товаров /catalog/<артикул>/detail.aspx).
+    """
+    parts = urllib.parse.urlsplit(url)
+    host = parts.netloc.lower()
+    if host.endswith("ozon.ru"):
+        return parts.path.startswith("/category/")
+    if host.endswith("wildberries.ru"):
+        return parts.path.startswith("/catalog/") and not re.match(r"^/catalog/\d+/", parts.path)
+    return False
@@ -62,7 +62,7 @@ const ProductCard = ({ product, filterCategory, filterMarketplace }) => {
         </p>
       )}
       {discount && (
-        <p className="text-sm text-green-600">Скидка: {discount}</p>
+        <p className="text-sm text-green-600">Скидка: {discount}%</p>
       )}
       {promo_labels && promo_labels.length > 0 && (
         <p className="text-xs text-gray-800">Промо: {promo_labels.join(', ')}</p>
@@ -84,9 +84,9 @@ ProductCard.propTypes = {
     image_url: PropTypes.string,
     category: PropTypes.string,
     marketplace: PropTypes.string,
-    price_old: PropTypes.string,
-    price_new: PropTypes.string,
-    discount: PropTypes.string,
+    price_old: PropTypes.number,
+    price_new: PropTypes.number,
+    discount: PropTypes.number,
     promo_labels: PropTypes.arrayOf(PropTypes.string),
     parsed_at: PropTypes.string
   }).isRequired,
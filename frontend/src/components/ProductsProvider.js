@@ -1,4 +1,4 @@
-import React, { createContext, useState, useEffect } from 'react';
+import React, { createContext, useState, useEffect, useRef } from 'react';
 import PropTypes from 'prop-types';
 import API from '../services/api';
 
@@ -10,12 +10,32 @@ function ProductsProvider({ children }) {
   const [error, setError]             = useState(null);
   const [lastRunTime, setLastRunTime] = useState(null);
 
+  // Локальная копия списка (id → запись) и курсор ленты изменений:
+  // первая загрузка получает весь список, обновления — только изменившиеся записи
+  const byId = useRef(new Map());
+  const cursor = useRef(null);
+
+  // Удалённые очисткой старых данных записи в ленту не попадают: сервер отдаёт
+  // границу deleted_before, и записи, у которых timestamp и last_seen_at раньше
+  // неё, убираются из локальной копии
+  const pruneDeleted = (deletedBefore) => {
+    if (!deletedBefore) return;
+    const horizon = Date.parse(deletedBefore);
+    byId.current.forEach((item, id) => {
+      const seen = [item.timestamp, item.last_seen_at].filter(Boolean).map(Date.parse);
+      if (seen.length && Math.max(...seen) < horizon) byId.current.delete(id);
+    });
+  };
+
   // Функция получения списка продуктов
   const fetchProducts = async () => {
     setLoading(true);
     try {
-      const data = await API.getProductList();
-      setProducts(Array.isArray(data) ? data : []);
+      const { items, cursor: next, deletedBefore } = await API.getProductChanges(cursor.current);
+      items.forEach(item => byId.current.set(item.id, item));
+      pruneDeleted(deletedBefore);
+      cursor.current = next;
+      setProducts(Array.from(byId.current.values()).sort((a, b) => a.id - b.id));
       setError(null);
     } catch (err) {
       setError(err);
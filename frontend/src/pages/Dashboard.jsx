@@ -31,6 +31,9 @@ const getQtyColor = qty => {
   return `rgb(${v},${v},${v})`;
 };
 
+// Окно сравнений: изменения товаров за последние дни
+const DASHBOARD_WINDOW_DAYS = 30;
+
 function Dashboard() {
   const navigate = useNavigate();
   const [loading, setLoading]       = useState(true);
@@ -45,67 +48,73 @@ function Dashboard() {
   useEffect(() => {
     async function fetchDashboard() {
       try {
-        const prods = await API.getProductList();
+        // Метрики считаются на сервере (GET /dashboard); для сравнений нужны только
+        // товары, у которых за окно DASHBOARD_WINDOW_DAYS было новое наблюдение —
+        // их последние записи (view=latest), а не вся история наблюдений
+        const since = new Date(Date.now() - DASHBOARD_WINDOW_DAYS * 86400000)
+          .toISOString().slice(0, 10);
+        const [summary, latestRows] = await Promise.all([
+          API.getDashboard(),
+          API.getProductList({ view: 'latest', date_from: since }),
+        ]);
 
-        // Метрики
         setMetrics({
-          totalRecords: prods.length,
-          uniqueCategories: new Set(prods.map(p => p.category)).size,
-          uniqueMarketplaces: new Set(prods.map(p => p.marketplace)).size
+          totalRecords: summary.products_count,
+          uniqueCategories: summary.categories_count,
+          uniqueMarketplaces: summary.marketplaces_count
         });
 
-        // Собираем сравнения по артикулу
-        const sorted = [...prods].sort(
+        // Одна запись на товар (marketplace, article), новые первыми
+        const latest = [...latestRows].sort(
           (a, b) => new Date(b.timestamp) - new Date(a.timestamp)
         );
-        const seen = new Set();
-        const compArr = [];
-        
 
-        for (const rec of sorted) {
-          if (seen.has(rec.article)) continue;
-          seen.add(rec.article);
+        // История сравниваемых артикулов — пачками POST /products/history; без from:
+        // предыдущее наблюдение может быть старше окна
+        const history = await API.getProductsHistory(
+          latest.map(rec => rec.article), { max_points: 0 }
+        );
+        const compArr = [];
 
-          const hist = prods
-            .filter(p => p.article === rec.article)
+        for (const rec of latest) {
+          const hist = (history[rec.article] || [])
+            .filter(p => (p.marketplace || null) === (rec.marketplace || null))
             .sort((a, b) => new Date(b.parsed_at).getTime() - new Date(a.parsed_at).getTime());
-
-          if (hist.length >= 2) {
-            const [newRec, oldRec] = hist;
-            const oldPrice = parseFloat(oldRec.price) || 0;
-            const newPrice = parseFloat(newRec.price) || 0;
-            const priceDiff = Math.round((newPrice - oldPrice) * 100) / 100;
-
-            const oldQty = oldRec.quantity !== '' ? parseInt(oldRec.quantity, 10) : null;
-            const newQty = newRec.quantity !== '' ? parseInt(newRec.quantity, 10) : null;
-            const qtyDiff = (oldQty != null && newQty != null) ? newQty - oldQty : null;
-
-            const oldDisc = parseFloat(oldRec.discount) || 0;
-            const newDisc = parseFloat(newRec.discount) || 0;
-            const discountDiff = Math.round((newDisc - oldDisc) * 100) / 100;
-            
-            console.log(
-              "[DBG image]", 
-              rec.article,
-              "old→", oldRec.image_url,
-              "new→", newRec.image_url,
-              "changed?", oldRec.image_url !== newRec.image_url
-            );
-
-            compArr.push({
-              id: rec.id,
-              article: rec.article,
-              name:    newRec.name || rec.article,
-              oldPrice, newPrice, priceDiff,
-              oldQty, newQty, qtyDiff,
-              oldDisc, newDisc, discountDiff,
-              oldImage: oldRec.image_url,
-              newImage: newRec.image_url,
-              imageChanged: oldRec.image_url !== newRec.image_url,
-              dateOld: oldRec.parsed_at,
-              dateNew: newRec.parsed_at
-            });
-          }
+          if (hist.length < 2) continue;
+
+          // точка продления (last_seen_at) повторяет значения начала отрезка:
+          // сравниваем с ближайшей более ранней точкой с другими значениями
+          const [newRec] = hist;
+          const differs = p => p.price !== newRec.price || p.quantity !== newRec.quantity
+            || p.discount !== newRec.discount || p.image_url !== newRec.image_url;
+          const oldRec = hist.slice(1).find(differs) || hist[1];
+
+          const oldPrice = parseFloat(oldRec.price) || 0;
+          const newPrice = parseFloat(newRec.price) || 0;
+          const priceDiff = Math.round((newPrice - oldPrice) * 100) / 100;
+
+          // остаток — число или null (нет данных), не строка
+          const oldQty = oldRec.quantity != null ? Number(oldRec.quantity) : null;
+          const newQty = newRec.quantity != null ? Number(newRec.quantity) : null;
+          const qtyDiff = (oldQty != null && newQty != null) ? newQty - oldQty : null;
+
+          const oldDisc = parseFloat(oldRec.discount) || 0;
+          const newDisc = parseFloat(newRec.discount) || 0;
+          const discountDiff = Math.round((newDisc - oldDisc) * 100) / 100;
+
+          compArr.push({
+            id: rec.id,
+            article: rec.article,
+            name:    rec.name || rec.article,
+            oldPrice, newPrice, priceDiff,
+            oldQty, newQty, qtyDiff,
+            oldDisc, newDisc, discountDiff,
+            oldImage: oldRec.image_url,
+            newImage: newRec.image_url,
+            imageChanged: oldRec.image_url !== newRec.image_url,
+            dateOld: oldRec.parsed_at,
+            dateNew: newRec.parsed_at
+          });
         }
 
         // Оставляем только ненулевые изменения
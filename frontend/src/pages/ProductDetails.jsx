@@ -25,7 +25,8 @@ const ProductDetails = () => {
   useEffect(() => {
     if (!product) return;
 
-    API.getProductHistory(product.article)
+    // история того же маркетплейса, что и карточка
+    API.getProductHistory(product.article, product.marketplace ? { marketplace: product.marketplace } : {})
       .then(raw => {
         // raw — массив { parsed_at, price, price_old, price_new, discount, quantity }
           const parsed = raw
@@ -34,12 +35,12 @@ const ProductDetails = () => {
             // Берём ISO-строку, обрезаем лишние микросекунды, парсим в ms
             const cleaned = item.parsed_at.replace(/\.(\d{3})\d+/, '.$1');
             const ts = new Date(cleaned).getTime();
-            const discountNum = parseFloat(
-              item.discount
-                ?.replace('−', '') 
-                ?.replace('%', '')   // убираем %
-                || 0
-            ) || 0;
+            // discount приходит числом (18), в старых выгрузках — строкой "-18%"
+            const discountNum = Math.abs(parseFloat(
+              String(item.discount ?? 0)
+                .replace('−', '-')
+                .replace('%', '')   // убираем %
+            )) || 0;
             console.log('→ discountNum:', discountNum);
 
 
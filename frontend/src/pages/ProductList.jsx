@@ -243,7 +243,7 @@ export default function ProductList() {
                         <td className="px-4 py-2">{item.name}</td>
                         <td className="px-4 py-2 text-right">{item.price}</td>
                         <td className="px-4 py-2 text-right">
-                          {item.discount || '—'}
+                          {item.discount != null ? `${item.discount}%` : '—'}
                         </td>
                         <td className="px-4 py-2">
                           {new Date(item.parsed_at).toLocaleString()}
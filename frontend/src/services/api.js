@@ -8,6 +8,31 @@ const API_PORT = process.env.REACT_APP_API_PORT || '5001';
 
 axios.defaults.baseURL = `${protocol}//${host}:${API_PORT}`;
 
+// Размер страницы /products (сервер ограничивает его значением [API] max_page_size)
+const PRODUCTS_PAGE_SIZE = 500;
+// Сколько артикулов в одном POST /products/history ([API] history_max_articles)
+const HISTORY_BATCH_SIZE = 100;
+
+// Поля времени в ответах format=columns (секунды эпохи)
+const TIME_FIELDS = ['parsed_at', 'timestamp', 'last_seen_at'];
+
+// Ответ format=columns → список объектов; времена снова ISO-строки
+export const fromColumns = ({ length, columns, dictionaries = {} }) => {
+  const fields = Object.keys(columns);
+  const rows = [];
+  for (let i = 0; i < length; i += 1) {
+    const row = {};
+    fields.forEach(field => {
+      let value = columns[field][i];
+      if (value !== null && dictionaries[field]) value = dictionaries[field][value];
+      if (value !== null && TIME_FIELDS.includes(field)) value = new Date(value * 1000).toISOString();
+      row[field] = value;
+    });
+    rows.push(row);
+  }
+  return rows;
+};
+
 const API = {
   // Запуск процесса парсинга с JSON-конфигом
   startProcess: async (settings) => {
@@ -26,27 +51,79 @@ const API = {
   },
 
 
-  // Получить список продуктов
-  getProductList: async () => {
-    console.log('➡️ GET', axios.defaults.baseURL + '/products');
-    const res = await axios.get('/products');
-    console.log('⬅️', res.status, res.data);
+  // Одна страница списка продуктов: { items, next_cursor }
+  // params: limit, cursor, view ('history' | 'latest') и фильтры marketplace, category,
+  // article, promo, price_min, price_max, date_from, date_to
+  getProductPage: async (params = {}) => {
+    console.log('➡️ GET', axios.defaults.baseURL + '/products', params);
+    const res = await axios.get('/products', { params: { limit: PRODUCTS_PAGE_SIZE, ...params } });
+    console.log('⬅️', res.status, res.data.items.length, 'next:', res.data.next_cursor);
     return res.data;
   },
 
-  getProductHistory: async (article) => {
+  // Получить список продуктов: страницы запрашиваются по курсору, пока он не кончится
+  // params.view = 'latest' — только последнее состояние каждого товара
+  getProductList: async (params = {}) => {
+    const items = [];
+    let cursor = null;
+    do {
+      const page = await API.getProductPage(cursor ? { ...params, cursor } : params);
+      items.push(...page.items);
+      cursor = page.next_cursor;
+    } while (cursor);
+    return items;
+  },
+
+  // Изменения списка продуктов после курсора since (null — весь список):
+  // страницы запрашиваются, пока has_more; возвращает { items, cursor }
+  getProductChanges: async (since = null) => {
+    const items = [];
+    let cursor = since;
+    let hasMore = true;
+    let deletedBefore = null;
+    while (hasMore) {
+      const res = await axios.get('/products/changes', { params: cursor ? { since: cursor } : {} });
+      items.push(...res.data.items);
+      cursor = res.data.next_cursor;
+      hasMore = res.data.has_more;
+      deletedBefore = res.data.deleted_before;
+    }
+    return { items, cursor, deletedBefore };
+  },
+
+  // params: { from, to, max_points, method } — диапазон дат и прореживание
+  getProductHistory: async (article, params = {}) => {
     const url = `/products/history/${encodeURIComponent(article)}`;
     console.log('➡️ GET', axios.defaults.baseURL + url);
     try {
-      const res = await axios.get(url);
+      const res = await axios.get(url, { params: { format: 'columns', ...params } });
       console.log('⬅️', res.status, res.data);
-      return res.data;
+      return res.data.format === 'columns' ? fromColumns(res.data) : res.data;
     } catch (err) {
       console.error('❌ HISTORY ERROR', err.response?.status, err.response?.data);
       throw err;
     }
   },
 
+  // История нескольких артикулов: { article: [точки] }. Артикулы уходят
+  // пачками по HISTORY_BATCH_SIZE ([API] history_max_articles на сервере)
+  // params: { from, to, max_points, method, marketplace }
+  getProductsHistory: async (articles, params = {}) => {
+    const unique = [...new Set(articles)];
+    const batches = [];
+    for (let i = 0; i < unique.length; i += HISTORY_BATCH_SIZE) {
+      batches.push(unique.slice(i, i + HISTORY_BATCH_SIZE));
+    }
+    const responses = await Promise.all(batches.map(batch =>
+      axios.post('/products/history', { articles: batch, format: 'columns', ...params })
+    ));
+    return Object.fromEntries(responses.flatMap(res =>
+      Object.entries(res.data).map(([article, series]) => [
+        article, series.format === 'columns' ? fromColumns(series) : series,
+      ])
+    ));
+  },
+
   // Список доступных отчётов
   getReports: async () => {
     const res = await axios.get('/reports');